@@ -0,0 +1,149 @@
+"""Times every export stage on synthetic scenes and compares the results with a stored baseline.
+
+    python benchmarks/run.py --blocks 200 --entities 10 --frames 250
+    python benchmarks/run.py --set playback_engine=CLOCK --set detect_rigid_groups=true
+    python benchmarks/run.py --save-baseline benchmarks/baseline.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dataclasses import fields
+
+from mca_blender_addon import generator, output
+from mca_blender_addon.scene import ExportSettings
+from synthetic import MOTIONS, build_scene, sample_scene
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE = os.path.join(ROOT, "example_projects", "datapack_files", "MC Animaker")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+TIMED_METRICS = ('sampling_s',) + tuple(f"{stage}_s" for stage in generator.COMPILE_STAGES) + ('writing_s', 'total_s', 'peak_memory_mb')
+MIN_TIMED_REPEAT = 3
+
+def function_stats(files):
+    """File count, bytes and commands per keyframe file for {relative path: content}."""
+    stats = {'files': len(files), 'bytes': sum(len(content.encode('utf-8')) for content in files.values())}
+    keyframe_paths = [path for path in files if '/keyframes/' in path and '/commands/' not in path]
+    keyframe_files = [files[path] for path in keyframe_paths if '/groups/' not in path]
+    commands = sum(1 for path in keyframe_paths for line in files[path].splitlines() if line.strip() and not line.startswith('#'))
+    stats['keyframe_files'] = len(keyframe_files); stats['commands'] = commands
+    stats['execute_commands'] = sum(1 for path in keyframe_paths for line in files[path].splitlines() if line.startswith('execute '))
+    stats['commands_per_keyframe'] = round(commands / len(keyframe_files), 2) if keyframe_files else 0.0
+    return stats
+
+def fixture_stats(path):
+    files = {}
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            full_path = os.path.join(dirpath, name)
+            with open(full_path, 'r', encoding='utf-8') as f: files[os.path.relpath(full_path, path).replace(os.sep, '/')] = f.read()
+    return function_stats(files)
+
+def export_stages(settings, specs, locations, rotations, output_root):
+    """Samples the scene and runs the core export on it, returning {stage: seconds} and the generated files. Compile
+    stages are timed between the steps generator.compile_animation_steps yields, so they cover whatever the settings
+    turn on."""
+    timings = dict.fromkeys(TIMED_METRICS[:-2], 0.0)
+    clock = time.perf_counter()
+    cache = sample_scene(specs, locations, rotations)
+    timings['sampling_s'] = time.perf_counter() - clock
+
+    writer = output.DirectoryWriter(os.path.join(output_root, settings.folder_name))
+    steps = generator.compile_animation_steps(settings, specs, cache, writer); clock = time.perf_counter()
+    while True:
+        try: stage, _ = next(steps)
+        except StopIteration: stage = 'finishing'; steps = None
+        now = time.perf_counter(); timings[f"{stage}_s"] += now - clock; clock = now
+        if steps is None: break
+
+    files = dict(writer.files); clock = time.perf_counter()
+    writer.close()
+    timings['writing_s'] = time.perf_counter() - clock
+    timings['total_s'] = sum(timings.values())
+    return timings, files
+
+def parse_overrides(pairs):
+    """ExportSettings field values from NAME=VALUE strings, converted to each field's type."""
+    types = {field.name: type(field.default) for field in fields(ExportSettings)}; overrides = {}
+    for pair in pairs:
+        name, _, value = pair.partition('=')
+        if name not in types: raise SystemExit(f"Unknown export setting: {name}")
+        overrides[name] = value.lower() in ('1', 'true', 'yes', 'on') if types[name] is bool else types[name](value)
+    return overrides
+
+def run_scenario(blocks, entities, frames, motion, repeat, overrides=None):
+    specs, locations, rotations = build_scene(blocks, entities, frames, motion)
+    settings = ExportSettings(**dict({'folder_name': "bench", 'scene_name': f"bench_{motion}"}, **(overrides or {})))
+    best = None
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as output_root:
+            timings, files = export_stages(settings, specs, locations, rotations, output_root)
+        best = timings if best is None else {key: min(value, best[key]) for key, value in timings.items()}
+    with tempfile.TemporaryDirectory() as output_root:
+        tracemalloc.start()
+        export_stages(settings, specs, locations, rotations, output_root)
+        peak = tracemalloc.get_traced_memory()[1]; tracemalloc.stop()
+    metrics = {key: round(value, 4) for key, value in best.items()}
+    metrics['peak_memory_mb'] = round(peak / 2 ** 20, 2)
+    metrics.update(function_stats(files))
+    return metrics
+
+def compare(results, baseline, time_threshold, min_time_delta, check_timings=True):
+    """Prints per-metric changes against the baseline and returns the regressions. Timings only count when
+    check_timings is set, since single runs are mostly noise."""
+    regressions = []
+    for name, metrics in results.items():
+        if name not in baseline: print(f"{name}: not in baseline"); continue
+        for key, value in metrics.items():
+            previous = baseline[name].get(key)
+            if previous is None or previous == value: continue
+            tolerance = time_threshold if key in TIMED_METRICS else 0.0
+            change = (value - previous) / previous if previous else float('inf')
+            regressed = value > previous * (1.0 + tolerance) and (key not in TIMED_METRICS or (check_timings and value - previous > min_time_delta))
+            print(f"  {name} {key}: {previous} -> {value} ({change:+.1%}){'  REGRESSION' if regressed else ''}")
+            if regressed: regressions.append((name, key))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark MC Animaker's export pipeline on synthetic scenes.")
+    parser.add_argument('--blocks', type=int, default=100)
+    parser.add_argument('--entities', type=int, default=10)
+    parser.add_argument('--frames', type=int, default=250)
+    parser.add_argument('--motion', choices=MOTIONS + ('all',), default='all')
+    parser.add_argument('--repeat', type=int, default=5, help=f"Runs per scenario; the fastest time of each stage is kept. Timings are only checked against the baseline with {MIN_TIMED_REPEAT} or more")
+    parser.add_argument('--set', dest='overrides', action='append', default=[], metavar='NAME=VALUE', help="Export setting for every scenario, e.g. playback_engine=CLOCK; repeatable")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline JSON to compare against")
+    parser.add_argument('--save-baseline', metavar='PATH', help="Write the results as a new baseline")
+    parser.add_argument('--time-threshold', type=float, default=0.5, help="Allowed relative slowdown before a timing counts as a regression")
+    parser.add_argument('--min-time-delta', type=float, default=0.2, help="Timing changes smaller than this (seconds or MB) are never regressions; writing alone varies by about 0.15 s between runs")
+    parser.add_argument('--fixture', default=FIXTURE, help="Reference datapack folder to report statistics for")
+    args = parser.parse_args(argv)
+
+    motions = MOTIONS if args.motion == 'all' else (args.motion,); results = {}; overrides = parse_overrides(args.overrides)
+    for motion in motions:
+        name = f"{motion}-b{args.blocks}-e{args.entities}-f{args.frames}" + "".join(f"-{pair}" for pair in sorted(args.overrides))
+        results[name] = run_scenario(args.blocks, args.entities, args.frames, motion, args.repeat, overrides)
+        print(name, json.dumps(results[name]))
+    if args.fixture and os.path.isdir(args.fixture): print("fixture", json.dumps(fixture_stats(args.fixture)))
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f: json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.save_baseline}"); return 0
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f: baseline = json.load(f)
+        check_timings = args.repeat >= MIN_TIMED_REPEAT
+        if not check_timings: print(f"Timings are not checked with fewer than {MIN_TIMED_REPEAT} repeats")
+        regressions = compare(results, baseline, args.time_threshold, args.min_time_delta, check_timings)
+        print(f"{len(regressions)} regression(s) against {args.baseline}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
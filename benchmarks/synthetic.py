@@ -0,0 +1,43 @@
+import numpy as np
+
+from mca_blender_addon import sampling
+from mca_blender_addon.cache import AnimationCache
+from mca_blender_addon.scene import ObjectSpec
+
+MOTIONS = ('static', 'linear', 'noisy', 'periodic')
+
+def motion_channels(motion, frame_count, object_count, rng):
+    """Per-object location (F, 3) and euler rotation (F, 3) channels for one motion pattern."""
+    t = np.arange(frame_count, dtype=np.float64)[:, None]
+    grid = np.stack([np.arange(object_count) % 16, np.arange(object_count) // 256, (np.arange(object_count) // 16) % 16], axis=1).astype(np.float64)
+    locations = np.repeat(grid[None], frame_count, axis=0); rotations = np.zeros_like(locations)
+    if motion == 'linear':
+        locations += t[:, :, None] * rng.uniform(-0.05, 0.05, (1, object_count, 3))
+        rotations[..., 2] = t * rng.uniform(-0.02, 0.02, (1, object_count))
+    elif motion == 'noisy':
+        locations += np.cumsum(rng.normal(0.0, 0.02, (frame_count, object_count, 3)), axis=0)
+        rotations += np.cumsum(rng.normal(0.0, 0.01, (frame_count, object_count, 3)), axis=0)
+    elif motion == 'periodic':
+        phase = rng.uniform(0.0, 2.0 * np.pi, (1, object_count))
+        locations[..., 2] += np.sin(t * 0.1 + phase)
+        rotations[..., 2] = np.sin(t * 0.05 + phase) * 0.5
+    return locations, rotations
+
+def build_scene(block_count, entity_count, frame_count, motion, seed=0):
+    """ObjectSpecs plus the raw channels a sampler would read off Blender's F-curves."""
+    rng = np.random.default_rng(seed)
+    specs = [ObjectSpec(f"block_{i}", 'BLOCK', block_id="minecraft:stone") for i in range(block_count)]
+    specs += [ObjectSpec(f"entity_{i}", 'ENTITY', entity_id="minecraft:armor_stand") for i in range(entity_count)]
+    locations, rotations = motion_channels(motion, frame_count, len(specs), rng)
+    return specs, locations, rotations
+
+def sample_scene(specs, locations, rotations, start_frame=1):
+    """Fills an AnimationCache the way the operator's fast sampling path does."""
+    frame_count = locations.shape[0]
+    cache = AnimationCache([spec.name for spec in specs], start_frame, start_frame + frame_count - 1)
+    scale = np.ones((frame_count, 3))
+    for column in range(len(specs)):
+        rotation = sampling.euler_to_matrices(rotations[:, column], 'XYZ')
+        cache.transforms[:, column] = sampling.compose_matrices(locations[:, column], rotation, scale).reshape(-1, 16)
+    cache.sky_light[:] = 15
+    return cache
@@ -8,8 +8,10 @@ bl_info = {
     "category": "MC Animaker",
 }
 
-import bpy
-from bpy.props import PointerProperty, FloatProperty, StringProperty
+try:
+    import bpy
+except ImportError:  # Loaded outside Blender, e.g. to run the export core (scene, cache, generator, output) on its own.
+    bpy = None
 
 def draw_mca_progress_bar(self, context):
     wm = context.window_manager
@@ -19,27 +21,38 @@ def draw_mca_progress_bar(self, context):
         row.label(text=wm.mca_progress_text)
         row.progress(text="", factor=wm.mca_progress / 100.0, factor_text=f"{int(wm.mca_progress)}%")
 
-from .properties import MC_CustomCommand, MC_ObjectProperties, MC_SceneProperties
-from .ui import MC_UL_CustomCommands, MC_PT_Panel
-from .operators import (
-    MC_OT_AddCommand, MC_OT_RemoveCommand, MC_OT_AddBlock, MC_OT_AddEntity,
-    MC_OT_ApplyTextures, MC_OT_GenerateDatapack, MC_OT_KeyframeProperty
-)
+if bpy is not None:
+    from bpy.props import PointerProperty, FloatProperty, StringProperty
+    from bpy.app.handlers import persistent
+    from . import resource_pack
+    from .properties import MC_CustomCommand, MC_ObjectProperties, MC_SceneProperties, scene_block_ids
+    from .ui import MC_UL_CustomCommands, MC_PT_Panel
+    from .operators import (
+        MC_OT_AddCommand, MC_OT_RemoveCommand, MC_OT_AddBlock, MC_OT_AddEntity,
+        MC_OT_ApplyTextures, MC_OT_GenerateDatapack, MC_OT_KeyframeProperty
+    )
 
-classes = (
-    MC_CustomCommand,
-    MC_ObjectProperties,
-    MC_SceneProperties,
-    MC_UL_CustomCommands,
-    MC_PT_Panel,
-    MC_OT_AddCommand,
-    MC_OT_RemoveCommand,
-    MC_OT_AddBlock,
-    MC_OT_AddEntity,
-    MC_OT_ApplyTextures,
-    MC_OT_GenerateDatapack,
-    MC_OT_KeyframeProperty,
-)
+    @persistent
+    def warm_up_resource_pack(_):
+        """Pre-resolves the textures of the opened file's blocks so texturing right after loading doesn't wait on the pack."""
+        scene = bpy.context.scene
+        if scene and scene.mc_scene_props.resource_pack_path:
+            resource_pack.warm_up(bpy.path.abspath(scene.mc_scene_props.resource_pack_path), scene_block_ids(scene))
+
+    classes = (
+        MC_CustomCommand,
+        MC_ObjectProperties,
+        MC_SceneProperties,
+        MC_UL_CustomCommands,
+        MC_PT_Panel,
+        MC_OT_AddCommand,
+        MC_OT_RemoveCommand,
+        MC_OT_AddBlock,
+        MC_OT_AddEntity,
+        MC_OT_ApplyTextures,
+        MC_OT_GenerateDatapack,
+        MC_OT_KeyframeProperty,
+    )
 
 def register():
     """Registra todas as classes e propriedades do addon."""
@@ -54,9 +67,15 @@ def register():
     
     bpy.types.STATUSBAR_HT_header.append(draw_mca_progress_bar)
 
+    try: resource_pack.cache_dir = bpy.utils.extension_path_user(__package__, create=True)
+    except (AttributeError, ValueError): resource_pack.cache_dir = bpy.utils.user_resource('CONFIG', path="mc_animaker", create=True)
+    bpy.app.handlers.load_post.append(warm_up_resource_pack)
+
 def unregister():
     """Desregistra tudo na ordem inversa para uma limpeza segura."""
     bpy.types.STATUSBAR_HT_header.remove(draw_mca_progress_bar)
+    if warm_up_resource_pack in bpy.app.handlers.load_post: bpy.app.handlers.load_post.remove(warm_up_resource_pack)
+    resource_pack.release()
 
     del bpy.types.WindowManager.mca_progress
     del bpy.types.WindowManager.mca_progress_text
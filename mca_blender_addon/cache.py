@@ -0,0 +1,105 @@
+import numpy as np
+
+from . import transforms
+
+TRANSLATION_CELLS = [3, 7, 11]
+BLOCK_CORNERS = np.array([[x, y, z, 1.0] for x in (0.0, 1.0) for y in (0.0, 1.0) for z in (0.0, 1.0)])
+
+def interpolation_error(matrices, start, end):
+    """Largest distance any corner of the block strays from where the client's interpolation between the
+    transformations at start and end would show it. matrices are block_display transformations."""
+    t = (np.arange(start + 1, end) - start) / (end - start)
+    blended = transforms.interpolate_transformations(matrices[start], matrices[end], t)
+    offsets = (blended - matrices[start + 1:end])[:, :3, :] @ BLOCK_CORNERS.T
+    return np.linalg.norm(offsets, axis=1).max(axis=1)
+
+class AnimationCache:
+    """Columnar per-frame state of every exported object (frames x objects)."""
+
+    def __init__(self, object_names, start_frame, end_frame):
+        self.names = list(object_names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.start_frame = start_frame; self.end_frame = end_frame
+        frame_count = max(end_frame - start_frame + 1, 0); object_count = len(self.names)
+        self.transforms = np.zeros((frame_count, object_count, 16), dtype=np.float32)
+        self.solidify = np.zeros((frame_count, object_count), dtype=np.bool_)
+        self.block_light = np.zeros((frame_count, object_count), dtype=np.int8)
+        self.sky_light = np.zeros((frame_count, object_count), dtype=np.int8)
+
+    @property
+    def frame_count(self):
+        return self.transforms.shape[0]
+
+    def row(self, frame):
+        return frame - self.start_frame
+
+    def column(self, name):
+        return self.index[name]
+
+    def store(self, frame, column, matrix, solidify, block_light, sky_light):
+        row = self.row(frame)
+        self.transforms[row, column] = np.asarray(matrix, dtype=np.float32).reshape(16)
+        self.solidify[row, column] = solidify
+        self.block_light[row, column] = block_light
+        self.sky_light[row, column] = sky_light
+
+    def matrix(self, name, frame):
+        return self.transforms[self.row(frame), self.index[name]].reshape(4, 4)
+
+    def state(self, name, frame):
+        row = self.row(frame); column = self.index[name]
+        return (
+            self.transforms[row, column].reshape(4, 4),
+            bool(self.solidify[row, column]),
+            int(self.block_light[row, column]),
+            int(self.sky_light[row, column])
+        )
+
+    def _state_differs(self, columns, rows_a, rows_b, tolerance, position_only=False):
+        a = np.ix_(rows_a, columns); b = np.ix_(rows_b, columns)
+        if position_only:
+            a_pos = self.transforms[a][..., TRANSLATION_CELLS].astype(np.float64); b_pos = self.transforms[b][..., TRANSLATION_CELLS]
+            return np.any(np.abs(a_pos - b_pos) > tolerance, axis=2)
+        changed = np.any(np.abs(self.transforms[a].astype(np.float64) - self.transforms[b]) > tolerance, axis=2)
+        changed |= self.solidify[a] != self.solidify[b]
+        changed |= self.block_light[a] != self.block_light[b]
+        changed |= self.sky_light[a] != self.sky_light[b]
+        return changed
+
+    def frame_changes(self, columns, tolerance=0.0001, chunk_size=512, position_only=False):
+        """Frames x columns bitmap of objects whose state differs from the previous frame. The first frame is always set."""
+        columns = np.asarray(columns, dtype=np.intp)
+        changed = np.ones((self.frame_count, len(columns)), dtype=np.bool_)
+        for start in range(1, self.frame_count, chunk_size):
+            rows = np.arange(start, min(start + chunk_size, self.frame_count))
+            changed[rows] = self._state_differs(columns, rows, rows - 1, tolerance, position_only)
+        return changed
+
+    def keyframe_changes(self, columns, rows, tolerance=0.0001, chunk_size=512, position_only=False):
+        """Bitmap of objects whose state at each keyframe row differs from the previous keyframe row."""
+        columns = np.asarray(columns, dtype=np.intp); rows = np.asarray(rows, dtype=np.intp)
+        changed = np.ones((len(rows), len(columns)), dtype=np.bool_)
+        for start in range(1, len(rows), chunk_size):
+            indices = np.arange(start, min(start + chunk_size, len(rows)))
+            changed[indices] = self._state_differs(columns, rows[indices], rows[indices - 1], tolerance, position_only)
+        return changed
+
+    def decimated_rows(self, column, max_error, invert_normals=False):
+        """Rows an object needs so that the client's interpolation between them stays within max_error of every sampled
+        frame, measured on the block_display transformations the rows export to."""
+        last = self.frame_count - 1
+        discrete = self.solidify[:, column] * 256 + self.block_light[:, column].astype(np.int16) * 16 + self.sky_light[:, column]
+        matrices = self.transforms[:, column].reshape(-1, 4, 4).astype(np.float64)
+        if not np.any(discrete != discrete[0]) and not np.any(matrices != matrices[0]): return [0]
+        matrices = transforms.minecraft_matrices(matrices, invert_normals)
+        keys = {0, min(1, last), last}
+        for row in np.flatnonzero(discrete[1:] != discrete[:-1]) + 1: keys.update((int(row) - 1, int(row)))
+        ordered = sorted(keys); stack = list(zip(ordered[:-1], ordered[1:]))
+        while stack:
+            start, end = stack.pop()
+            if end - start < 2: continue
+            errors = interpolation_error(matrices, start, end); worst = int(np.argmax(errors))
+            if errors[worst] > max_error:
+                split = start + 1 + worst; keys.add(split)
+                stack.extend(((start, split), (split, end)))
+        return sorted(keys)
@@ -0,0 +1,110 @@
+from dataclasses import dataclass, replace
+
+@dataclass(frozen=True)
+class Command:
+    """One generated command, split into the parts the optimizer passes look at.
+
+    guard is an execute condition such as "if entity @e[tag=x_playing]", context the execute modifiers it runs
+    under such as "as @e[tag=x_ref] at @s", and target the entity a data merge writes to. free commands do not
+    depend on the other commands of their function, like setblocks and schedules, so passes may move them ahead of
+    the rest as long as they keep their order among themselves."""
+    body: str
+    guard: str = ""
+    context: str = ""
+    target: str = ""
+    free: bool = False
+
+    def render(self):
+        prefix = " ".join(part for part in (self.guard, self.context) if part)
+        return f"execute {prefix} run {self.body}" if prefix else self.body
+
+def negate(guard):
+    kind, condition = guard.split(" ", 1)
+    return f"{'unless' if kind == 'if' else 'if'} {condition}"
+
+def count_stats(functions):
+    """Commands and execute-prefixed commands over [[Command]]."""
+    commands = [command for function in functions for command in function]
+    return len(commands), sum(1 for command in commands if command.guard or command.context)
+
+def drop_noop_merges(functions):
+    """Drops data merges that write exactly what the previous merge into the same entity wrote. functions must be in
+    the order they run, which every playback path keeps for the keyframes of one chain."""
+    last = {}; result = []
+    for function in functions:
+        kept = []
+        for command in function:
+            if command.target:
+                if last.get(command.target) == command.body: continue
+                last[command.target] = command.body
+            kept.append(command)
+        result.append(kept)
+    return result
+
+def group_contexts(function, sub_function, min_size=3):
+    """Runs of at least min_size commands under the same guard and context become one call into a sub-function,
+    so the context's selector is evaluated once. sub_function(bodies) writes the bodies and returns its name."""
+    result = []; start = 0
+    while start < len(function):
+        end = start + 1; key = (function[start].guard, function[start].context)
+        while end < len(function) and (function[end].guard, function[end].context) == key: end += 1
+        run = function[start:end]
+        if key[1] and len(run) >= min_size:
+            result.append(Command(f"function {sub_function([command.body for command in run])}", *key))
+        else: result.extend(run)
+        start = end
+    return result
+
+def hoist_guard(function):
+    """Replaces the guard repeated on the tail of a function with one early return before it.
+
+    The tail starts at the first command carrying the most common guard; commands after it may only carry that
+    guard or be free, and the free ones move in front of the return."""
+    guards = {}
+    for command in function:
+        if command.guard: guards[command.guard] = guards.get(command.guard, 0) + 1
+    if not guards: return function
+    guard = max(guards, key=guards.get)
+    if guards[guard] < 2: return function
+    first = next(i for i, command in enumerate(function) if command.guard == guard)
+    tail = function[first:]
+    if any(command.guard != guard and not command.free for command in tail): return function
+    return function[:first] + [command for command in tail if command.guard != guard] + [Command("return 0", negate(guard))] + [replace(command, guard="") for command in tail if command.guard == guard]
+
+def fill_boxes(positions, max_volume=32768):
+    """Covers a set of (x, y, z) block positions with few axis-aligned boxes, greedily growing each box along x, then
+    y, then z from its lowest corner. Returns [(low corner, high corner)]; no box exceeds fill's max_volume."""
+    remaining = set(positions); boxes = []
+    for x, y, z in sorted(positions, key=lambda p: (p[2], p[1], p[0])):
+        if (x, y, z) not in remaining: continue
+        x2 = x
+        while (x2 + 1, y, z) in remaining and x2 + 2 - x <= max_volume: x2 += 1
+        width = x2 - x + 1; y2 = y
+        while (y2 + 2 - y) * width <= max_volume and all((i, y2 + 1, z) in remaining for i in range(x, x2 + 1)): y2 += 1
+        area = width * (y2 - y + 1); z2 = z
+        while (z2 + 2 - z) * area <= max_volume and all((i, j, z2 + 1) in remaining for i in range(x, x2 + 1) for j in range(y, y2 + 1)): z2 += 1
+        remaining.difference_update((i, j, k) for i in range(x, x2 + 1) for j in range(y, y2 + 1) for k in range(z, z2 + 1))
+        boxes.append(((x, y, z), (x2, y2, z2)))
+    return boxes
+
+def merge_setblocks(function):
+    """Replaces the relative setblocks of a function with the fewest fill commands per block, placed together where
+    the first setblock was so they share one context. A later setblock on the same position wins, as it would have."""
+    placed = {}; first = None; context = None
+    for i, command in enumerate(function):
+        if not command.body.startswith("setblock ~"): continue
+        if first is None: first = i; context = (command.guard, command.context)
+        elif (command.guard, command.context) != context: return function
+        *coordinates, block = command.body.split(" ", 4)[1:]
+        placed[tuple(int(coordinate[1:] or 0) for coordinate in coordinates)] = block
+    if first is None: return function
+    by_block = {}
+    for position, block in placed.items(): by_block.setdefault(block, []).append(position)
+    merged = []
+    for block, positions in by_block.items():
+        for low, high in fill_boxes(positions):
+            corners = " ".join(f"~{value}" for value in low + (high if high != low else ()))
+            merged.append(Command(f"{'fill' if high != low else 'setblock'} {corners} {block}", *context, free=True))
+    rest = [command for command in function if not command.body.startswith("setblock ~")]
+    at = sum(1 for command in function[:first] if not command.body.startswith("setblock ~"))
+    return rest[:at] + merged + rest[at:]
@@ -1,264 +1,895 @@
-import bpy
-import os
-import mathutils
 import json
+import fnmatch
+import functools
+import numpy as np
+from dataclasses import replace
 
-from . import utils
+from . import transforms
+from . import nbt
+from .output import run_steps
+from .commands import Command, count_stats, drop_noop_merges, group_contexts, hoist_guard, merge_setblocks, fill_boxes
+from .scene import watermark, sanitize_name, entity_uuid, RigidGroup
 
 VERSION_MAP = {
-    '1.21':   {'pack_format': 34, 'function_folder': 'function'},
-    '1.20.5': {'pack_format': 32, 'function_folder': 'function'},
-    '1.20.3': {'pack_format': 26, 'function_folder': 'functions'},
-    '1.20.2': {'pack_format': 18, 'function_folder': 'functions'},
-    '1.20':   {'pack_format': 15, 'function_folder': 'functions'},
-    '1.19.4': {'pack_format': 12, 'function_folder': 'functions'},
+    '1.21':   {'pack_format': 34, 'function_folder': 'function', 'early_return': True, 'teleport_duration': True},
+    '1.20.5': {'pack_format': 32, 'function_folder': 'function', 'early_return': True, 'teleport_duration': True},
+    '1.20.3': {'pack_format': 26, 'function_folder': 'functions', 'early_return': True, 'teleport_duration': True},
+    '1.20.2': {'pack_format': 18, 'function_folder': 'functions', 'early_return': False, 'teleport_duration': True},
+    '1.20':   {'pack_format': 15, 'function_folder': 'functions', 'early_return': False, 'teleport_duration': False},
+    '1.19.4': {'pack_format': 12, 'function_folder': 'functions', 'early_return': False, 'teleport_duration': False},
 }
 
-def generate_main_functions(props, main_path, scene_name, ns, all_objects, start_frame, block_kfs, entity_kfs):
-    play_cmds = []
+def function_root(version_details, ns):
+    return f"data/{ns}/{version_details['function_folder']}"
+
+def write_pack_mcmeta(writer, pack_format, description):
+    writer.write("pack.mcmeta", json.dumps({"pack": {"pack_format": pack_format, "description": description}}, indent=4))
+
+def uses_clock(props):
+    return props.playback_engine in ('CLOCK', 'INSTANCED')
+
+def is_instanced(props):
+    """Every created copy of the scene plays on its own; scene functions then run as and at the copy's ref entity."""
+    return props.playback_engine == 'INSTANCED'
+
+INSTANCE_ROLES = ('blocks', 'block', 'entity', 'group', 'ref')
+
+def instance_uuid(ns, scene_name, role):
+    """UUID of an instanced copy's entity as (NBT int array, hyphenated string), for macro lines. The copy's id fills
+    the last part: the string takes its decimal digits through $(id), which Minecraft reads as hex, and the array takes
+    $(hex), the number those hex digits spell. Ids stay unique up to 99,999,999 copies."""
+    kind, _, index = role.rpartition('_') if role[-1].isdigit() else (role, '', '0')
+    scene = int(entity_uuid(ns, scene_name, 'instance')[1][:8], 16); entry = INSTANCE_ROLES.index(kind)
+    return f"[I;{scene - (1 << 32) if scene >= 1 << 31 else scene},{(entry << 16) | int(index)},0,$(hex)]", f"{scene:08x}-{entry:04x}-{int(index):04x}-0000-$(id)"
+
+def instance_macro_call(ns, scene_name, function):
+    """Runs a macro function with the id of the copy whose ref is @s."""
+    storage = f"{ns}:{scene_name}"
+    return [f"execute store result storage {storage} id int 1 run scoreboard players get @s mca_id", f"function {function} with storage {storage}"]
+
+def macro_lines(lines):
+    return ["$" + line if "$(" in line else line for line in lines]
+
+def scene_entity(props, ns, scene_name, role, selector):
+    if is_instanced(props) and role != 'ref': return instance_uuid(ns, scene_name, role)[1]
+    if props.use_uuid_addressing and not is_instanced(props): return entity_uuid(ns, scene_name, role)[1]
+    return selector
+
+def ref_entity(props, ns, scene_name):
+    if is_instanced(props): return "@s"
+    return scene_entity(props, ns, scene_name, 'ref', f"@e[tag={scene_name}_ref]")
+
+def scene_has_tag(props, ns, scene_name, state):
+    if props.use_uuid_addressing: return f'if data entity {ref_entity(props, ns, scene_name)} {{Tags:["{scene_name}_{state}"]}}'
+    return f"if entity @e[tag={scene_name}_{state}]"
+
+def uuid_nbt(props, ns, scene_name, role):
+    if is_instanced(props): return f"UUID:{instance_uuid(ns, scene_name, role)[0]},"
+    return f"UUID:{entity_uuid(ns, scene_name, role)[0]}," if props.use_uuid_addressing else ""
+
+CLOCK_OBJECTIVES = ('mca_time', 'mca_frame', 'mca_speed', 'mca_state', 'mca_loop', 'mca_arg', 'mca_from', 'mca_to', 'mca_seek', 'mca_const')
+INSTANCE_OBJECTIVES = ('mca_id', 'mca_step')
+
+def clock_holder(props, scene_name):
+    return "@s" if is_instanced(props) else f"#{scene_name}"
+
+def function_tag_path(version_details, name):
+    return f"data/minecraft/tags/{version_details['function_folder']}/{name}.json"
+
+def write_dispatch_tree(writer, tree_path, tree_function, keyframe_function, offsets, holder):
+    """Interval tree over the keyframe ticks of one chain. Calling the returned root runs, in order, every keyframe
+    whose tick offset lies in (mca_from, mca_to] with O(log n) function calls per dispatched keyframe."""
+    def node(low, high):
+        if low == high: return f"{keyframe_function}/{low}"
+        middle = (low + high) // 2; lines = []
+        for first, last in ((low, middle), (middle + 1, high)):
+            lines.append(f"execute if score {holder} mca_from matches ..{offsets[last] - 1} if score {holder} mca_to matches {offsets[first]}.. run function {node(first, last)}")
+        writer.write(f"{tree_path}/{low}_{high}.mcfunction", watermark + "\n".join(lines))
+        return f"{tree_function}/{low}_{high}"
+    root = node(0, len(offsets) - 1)
+    return f"execute if score {holder} mca_from matches ..{offsets[-1] - 1} if score {holder} mca_to matches {offsets[0]}.. run function {root}"
+
+def write_search_tree(writer, tree_path, tree_function, score, branches, fanout=16):
+    """Search tree over a score. branches is [(low, [commands])] sorted by low; a branch's commands run when the
+    score is at least its low and below the next branch's, the first one being open below. Commands must not change
+    the score. Returns the root command."""
+    def matches(first, last):
+        low = branches[first][0] if first > 0 else ""; high = branches[last + 1][0] - 1 if last + 1 < len(branches) else ""
+        return f"execute if score {score} matches {low}..{high} run " if low != "" or high != "" else ""
+    def node(first, last):
+        count = last - first + 1; lines = []
+        if count <= fanout:
+            lines = [matches(k, k) + command for k in range(first, last + 1) for command in branches[k][1]]
+        else:
+            step = fanout
+            while step * fanout < count: step *= fanout
+            for child in range(first, last + 1, step):
+                child_last = min(child + step - 1, last)
+                lines.append(matches(child, child_last) + node(child, child_last))
+        writer.write(f"{tree_path}/{first}_{last}.mcfunction", watermark + "\n".join(lines))
+        return f"function {tree_function}/{first}_{last}"
+    return node(0, len(branches) - 1)
+
+def pause_holder(scene_name, segment):
+    return f"#{scene_name}_{segment}"
+
+def generate_pause_functions(props, writer, main_path, pause_path, scene_name, ns, chains, end_frame, version_details):
+    """Pause/resume for the schedule chain without any per-tick work while paused.
+
+    Keyframe 0 of every chain stores the gametime in mca_start. pause turns that into the ticks already played,
+    finds the pending keyframe through a search tree, clears its schedule and keeps its index in mca_next and the ticks
+    it still had to wait in mca_wait. resume counts those ticks down and calls the keyframe again."""
+    ref = ref_entity(props, ns, scene_name); pause_function = f"{ns}:animations/scenes/{scene_name}/pause"
+    main_function = f"{ns}:animations/_main/{scene_name}"
+    pause_cmds = [f"tag {ref} remove {scene_name}_playing", f"tag {ref} add {scene_name}_paused", "execute store result score #now mca_start run time query gametime"]
+    resume_cmds = [f"tag {ref} remove {scene_name}_paused", f"tag {ref} add {scene_name}_playing", "execute store result score #now mca_start run time query gametime"]
+    for segment, ticks in chains:
+        h = pause_holder(scene_name, segment); kf_function = f"{ns}:animations/scenes/{scene_name}/keyframes/{segment}"
+        chain_path = f"{pause_path}/{segment}"; chain_function = f"{pause_function}/{segment}"
+        offsets = [tick - ticks[0] for tick in ticks] + [end_frame - ticks[0] + 1]
+        # mca_start holds minus the ticks played, so keyframe i is pending while it lies in (-offsets[i], -offsets[i - 1]].
+        branches = []
+        for i in reversed(range(len(offsets))):
+            leaf_cmds = [f"schedule clear {kf_function}/{i if i < len(ticks) else 0}", f"scoreboard players set {h} mca_next {i}"]
+            if offsets[i]: leaf_cmds.append(f"scoreboard players add {h} mca_wait {offsets[i]}")
+            branches.append((1 - offsets[i], leaf_cmds))
+        pause_cmds += [
+            f"schedule clear {chain_function}/wait",
+            f"scoreboard players operation {h} mca_start -= #now mca_start",
+            f"scoreboard players operation {h} mca_wait = {h} mca_start",
+            write_search_tree(writer, f"{chain_path}/find", f"{chain_function}/find", f"{h} mca_start", branches)
+        ]
+        resume_branches = [(i, [f"function {kf_function}/{i}"]) for i in range(len(ticks))]
+        resume_branches.append((len(ticks), [f"execute {scene_has_tag(props, ns, scene_name, 'looping')} run function {kf_function}/0"]))
+        writer.write(f"{chain_path}/wait.mcfunction", watermark + "\n".join([
+            f"scoreboard players remove {h} mca_wait 1",
+            f"execute if score {h} mca_wait matches 1.. run schedule function {chain_function}/wait 1t",
+            f"execute if score {h} mca_wait matches ..0 run {write_search_tree(writer, f'{chain_path}/resume', f'{chain_function}/resume', f'{h} mca_next', resume_branches)}"
+        ]))
+        resume_cmds += [f"scoreboard players operation {h} mca_start += #now mca_start", f"schedule function {chain_function}/wait 1t"]
+    writer.write(f"{pause_path}/pause.mcfunction", watermark + "\n".join(pause_cmds))
+    writer.write(f"{pause_path}/resume.mcfunction", watermark + "\n".join(resume_cmds))
+    writer.write(f"{main_path}/pause.mcfunction", watermark + f"execute {scene_has_tag(props, ns, scene_name, 'playing')} run function {pause_function}/pause")
+    writer.write(f"{main_path}/resume.mcfunction", watermark + f"execute {scene_has_tag(props, ns, scene_name, 'paused')} run function {pause_function}/resume")
+    writer.write(f"{main_path}/load.mcfunction", watermark + "\n".join(f"scoreboard objectives add {objective} dummy" for objective in ('mca_start', 'mca_next', 'mca_wait')))
+    writer.add_to_tag(function_tag_path(version_details, 'load'), f"{main_function}/load")
+
+def generate_clock_functions(props, writer, main_path, control_path, clock_path, scene_name, ns, start_frame, end_frame, dispatch_lines, first_keyframes, version_details):
+    """Scoreboard-clock playback: while playing, advance reschedules itself every tick, moves the scene's frame score
+    and dispatches the keyframes it passed. Paused and stopped scenes have nothing scheduled.
+
+    mca_time holds the frame in hundredths so set_speed can take a percentage. seek, goto_frame and set_speed read
+    their argument from the mca_arg score of the scene's holder. Instanced scenes keep these scores on each ref entity
+    instead. Their shared tick looks the playing copies up once and queues each copy's id in storage along with one
+    step; every step takes the next id and advances that copy through its ref's UUID, so each copy runs in its own
+    command chain without another entity scan. mca_step stamps the tick a copy was last queued for, so play and resume
+    never queue a copy twice. play, loop and the rest go to control_path."""
+    h = clock_holder(props, scene_name); length = end_frame - start_frame + 1; instanced = is_instanced(props)
+    main_function = f"{ns}:animations/_main/{scene_name}"; clock_function = f"{ns}:animations/scenes/{scene_name}/clock"
+    driver = f"{clock_function}/tick" if instanced else f"{clock_function}/advance"
+    load_cmds = [f"scoreboard objectives add {objective} dummy" for objective in CLOCK_OBJECTIVES + (INSTANCE_OBJECTIVES if instanced else ())]
+    load_cmds.append("scoreboard players set #100 mca_const 100")
+    if instanced: load_cmds += ["scoreboard players set #10 mca_const 10", "scoreboard players set #16 mca_const 16"]
+    if not instanced:
+        load_cmds.append(f"execute unless score {h} mca_speed = {h} mca_speed run scoreboard players set {h} mca_speed 100")
+        load_cmds += [f"execute unless score {h} {objective} = {h} {objective} run scoreboard players set {h} {objective} 0" for objective in ('mca_time', 'mca_frame', 'mca_state', 'mca_loop', 'mca_seek')]
+    writer.write(f"{main_path}/load.mcfunction", watermark + "\n".join(load_cmds))
+    if instanced:
+        playing = f"@e[type=block_display,tag={scene_name}_ref,scores={{mca_state=1}}]"; storage = f"{ns}:{scene_name}"
+        stamp = f"execute store result score #{scene_name} mca_step run time query gametime"
+        writer.write(f"{clock_path}/tick.mcfunction", watermark + "\n".join([
+            stamp, f"execute as {playing} unless score @s mca_step = #{scene_name} mca_step run function {clock_function}/queue"
+        ]))
+        writer.write(f"{clock_path}/start.mcfunction", watermark + "\n".join([
+            stamp, f"execute unless score @s mca_step = #{scene_name} mca_step run function {clock_function}/queue"
+        ]))
+        writer.write(f"{clock_path}/queue.mcfunction", watermark + "\n".join([
+            f"scoreboard players operation @s mca_step = #{scene_name} mca_step",
+            f"data modify storage {storage} queue append value {{}}",
+            f"execute store result storage {storage} queue[-1].id int 1 run scoreboard players get @s mca_id",
+            f"schedule function {clock_function}/step 1t append", f"schedule function {driver} 1t"
+        ]))
+        writer.write(f"{clock_path}/step.mcfunction", watermark + "\n".join([
+            f"function {clock_function}/step_copy with storage {storage} queue[0]", f"data remove storage {storage} queue[0]"
+        ]))
+        writer.write(f"{clock_path}/step_copy.mcfunction", watermark + "\n".join(macro_lines([
+            f"execute as {instance_uuid(ns, scene_name, 'ref')[1]} at @s if score @s mca_state matches 1 run function {clock_function}/advance"
+        ])))
+    writer.add_to_tag(function_tag_path(version_details, 'load'), f"{main_function}/load")
+
+    writer.write(f"{clock_path}/dispatch.mcfunction", watermark + "\n".join(dispatch_lines or ["# No keyframes to dispatch."]))
+    writer.write(f"{clock_path}/advance.mcfunction", watermark + "\n".join([
+        f"scoreboard players operation {h} mca_from = {h} mca_frame",
+        f"scoreboard players operation {h} mca_time += {h} mca_speed",
+        f"scoreboard players operation {h} mca_frame = {h} mca_time",
+        f"scoreboard players operation {h} mca_frame /= #100 mca_const",
+        f"scoreboard players operation {h} mca_to = {h} mca_frame",
+        f"execute if score {h} mca_frame matches ..{length - 1} run function {clock_function}/dispatch",
+        f"execute if score {h} mca_frame matches {length}.. run function {clock_function}/end"
+    ] + ([] if instanced else [f"execute if score {h} mca_state matches 1 run schedule function {driver} 1t"])))
+    writer.write(f"{clock_path}/end.mcfunction", watermark + "\n".join([
+        f"scoreboard players set {h} mca_to {length - 1}",
+        f"function {clock_function}/dispatch",
+        f"execute if score {h} mca_loop matches 1 run function {clock_function}/wrap",
+        f"execute unless score {h} mca_loop matches 1 run function {clock_function}/finish"
+    ]))
+    writer.write(f"{clock_path}/wrap.mcfunction", watermark + "\n".join([
+        f"scoreboard players remove {h} mca_time {length * 100}",
+        f"execute if score {h} mca_time matches {length * 100}.. run scoreboard players set {h} mca_time 0",
+        f"scoreboard players operation {h} mca_frame = {h} mca_time",
+        f"scoreboard players operation {h} mca_frame /= #100 mca_const",
+        f"scoreboard players set {h} mca_from -1",
+        f"scoreboard players operation {h} mca_to = {h} mca_frame",
+        f"function {clock_function}/dispatch"
+    ]))
+    writer.write(f"{clock_path}/finish.mcfunction", watermark + "\n".join([
+        f"scoreboard players set {h} mca_state 0", f"scoreboard players set {h} mca_frame {length - 1}", f"scoreboard players set {h} mca_time {(length - 1) * 100}"
+    ]))
+    writer.write(f"{clock_path}/goto.mcfunction", watermark + "\n".join([
+        f"execute if score {h} mca_arg matches ..-1 run scoreboard players set {h} mca_arg 0",
+        f"execute if score {h} mca_arg matches {length}.. run scoreboard players set {h} mca_arg {length - 1}",
+        f"scoreboard players operation {h} mca_from = {h} mca_frame",
+        f"execute if score {h} mca_arg < {h} mca_frame run scoreboard players set {h} mca_from -1",
+        f"scoreboard players operation {h} mca_to = {h} mca_arg",
+        f"scoreboard players operation {h} mca_frame = {h} mca_arg",
+        f"scoreboard players operation {h} mca_time = {h} mca_arg",
+        f"scoreboard players operation {h} mca_time *= #100 mca_const",
+        f"scoreboard players set {h} mca_seek 1",
+        f"function {clock_function}/dispatch",
+        f"scoreboard players set {h} mca_seek 0"
+    ]))
+
+    restart = [f"scoreboard players set {h} mca_time 0", f"scoreboard players set {h} mca_frame 0", f"scoreboard players set {h} mca_from -1", f"scoreboard players set {h} mca_to 0", f"function {clock_function}/dispatch"]
+    schedule = [f"function {clock_function}/start" if instanced else f"schedule function {driver} 1t"]
+    restart += [f"scoreboard players set {h} mca_state 1"] + schedule
+    writer.write(f"{control_path}/play.mcfunction", watermark + "\n".join([f"scoreboard players set {h} mca_loop 0"] + restart))
+    writer.write(f"{control_path}/loop.mcfunction", watermark + "\n".join([f"scoreboard players set {h} mca_loop 1"] + restart))
+    writer.write(f"{control_path}/stop.mcfunction", watermark + "\n".join([
+        f"scoreboard players set {h} mca_state 0", f"scoreboard players set {h} mca_loop 0"] + ([] if instanced else [f"schedule clear {driver}"]) + [
+        f"scoreboard players set {h} mca_seek 1"] + [f"function {path}" for path in first_keyframes] + [f"scoreboard players set {h} mca_seek 0",
+        f"scoreboard players set {h} mca_time 0", f"scoreboard players set {h} mca_frame 0"
+    ]))
     if props.pause_support:
-        play_cmds.extend([f"tag @e[tag={scene_name}_ref] remove {scene_name}_paused", f"tag @e[tag={scene_name}_ref] add {scene_name}_playing"])
+        writer.write(f"{control_path}/pause.mcfunction", watermark + ("" if instanced else f"execute if score {h} mca_state matches 1 run schedule clear {driver}\n") + f"execute if score {h} mca_state matches 1 run scoreboard players set {h} mca_state 2")
+        writer.write(f"{control_path}/resume.mcfunction", watermark + "\n".join([f"execute if score {h} mca_state matches 2 run {command}" for command in schedule] + [f"execute if score {h} mca_state matches 2 run scoreboard players set {h} mca_state 1"]))
+    arg = f"#{scene_name} mca_arg"; take_arg = f"scoreboard players operation {h} mca_arg = {arg}\n" if instanced else ""
+    writer.write(f"{control_path}/goto_frame.mcfunction", watermark + f"# Jumps to the Blender frame in score {arg}\n{take_arg}scoreboard players remove {h} mca_arg {start_frame}\nfunction {clock_function}/goto")
+    writer.write(f"{control_path}/seek.mcfunction", watermark + f"# Jumps by score {arg} frames, backwards when negative\n{take_arg}scoreboard players operation {h} mca_arg += {h} mca_frame\nfunction {clock_function}/goto")
+    writer.write(f"{control_path}/set_speed.mcfunction", watermark + f"# Sets the playback speed to score {arg} percent (100 = normal, 0 = frozen)\n{take_arg}execute if score {h} mca_arg matches ..-1 run scoreboard players set {h} mca_arg 0\nscoreboard players operation {h} mca_speed = {h} mca_arg")
+    move_cmd = f"tp {scene_entity(props, ns, scene_name, 'ref', f'@e[type=block_display,tag={scene_name}_ref,sort=nearest,limit=1]')} @s"
+    writer.write(f"{main_path}/move.mcfunction", watermark + move_cmd)
+
+def generate_main_functions(props, writer, main_path, scene_name, ns, all_objects, start_frame, block_kfs, entity_kfs, group_kfs=None):
+    ref = ref_entity(props, ns, scene_name); play_cmds = []
+    if props.pause_support:
+        play_cmds.extend([f"tag {ref} remove {scene_name}_paused", f"tag {ref} add {scene_name}_playing"])
     else:
-        play_cmds.append(f"tag @e[tag={scene_name}_ref] add {scene_name}_playing")
-    if props.export_blocks and block_kfs:
-        first_frame = sorted(block_kfs.keys())[0]; delay = first_frame - start_frame
-        path = f"{ns}:animations/scenes/{scene_name}/keyframes/blocks/0"
-        if delay > 0: play_cmds.append(f"schedule function {path} {delay}t")
-        else: play_cmds.append(f"function {path}")
-    if props.export_entities and entity_kfs:
-        first_frame = sorted(entity_kfs.keys())[0]; delay = first_frame - start_frame
-        path = f"{ns}:animations/scenes/{scene_name}/keyframes/entity/0"
-        if delay > 0: play_cmds.append(f"schedule function {path} {delay}t")
+        play_cmds.append(f"tag {ref} add {scene_name}_playing")
+    chains = [(segment, kfs) for segment, kfs, enabled in (('blocks', block_kfs, props.export_blocks), ('groups', group_kfs, props.export_blocks), ('entity', entity_kfs, props.export_entities)) if enabled and kfs]
+    for segment, kfs in chains:
+        first_frame = min(kfs); delay = first_frame - start_frame
+        path = f"{ns}:animations/scenes/{scene_name}/keyframes/{segment}/0"
+        if delay > 0:
+            if props.pause_support:
+                h = pause_holder(scene_name, segment)
+                play_cmds.extend([f"execute store result score {h} mca_start run time query gametime", f"scoreboard players add {h} mca_start {delay}"])
+            play_cmds.append(f"schedule function {path} {delay}t")
         else: play_cmds.append(f"function {path}")
-    with open(os.path.join(main_path, "play.mcfunction"), 'w', encoding='utf-8') as f:
-        f.write(utils.watermark + "\n".join(play_cmds))
-    loop_cmds = [f"tag @e[tag={scene_name}_ref] add {scene_name}_looping"] + play_cmds
-    with open(os.path.join(main_path, "loop.mcfunction"), 'w', encoding='utf-8') as f:
-        f.write(utils.watermark + "\n".join(loop_cmds))
-    stop_cmds = [f"tag @e[tag={scene_name}_ref] add {scene_name}_playing"]
+    writer.write(f"{main_path}/play.mcfunction", watermark + "\n".join(play_cmds))
+    loop_cmds = [f"tag {ref} add {scene_name}_looping"] + play_cmds
+    writer.write(f"{main_path}/loop.mcfunction", watermark + "\n".join(loop_cmds))
+    stop_cmds = [f"tag {ref} add {scene_name}_playing"]
     if props.export_blocks and block_kfs:
         stop_cmds.append(f"function {ns}:animations/scenes/{scene_name}/keyframes/blocks/0")
+    if props.export_blocks and group_kfs:
+        stop_cmds.append(f"function {ns}:animations/scenes/{scene_name}/keyframes/groups/0")
     if props.export_entities and entity_kfs:
         stop_cmds.append(f"function {ns}:animations/scenes/{scene_name}/keyframes/entity/0")
-    stop_cmds.extend([f"tag @e[tag={scene_name}_ref] remove {scene_name}_looping", f"tag @e[tag={scene_name}_ref] remove {scene_name}_playing", f"tag @e[tag={scene_name}_ref] remove {scene_name}_paused"])
-    with open(os.path.join(main_path, "stop.mcfunction"), 'w', encoding='utf-8') as f:
-        f.write(utils.watermark + "\n".join(stop_cmds))
+    stop_cmds.extend([f"tag {ref} remove {scene_name}_looping", f"tag {ref} remove {scene_name}_playing", f"tag {ref} remove {scene_name}_paused"])
     if props.pause_support:
-        with open(os.path.join(main_path, "pause.mcfunction"), 'w', encoding='utf-8') as f: f.write(utils.watermark + f"tag @e[tag={scene_name}_ref] remove {scene_name}_playing\ntag @e[tag={scene_name}_ref] add {scene_name}_paused")
-        with open(os.path.join(main_path, "resume.mcfunction"), 'w', encoding='utf-8') as f: f.write(utils.watermark + f"tag @e[tag={scene_name}_ref] remove {scene_name}_paused\ntag @e[tag={scene_name}_ref] add {scene_name}_playing")
-    
-    move_cmd = f"tp @e[type=block_display,tag={scene_name}_ref,sort=nearest,limit=1] @s"
-    with open(os.path.join(main_path, "move.mcfunction"), 'w', encoding='utf-8') as f:
-        f.write(utils.watermark + move_cmd)
+        stop_cmds.extend(f"schedule clear {ns}:animations/scenes/{scene_name}/pause/{segment}/wait" for segment, _ in chains)
+    writer.write(f"{main_path}/stop.mcfunction", watermark + "\n".join(stop_cmds))
 
+    move_cmd = f"tp {scene_entity(props, ns, scene_name, 'ref', f'@e[type=block_display,tag={scene_name}_ref,sort=nearest,limit=1]')} @s"
+    writer.write(f"{main_path}/move.mcfunction", watermark + move_cmd)
 
-def generate_create_commands(props, main_path, scene_name, all_objects, start_frame, animation_cache):
-    all_passengers = []
+
+def generate_create_commands(props, writer, main_path, scene_name, ns, all_objects, start_frame, animation_cache, static_boxes=(), rigid_groups=()):
+    ref = ref_entity(props, ns, scene_name); all_passengers = []
     
-    block_objects = [obj for obj in all_objects if obj.mc_props.object_type == 'BLOCK' and props.export_blocks]
-    if block_objects:
+    block_objects = [obj for obj in all_objects if obj.object_type == 'BLOCK' and props.export_blocks]
+    if block_objects or static_boxes:
         block_display_passengers = []
+        final_matrices = transforms.minecraft_matrices(animation_cache.transforms[animation_cache.row(start_frame), [animation_cache.column(obj.name) for obj in block_objects]], props.invert_normals_on_export)
+        matrix_strings = nbt.MatrixFormatter().format_many(final_matrices)
         for i, obj in enumerate(block_objects):
-            mc_props = obj.mc_props
-            world_matrix, _, block_light, sky_light = animation_cache[obj.name][start_frame]
-            final_matrix = utils.get_final_minecraft_matrix(world_matrix, props)
-            matrix_str = utils.format_matrix(final_matrix)
-            block_id = mc_props.block_id.strip()
+            _, _, block_light, sky_light = animation_cache.state(obj.name, start_frame)
+            matrix_str = matrix_strings[i]
+            block_id = obj.block_id.strip()
             tags = [f"{scene_name}_block_{i}", "mca_animation"] 
             tags_nbt = ",".join([f'"{tag}"' for tag in tags])
-            brightness_nbt = f',brightness:{{sky:{sky_light},block:{block_light}}}'
-            block_display_passengers.append(f'{{id:"minecraft:block_display",block_state:{{Name:"{block_id}"}},transformation:[{matrix_str}],Tags:[{tags_nbt}]{brightness_nbt}}}')
+            brightness_nbt = nbt.brightness(sky_light, block_light)
+            block_display_passengers.append(f'{{id:"minecraft:block_display",{uuid_nbt(props, ns, scene_name, f"block_{i}")}block_state:{{Name:"{block_id}"}},transformation:[{matrix_str}],Tags:[{tags_nbt}]{brightness_nbt}}}')
+        block_display_passengers += static_block_passengers(static_boxes, f'"{scene_name}_static","mca_animation"')
         
         parent_tag = f"{scene_name}_blocks"
         passengers_str = ",".join(block_display_passengers)
-        all_passengers.append(f'{{id:"minecraft:block_display",Tags:["{parent_tag}","mca_animation"],Passengers:[{passengers_str}]}}')
+        blocks_nbt = f'{uuid_nbt(props, ns, scene_name, "blocks")}Tags:["{parent_tag}","mca_animation"],Passengers:[{passengers_str}]'
+        all_passengers.append(f'{{id:"minecraft:block_display",{blocks_nbt}}}')
 
-    passengers_nbt_str = f"Passengers:[{','.join(all_passengers)}]" if all_passengers else ""
+    passengers_nbt_str = f"Passengers:[{','.join(all_passengers)}]" if all_passengers and not is_instanced(props) else ""
     
     custom_name_nbt = f"CustomName:'{{\"text\":\"{scene_name}\"}}',CustomNameVisible:false"
-    create_cmds = [f'summon block_display ~ ~ ~ {{block_state:{{Name:"minecraft:air"}},Tags:["{scene_name}_ref","mca_animation"],{custom_name_nbt},{passengers_nbt_str}}}']
+    create_cmds = [f'summon block_display ~ ~ ~ {{{uuid_nbt(props, ns, scene_name, "ref")}block_state:{{Name:"minecraft:air"}},Tags:["{scene_name}_ref","mca_animation"],{custom_name_nbt},{passengers_nbt_str}}}']
 
-    entity_objects = [obj for obj in all_objects if obj.mc_props.object_type == 'ENTITY' and props.export_entities]
+    entity_objects = [obj for obj in all_objects if obj.object_type == 'ENTITY' and props.export_entities]
+    entity_cmds = []
     for i, obj in enumerate(entity_objects):
-         mc_props = obj.mc_props
          tags = [f"{scene_name}_entity_{i}", "mca_animation"]
-         if mc_props.is_tracking_target: tags.append("target")
+         if obj.is_tracking_target: tags.append("target")
          tags_nbt = ",".join([f'"{tag}"' for tag in tags])
-         custom_nbt = f",{mc_props.custom_nbt.strip()}" if mc_props.custom_nbt else ""
-         create_cmds.append(f"execute as @e[tag={scene_name}_ref] at @s run summon {mc_props.entity_id} ~ ~ ~ {{Tags:[{tags_nbt}]{custom_nbt}}}")
+         custom_nbt = f",{obj.custom_nbt.strip()}" if obj.custom_nbt else ""
+         entity_cmds.append(f"summon {obj.entity_id} ~ ~ ~ {{{uuid_nbt(props, ns, scene_name, f'entity_{i}')}Tags:[{tags_nbt}]{custom_nbt}}}")
+    entity_cmds += group_vehicle_summons(props, scene_name, ns, rigid_groups, animation_cache, start_frame)
 
-    with open(os.path.join(main_path, "create.mcfunction"), 'w', encoding='utf-8') as f:
-        f.write(utils.watermark + "\n".join(create_cmds))
+    if is_instanced(props):
+        instance_path = f"{main_path.rsplit('/_main/', 1)[0]}/scenes/{scene_name}/instance"
+        ref = instance_uuid(ns, scene_name, 'ref')[1]
+        if all_passengers: entity_cmds = [f"summon block_display ~ ~ ~ {{{blocks_nbt}}}", f"ride {scene_entity(props, ns, scene_name, 'blocks', '')} mount {ref}"] + entity_cmds
+        entity_cmds = create_cmds + entity_cmds + [f"execute as {ref} run function {ns}:animations/scenes/{scene_name}/instance/init"]
+        remove_cmds = ["execute on passengers on passengers run kill @s", "execute on passengers run kill @s"]
+        remove_cmds += [f"kill {scene_entity(props, ns, scene_name, f'entity_{i}', '')}" for i in range(len(entity_objects))]
+        for i in range(len(rigid_groups)):
+            vehicle = scene_entity(props, ns, scene_name, f"group_{i}", "")
+            remove_cmds += [f"execute as {vehicle} on passengers run kill @s", f"kill {vehicle}"]
+        generate_instance_setup(writer, main_path, instance_path, scene_name, ns, entity_cmds, remove_cmds + ["kill @s"])
+        return
+    create_cmds += [f"execute as {ref} at @s run {command}" for command in entity_cmds]
+    writer.write(f"{main_path}/create.mcfunction", watermark + "\n".join(create_cmds))
         
-    remove_cmds = [f"kill @e[tag={scene_name}_ref]"]
-    if block_objects:
-        remove_cmds.append(f"kill @e[tag={scene_name}_blocks]")
+    remove_cmds = [f"kill {ref}"]
+    if static_boxes: remove_cmds.append(f"kill @e[type=block_display,tag={scene_name}_static]")
+    if block_objects or static_boxes:
+        remove_cmds.append(f"kill {scene_entity(props, ns, scene_name, 'blocks', f'@e[tag={scene_name}_blocks]')}")
         for i in range(len(block_objects)):
-            remove_cmds.append(f"kill @e[tag={scene_name}_block_{i}]")
+            remove_cmds.append(f"kill {scene_entity(props, ns, scene_name, f'block_{i}', f'@e[tag={scene_name}_block_{i}]')}")
     for i in range(len(entity_objects)):
-        remove_cmds.append(f"kill @e[tag={scene_name}_entity_{i}]")
+        remove_cmds.append(f"kill {scene_entity(props, ns, scene_name, f'entity_{i}', f'@e[tag={scene_name}_entity_{i}]')}")
+    if rigid_groups: remove_cmds.append(f"kill @e[type=block_display,tag={scene_name}_grouped]")
+    for i in range(len(rigid_groups)):
+        remove_cmds.append(f"kill {scene_entity(props, ns, scene_name, f'group_{i}', f'@e[type=block_display,tag={scene_name}_group_{i}]')}")
         
-    with open(os.path.join(main_path, "remove.mcfunction"), 'w', encoding='utf-8') as f:
-        f.write(utils.watermark + "\n".join(remove_cmds))
+    writer.write(f"{main_path}/remove.mcfunction", watermark + "\n".join(remove_cmds))
+
+def group_vehicle_summons(props, scene_name, ns, rigid_groups, animation_cache, start_frame):
+    """Summons each rigid group's vehicle at the ref with the group's blocks riding it at their start transformations."""
+    row = animation_cache.row(start_frame); formatter = nbt.MatrixFormatter(); summons = []
+    teleport_nbt = f",teleport_duration:{props.interpolation_duration}" if props.use_interpolation else ""
+    for i, group in enumerate(rigid_groups):
+        columns = [animation_cache.column(obj.name) for obj in group.members]
+        matrix_strings = formatter.format_many(transforms.minecraft_matrices(animation_cache.transforms[row, columns], props.invert_normals_on_export))
+        passengers = [f'{{id:"minecraft:block_display",block_state:{{Name:"{obj.block_id.strip()}"}},transformation:[{matrix_str}],Tags:["{scene_name}_grouped","mca_animation"]{nbt.brightness(int(animation_cache.sky_light[row, column]), int(animation_cache.block_light[row, column]))}}}'
+                      for obj, column, matrix_str in zip(group.members, columns, matrix_strings)]
+        summons.append(f'summon block_display ~ ~ ~ {{{uuid_nbt(props, ns, scene_name, f"group_{i}")}block_state:{{Name:"minecraft:air"}},Tags:["{scene_name}_group_{i}","mca_animation"]{teleport_nbt},Passengers:[{",".join(passengers)}]}}')
+    return summons
 
-def get_optimized_keyframes(props, all_objects, obj_type_filter, animation_cache, comparison_func, start_frame, end_frame):
-    keyframes = {}
-    filtered_objects = [obj for obj in all_objects if obj.mc_props.object_type == obj_type_filter]
+def generate_instance_setup(writer, main_path, instance_path, scene_name, ns, spawn_cmds, remove_cmds):
+    """create takes the next instance id and spawns the copy's ref, displays and entities with UUIDs made from that id
+    (see instance_uuid), so the clock, keyframes and remove reach exactly this copy's entities; spawn_cmds end by
+    running init as the new ref, which keeps the id and resets the clock scores. spawn_cmds and remove_cmds may hold
+    instance_uuid macro pieces."""
+    instance_function = f"{ns}:animations/scenes/{scene_name}/instance"; storage = f"{ns}:{scene_name}"
+    to_hex = [f"scoreboard players operation #rest mca_id = #{scene_name} mca_id", "scoreboard players set #hex mca_id 0", "scoreboard players set #place mca_id 1"]
+    for _ in range(8):
+        to_hex += ["scoreboard players operation #digit mca_id = #rest mca_id", "scoreboard players operation #digit mca_id %= #10 mca_const",
+                   "scoreboard players operation #digit mca_id *= #place mca_id", "scoreboard players operation #hex mca_id += #digit mca_id",
+                   "scoreboard players operation #rest mca_id /= #10 mca_const", "scoreboard players operation #place mca_id *= #16 mca_const"]
+    writer.write(f"{main_path}/create.mcfunction", watermark + "\n".join([f"scoreboard players add #{scene_name} mca_id 1"] + to_hex + [
+        f"execute store result storage {storage} hex int 1 run scoreboard players get #hex mca_id",
+        f"execute store result storage {storage} id int 1 run scoreboard players get #{scene_name} mca_id",
+        f"function {instance_function}/spawn with storage {storage}"
+    ]))
+    writer.write(f"{instance_path}/init.mcfunction", watermark + "\n".join([
+        f"scoreboard players operation @s mca_id = #{scene_name} mca_id", "scoreboard players set @s mca_speed 100"
+    ] + [f"scoreboard players set @s {objective} 0" for objective in ('mca_time', 'mca_frame', 'mca_state', 'mca_loop', 'mca_seek')]))
+    writer.write(f"{instance_path}/spawn.mcfunction", watermark + "\n".join(macro_lines(spawn_cmds)))
+    writer.write(f"{instance_path}/remove.mcfunction", watermark + "\n".join(instance_macro_call(ns, scene_name, f"{instance_function}/despawn")))
+    writer.write(f"{instance_path}/despawn.mcfunction", watermark + "\n".join(macro_lines(remove_cmds)))
+
+def get_optimized_keyframes(props, all_objects, obj_type_filter, animation_cache, start_frame, end_frame, position_only=False, always_active=()):
+    filtered_objects = [obj for obj in all_objects if obj.object_type == obj_type_filter]
     if not filtered_objects: return {}
-    for frame in range(start_frame, end_frame + 1):
-        frame_has_changes = False
-        if frame == start_frame: frame_has_changes = True
-        else:
-            for obj in filtered_objects:
-                if not comparison_func(animation_cache[obj.name][frame], animation_cache[obj.name][frame - 1]):
-                    frame_has_changes = True; break
-        if frame_has_changes: keyframes[frame] = {}
-    for frame in keyframes.keys():
-        frame_data = {}; local_index = 0
-        for obj in filtered_objects:
-            frame_data[local_index] = (obj, animation_cache[obj.name][frame]); local_index += 1
-        keyframes[frame] = frame_data
+    columns = [animation_cache.column(obj.name) for obj in filtered_objects]
+    frame_mask = animation_cache.frame_changes(columns, position_only=position_only).any(axis=1)
+    if always_active: frame_mask[:] = True
+    rows = np.flatnonzero(frame_mask)
+    changed = animation_cache.keyframe_changes(columns, rows, position_only=position_only)
+    changed[:, list(always_active)] = True
+    return {animation_cache.start_frame + int(row): np.flatnonzero(changed[i]).tolist() for i, row in enumerate(rows)}
+
+def get_decimated_keyframes(props, all_objects, obj_type_filter, animation_cache, start_frame, end_frame):
+    filtered_objects = [obj for obj in all_objects if obj.object_type == obj_type_filter]
+    if not filtered_objects: return {}, {}
+    keyframes = {start_frame: list(range(len(filtered_objects)))}; next_keys = {}
+    for local_index, obj in enumerate(filtered_objects):
+        column = animation_cache.column(obj.name)
+        frames = [animation_cache.start_frame + row for row in animation_cache.decimated_rows(column, props.decimation_error, props.invert_normals_on_export)]
+        for prev_frame, frame, next_frame in zip([None] + frames[:-1], frames, frames[1:] + [None]):
+            next_keys[(local_index, frame)] = next_frame
+            if frame == start_frame: continue
+            state = animation_cache.state(obj.name, frame)
+            holds_still = next_frame is None or transforms.are_states_equal(state, animation_cache.state(obj.name, next_frame))
+            if holds_still and state[1:] == animation_cache.state(obj.name, prev_frame)[1:]: continue
+            keyframes.setdefault(frame, []).append(local_index)
+    return keyframes, next_keys
+
+def get_entity_keyframes(props, all_objects, animation_cache, start_frame, end_frame):
+    entity_objects = [obj for obj in all_objects if obj.object_type == 'ENTITY']
+    tracking_mode = props.tracking_mode if props.dynamic_tracking else 'OFF'
+    if tracking_mode == 'PLAYER': always_active = list(range(len(entity_objects)))
+    else: always_active = [i for i, obj in enumerate(entity_objects) if obj.use_custom_commands and obj.sid]
+    keyframes = get_optimized_keyframes(props, all_objects, 'ENTITY', animation_cache, start_frame, end_frame, position_only=True, always_active=always_active)
+    if tracking_mode == 'TARGET':
+        targets = {i for i, obj in enumerate(entity_objects) if obj.is_tracking_target}
+        for frame, changed in keyframes.items():
+            if targets.intersection(changed): keyframes[frame] = list(range(len(entity_objects)))
     return keyframes
 
-def generate_keyframes(props, kf_path, scene_name, ns, all_objects, obj_type_filter, command_formatter, keyframes, start_frame, end_frame, animation_cache, sid_map={}):
+def solidify_morphs(obj):
+    solidify_id = obj.solidify_as.strip() or obj.block_id.strip()
+    return 'barrier' not in solidify_id
+
+def convert_block_matrices(props, block_objects, keyframes, animation_cache, next_keys=None, chunk_size=4096):
+    """Minecraft transformations of every block state the keyframes will merge, converted in batches.
+
+    Returns {frame: (len(keyframes[frame]), 4, 4) array} in the order of keyframes[frame]. When decimating, each row
+    holds the state of the object's next keyframe, which is what the merge interpolates towards."""
+    frames = sorted(keyframes); rows = []; columns = []; morph = []
+    for frame in frames:
+        for local_index in keyframes[frame]:
+            obj = block_objects[local_index]
+            target_frame = next_keys.get((local_index, frame)) if next_keys is not None else None
+            row = animation_cache.row(frame if target_frame is None else target_frame); column = animation_cache.column(obj.name)
+            rows.append(row); columns.append(column); morph.append(bool(animation_cache.solidify[row, column]) and solidify_morphs(obj))
+    rows = np.asarray(rows, dtype=np.intp); columns = np.asarray(columns, dtype=np.intp); morph = np.asarray(morph, dtype=np.bool_)
+    final_matrices = np.empty((len(rows), 4, 4))
+    for start in range(0, len(rows), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        final_matrices[chunk] = transforms.minecraft_matrices(animation_cache.transforms[rows[chunk], columns[chunk]], props.invert_normals_on_export, morph[chunk])
+    offsets = np.cumsum([0] + [len(keyframes[frame]) for frame in frames])
+    return {frame: final_matrices[offsets[i]:offsets[i + 1]] for i, frame in enumerate(frames)}
+
+def spread_commands(frame_commands, movable, cap, start_interpolation, reserved=None):
+    """Moves interpolated merges out of ticks with more than cap commands into earlier ticks with room. reserved maps
+    ticks to the commands other chains already run on them, which count against the cap too.
+
+    movable[frame] lists (position, not_before, body_at) of merges in frame_commands[frame]. A merge sent k ticks
+    early is rebuilt with body_at(start_interpolation + k) so it still starts moving on its keyframe. not_before is
+    the tick the same block's previous interpolation ends: new data freezes a display where it is until its delayed
+    start, so a merge sent into that window would cut the previous movement short. Merges with the least room go first."""
+    counts = dict(reserved or {})
+    for frame, commands in frame_commands.items(): counts[frame] = counts.get(frame, 0) + len(commands)
+    spread = {frame: list(commands) for frame, commands in frame_commands.items()}
+    for frame in sorted(frame_commands):
+        excess = counts[frame] - cap
+        if excess <= 0: continue
+        moved = set()
+        for position, not_before, body_at in sorted(movable.get(frame, ()), key=lambda entry: -entry[1]):
+            if excess <= 0: break
+            for tick in range(frame - 1, not_before - 1, -1):
+                if counts.get(tick, 0) >= cap: continue
+                spread.setdefault(tick, []).append(replace(frame_commands[frame][position], body=body_at(start_interpolation + frame - tick)))
+                counts[tick] = counts.get(tick, 0) + 1; counts[frame] -= 1; excess -= 1; moved.add(position)
+                break
+        spread[frame] = [command for position, command in enumerate(frame_commands[frame]) if position not in moved]
+    return spread
+
+def generate_keyframes(props, writer, kf_path, scene_name, ns, all_objects, obj_type_filter, command_formatter, keyframes, start_frame, end_frame, animation_cache, sid_map={}, next_keys=None, reserved=None):
+    """Writes one function per keyframe tick. reserved maps ticks to the commands other chains run on them, for spreading. Returns the command count of every tick before and after spreading, the
+    ticks in file order, and (commands, execute-prefixed commands) of the keyframe functions before and after the optimizer."""
     if not keyframes:
-        os.makedirs(kf_path, exist_ok=True)
-        with open(os.path.join(kf_path, "0.mcfunction"), 'w', encoding='utf-8') as f: f.write(utils.watermark + "# No keyframes for this object type.")
-        return
-    path_map = {'BLOCK': 'blocks', 'ENTITY': 'entity'}; path_segment = path_map.get(obj_type_filter, obj_type_filter.lower())
+        writer.write(f"{kf_path}/0.mcfunction", watermark + "# No keyframes for this object type.")
+        return {}, {}, [], ((0, 0), (0, 0))
+    path_map = {'BLOCK': 'blocks', 'GROUP': 'groups', 'ENTITY': 'entity'}; path_segment = path_map.get(obj_type_filter, obj_type_filter.lower())
+    filtered_objects = [obj for obj in all_objects if obj.object_type == obj_type_filter]
     sorted_frames = sorted(keyframes.keys())
-    last_known_states = {}
+    shared = {}; frame_commands = {}; movable = {}; last_merge = {}
+    if obj_type_filter == 'BLOCK':
+        converted = convert_block_matrices(props, filtered_objects, keyframes, animation_cache, next_keys)
+        formatter = nbt.MatrixFormatter(); shared['fragments'] = block_fragments(props, scene_name, ns)
+    others = {'tracking_target': next((k for k, obj in enumerate(filtered_objects) if obj.is_tracking_target), None)} if obj_type_filter == 'ENTITY' else {}
     for i, frame in enumerate(sorted_frames):
-        frame_cmds = []; frame_data = keyframes[frame]
-        for obj_index_local, (obj, data) in frame_data.items():
-            prev_frame_state = animation_cache[obj.name].get(frame - 1) if frame > start_frame else data
-            prev_data = last_known_states.get(obj, prev_frame_state)
-            frame_cmds.extend(command_formatter(props, scene_name, ns, obj_index_local, obj, data, prev_data, sid_map, is_first_keyframe=(i == 0)))
-            last_known_states[obj] = data
-        is_last_keyframe = (i + 1 == len(sorted_frames))
+        frame_cmds = frame_commands[frame] = []; prev_frame = sorted_frames[i - 1] if i > 0 else frame
+        if shared: matrix_strings = formatter.format_many(converted.pop(frame))
+        for j, obj_index_local in enumerate(keyframes[frame]):
+            obj = filtered_objects[obj_index_local]
+            data = animation_cache.state(obj.name, frame); prev_data = animation_cache.state(obj.name, prev_frame)
+            extra = dict(shared, matrix_str=matrix_strings[j]) if shared else others
+            if next_keys is None:
+                commands = command_formatter(props, scene_name, ns, obj_index_local, obj, data, prev_data, sid_map, is_first_keyframe=(i == 0), **extra)
+            else:
+                next_frame = next_keys.get((obj_index_local, frame))
+                target_data = animation_cache.state(obj.name, next_frame) if next_frame is not None else data
+                duration = next_frame - frame if next_frame is not None else 0
+                commands = command_formatter(props, scene_name, ns, obj_index_local, obj, data, prev_data, sid_map, is_first_keyframe=(i == 0), target_state=target_data, duration=duration, **extra)
+            if shared and props.use_interpolation and commands and commands[-1].target:
+                merge_duration = props.interpolation_duration if next_keys is None else duration
+                if i > 0:
+                    prev_tick, prev_end = last_merge.get(obj_index_local, (sorted_frames[0], sorted_frames[0]))
+                    body_at = functools.partial(block_merge_body, commands[-1].target, matrix_strings[j], data[3], data[2], merge_duration)
+                    movable.setdefault(frame, []).append((len(frame_cmds) + len(commands) - 1, max(prev_tick + 1, prev_end), body_at))
+                last_merge[obj_index_local] = (frame, frame + props.start_interpolation + merge_duration)
+            frame_cmds.extend(commands)
+
+    counts_before = {frame: len(commands) for frame, commands in frame_commands.items()}
+    if props.max_commands_per_tick > 0 and movable:
+        frame_commands = spread_commands(frame_commands, movable, props.max_commands_per_tick, props.start_interpolation, reserved)
+    counts_after = {frame: len(commands) for frame, commands in frame_commands.items()}
+
+    sorted_ticks = sorted(frame_commands); functions = []
+    for i, frame in enumerate(sorted_ticks):
+        frame_cmds = frame_commands[frame]; functions.append(frame_cmds)
+        if uses_clock(props): continue
+        if i == 0 and props.pause_support:
+            frame_cmds.insert(0, Command(f"execute store result score {pause_holder(scene_name, path_segment)} mca_start run time query gametime"))
+        is_last_keyframe = (i + 1 == len(sorted_ticks))
         if not is_last_keyframe:
-            delay = sorted_frames[i+1] - frame
-            frame_cmds.append(f"execute if entity @e[tag={scene_name}_playing] run schedule function {ns}:animations/scenes/{scene_name}/keyframes/{path_segment}/{i + 1} {delay}t")
+            delay = sorted_ticks[i+1] - frame
+            frame_cmds.append(Command(f"schedule function {ns}:animations/scenes/{scene_name}/keyframes/{path_segment}/{i + 1} {delay}t", scene_has_tag(props, ns, scene_name, 'playing'), free=True))
         else:
             delay = (end_frame - frame) + 1
-            frame_cmds.append(f"execute if entity @e[tag={scene_name}_looping] run schedule function {ns}:animations/scenes/{scene_name}/keyframes/{path_segment}/0 {delay}t")
-        if props.pause_support:
-            frame_cmds.append(f"execute if entity @e[tag={scene_name}_paused] run schedule function {ns}:animations/scenes/{scene_name}/keyframes/{path_segment}/{i} 1t")
-        with open(os.path.join(kf_path, f"{i}.mcfunction"), 'w', encoding='utf-8') as f:
-            f.write(utils.watermark + "\n".join(frame_cmds))
-
-def generate_custom_command_files(props, commands_path, scene_name, ns, all_objects, sid_map={}):
-    entity_objects = [obj for obj in all_objects if obj.mc_props.object_type == 'ENTITY']
+            frame_cmds.append(Command(f"schedule function {ns}:animations/scenes/{scene_name}/keyframes/{path_segment}/0 {delay}t", scene_has_tag(props, ns, scene_name, 'looping'), free=True))
+
+    optimized = optimize_functions(props, writer, kf_path, f"{ns}:animations/scenes/{scene_name}/keyframes/{path_segment}", functions)
+    stats = (count_stats(functions), count_stats(optimized))
+    for i, function in enumerate(optimized):
+        lines = [command.render() for command in function]
+        if is_instanced(props) and any("$(" in line for line in lines):
+            writer.write(f"{kf_path}/apply/{i}.mcfunction", watermark + "\n".join(macro_lines(lines)))
+            lines = instance_macro_call(ns, scene_name, f"{ns}:animations/scenes/{scene_name}/keyframes/{path_segment}/apply/{i}")
+        writer.write(f"{kf_path}/{i}.mcfunction", watermark + "\n".join(lines or ["# Nothing changes on this tick."]))
+    return counts_before, counts_after, sorted_ticks, stats
+
+def generate_instance_wrappers(props, writer, main_path, scene_name, ns):
+    """Scene functions of an instanced scene act on the ref entity running them, or else on the nearest instance."""
+    names = ['play', 'loop', 'stop', 'goto_frame', 'seek', 'set_speed', 'remove'] + (['pause', 'resume'] if props.pause_support else [])
+    ref_selector = f"type=block_display,tag={scene_name}_ref"
+    for name in names:
+        function = f"{ns}:animations/scenes/{scene_name}/instance/{name}"
+        writer.write(f"{main_path}/{name}.mcfunction", watermark + "\n".join([
+            f"execute if entity @s[{ref_selector}] at @s run function {function}",
+            f"execute unless entity @s[{ref_selector}] as @e[{ref_selector},sort=nearest,limit=1] at @s run function {function}"
+        ]))
+
+def optimize_functions(props, writer, function_path, function_name, functions):
+    """Runs the enabled optimizer passes over one chain's keyframe functions, given in the order they play."""
+    version_details = VERSION_MAP.get(props.minecraft_version, VERSION_MAP['1.21'])
+    if props.optimize_drop_noop_merges: functions = drop_noop_merges(functions)
+    if props.optimize_fill_regions: functions = [merge_setblocks(function) for function in functions]
+    if props.optimize_hoist_guards and version_details['early_return']: functions = [hoist_guard(function) for function in functions]
+    if props.optimize_group_contexts:
+        grouped = []
+        for i, function in enumerate(functions):
+            names = []
+            def sub_function(bodies):
+                names.append(f"{i}_{len(names)}")
+                writer.write(f"{function_path}/groups/{names[-1]}.mcfunction", watermark + "\n".join(bodies))
+                return f"{function_name}/groups/{names[-1]}"
+            grouped.append(group_contexts(function, sub_function))
+        functions = grouped
+    return functions
+
+def generate_custom_command_files(props, writer, commands_path, scene_name, ns, all_objects, sid_map={}):
+    entity_objects = [obj for obj in all_objects if obj.object_type == 'ENTITY']
     for obj in entity_objects:
-        mc_props = obj.mc_props
-        if mc_props.use_custom_commands and mc_props.sid:
+        if obj.use_custom_commands and obj.sid:
             final_sid = sid_map.get(obj)
             if not final_sid: continue
-            file_path = os.path.join(commands_path, f"{final_sid}.mcfunction")
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(utils.watermark); f.write(f"# Custom commands for SID: {mc_props.sid} (Object: {obj.name})\n")
-                for command_item in mc_props.custom_commands:
-                    if command_item.command.strip(): f.write(f"{command_item.command.strip()}\n")
-
-def format_block_command(props, scene_name, ns, obj_index, obj, current_state, prev_state, sid_map, is_first_keyframe=False):
-    mc_props = obj.mc_props; commands = []
+            lines = [f"# Custom commands for SID: {obj.sid} (Object: {obj.name})\n"]
+            for command in obj.custom_commands:
+                if command.strip(): lines.append(f"{command.strip()}\n")
+            writer.write(f"{commands_path}/{final_sid}.mcfunction", watermark + "".join(lines))
+
+def block_fragments(props, scene_name, ns):
+    """Command pieces every block merge of an export shares, built once instead of per command."""
+    return {
+        'ref': ref_entity(props, ns, scene_name),
+        'guard': "" if uses_clock(props) else scene_has_tag(props, ns, scene_name, 'playing'),
+        'targets': {}
+    }
+
+def format_block_command(props, scene_name, ns, obj_index, obj, current_state, prev_state, sid_map, is_first_keyframe=False, target_state=None, duration=None, matrix_str=None, fragments=None):
+    commands = []
     world_matrix, is_solidified, block_light, sky_light = current_state
     _, was_solidified, _, _ = prev_state if prev_state else (None, None, 0, 0)
+    if fragments is None: fragments = block_fragments(props, scene_name, ns)
     if is_solidified != was_solidified:
-        loc = world_matrix.to_translation()
-        mc_x = -loc.x; mc_y = loc.z; mc_z = loc.y
+        mc_x = -float(world_matrix[0][3]); mc_y = float(world_matrix[2][3]); mc_z = float(world_matrix[1][3])
         block_pos = f"~{round(mc_x)} ~{round(mc_y)} ~{round(mc_z)}"
-        solidify_id = mc_props.solidify_as.strip() or mc_props.block_id.strip()
-        if is_solidified: commands.append(f"execute at @e[tag={scene_name}_ref] run setblock {block_pos} {solidify_id}")
-        else: commands.append(f"execute at @e[tag={scene_name}_ref] run setblock {block_pos} minecraft:air")
-    if is_first_keyframe or not utils.are_states_equal(current_state, prev_state):
-        final_matrix_input = world_matrix
-        solidify_id = mc_props.solidify_as.strip() or mc_props.block_id.strip()
-        if is_solidified and 'barrier' not in solidify_id:
-            final_matrix_input = utils.get_morphed_matrix(world_matrix, mathutils.Vector((0.001, 0.001, 0.001)))
-        final_matrix = utils.get_final_minecraft_matrix(final_matrix_input, props)
-        matrix_str = utils.format_matrix(final_matrix)
-        interp_str = f",interpolation_duration:{props.interpolation_duration},start_interpolation:{props.start_interpolation}" if props.use_interpolation else ""
-        brightness_nbt = f',brightness:{{sky:{sky_light},block:{block_light}}}'
-        target_tag = f"{scene_name}_block_{obj_index}"
-        command_prefix = f"execute if entity @e[tag={scene_name}_playing] run "
-        nbt_to_merge = f"{{transformation:[{matrix_str}]{brightness_nbt}{interp_str}}}"
-        commands.append(f"{command_prefix}data merge entity @e[type=block_display,tag={target_tag},limit=1] {nbt_to_merge}")
+        solidify_id = obj.solidify_as.strip() or obj.block_id.strip()
+        if is_solidified: commands.append(Command(f"setblock {block_pos} {solidify_id}", context=f"at {fragments['ref']}", free=True))
+        else: commands.append(Command(f"setblock {block_pos} minecraft:air", context=f"at {fragments['ref']}", free=True))
+    if is_first_keyframe or target_state is not None or not transforms.are_states_equal(current_state, prev_state):
+        if matrix_str is None:
+            target_matrix, target_solidified, _, _ = target_state if target_state is not None else current_state
+            final_matrix = transforms.minecraft_matrices(target_matrix, props.invert_normals_on_export, [target_solidified and solidify_morphs(obj)])[0]
+            matrix_str = transforms.format_matrix(final_matrix)
+        interpolation_duration = props.interpolation_duration if duration is None else duration
+        target = fragments['targets'].get(obj_index)
+        if target is None:
+            target = fragments['targets'][obj_index] = scene_entity(props, ns, scene_name, f"block_{obj_index}", f"@e[type=block_display,tag={scene_name}_block_{obj_index},limit=1]")
+        start = props.start_interpolation if props.use_interpolation else None
+        commands.append(Command(block_merge_body(target, matrix_str, sky_light, block_light, interpolation_duration, start), fragments['guard'], target=target))
     return commands
 
-def format_entity_command(props, scene_name, ns, obj_index, obj, state, prev_state, sid_map, is_first_keyframe=False):
-    mc_props = obj.mc_props; location = state[0].to_translation()
-    mc_x = -location.x; mc_y = location.z; mc_z = location.y
+def block_merge_body(target, matrix_str, sky_light, block_light, duration, start=None):
+    """The data merge of one block display; start None leaves interpolation out."""
+    interp_str = nbt.interpolation(duration, start) if start is not None else ""
+    return f"data merge entity {target} {{transformation:[{matrix_str}]{nbt.brightness(sky_light, block_light)}{interp_str}}}"
+
+def format_group_command(props, scene_name, ns, obj_index, group, state, prev_state, sid_map, is_first_keyframe=False):
+    offset = state[0][:3, 3] - group.origin
+    vehicle = f"@e[type=block_display,tag={scene_name}_group_{obj_index},limit=1]"
+    context = "" if is_instanced(props) else f"as {ref_entity(props, ns, scene_name)} at @s"
+    return [Command(f"tp {scene_entity(props, ns, scene_name, f'group_{obj_index}', vehicle)} ~{-float(offset[0]):.3f} ~{float(offset[2]):.3f} ~{float(offset[1]):.3f}", context=context)]
+
+def format_entity_command(props, scene_name, ns, obj_index, obj, state, prev_state, sid_map, is_first_keyframe=False, tracking_target=None):
+    world_matrix = state[0]; commands = []
+    mc_x = -float(world_matrix[0][3]); mc_y = float(world_matrix[2][3]); mc_z = float(world_matrix[1][3])
     target_tag = f"{scene_name}_entity_{obj_index}"
-    main_cmd = f"execute as @e[tag={scene_name}_ref] at @s run tp @e[tag={target_tag},limit=1,sort=nearest] ~{mc_x:.3f} ~{mc_y:.3f} ~{mc_z:.3f}"
+    follows_others = props.dynamic_tracking and props.tracking_mode in ('PLAYER', 'TARGET')
+    moved = is_first_keyframe or follows_others or not transforms.are_matrices_close(world_matrix[:3, 3], prev_state[0][:3, 3])
+    ref = ref_entity(props, ns, scene_name)
+    target = scene_entity(props, ns, scene_name, f"entity_{obj_index}", f"@e[tag={target_tag},limit=1,sort=nearest]")
+    main_cmd = f"tp {target} ~{mc_x:.3f} ~{mc_y:.3f} ~{mc_z:.3f}"
     if props.dynamic_tracking and props.tracking_mode != 'OFF':
         anchor = props.global_tracking_anchor.lower()
-        if props.global_tracking_anchor == 'INDIVIDUAL': anchor = mc_props.tracking_anchor
-        if props.tracking_mode == 'CENTER': main_cmd += f" facing entity @e[tag={scene_name}_ref,limit=1,sort=nearest] {anchor}"
+        if props.global_tracking_anchor == 'INDIVIDUAL': anchor = obj.tracking_anchor
+        if props.tracking_mode == 'CENTER': main_cmd += f" facing entity {ref if is_instanced(props) else scene_entity(props, ns, scene_name, 'ref', f'@e[tag={scene_name}_ref,limit=1,sort=nearest]')} {anchor}"
         elif props.tracking_mode == 'PLAYER': main_cmd += f" facing entity @p {anchor}"
-        elif props.tracking_mode == 'TARGET': main_cmd += f" facing entity @e[tag=target,limit=1,sort=nearest] {anchor}"
-    commands = [main_cmd]
-    if mc_props.use_custom_commands and mc_props.sid:
+        elif props.tracking_mode == 'TARGET': main_cmd += f" facing entity {scene_entity(props, ns, scene_name, f'entity_{tracking_target}', '') if is_instanced(props) and tracking_target is not None else '@e[tag=target,limit=1,sort=nearest]'} {anchor}"
+    if moved: commands.append(Command(main_cmd, context="" if is_instanced(props) else f"as {ref} at @s"))
+    if obj.use_custom_commands and obj.sid:
         final_sid = sid_map.get(obj)
         if final_sid:
-            commands.append(f"execute as @e[tag={target_tag}] at @s run function {ns}:animations/scenes/{scene_name}/keyframes/entity/commands/{final_sid}")
+            guard = f"unless score {clock_holder(props, scene_name)} mca_seek matches 1" if uses_clock(props) else ""
+            commands.append(Command(f"function {ns}:animations/scenes/{scene_name}/keyframes/entity/commands/{final_sid}", guard, f"as {scene_entity(props, ns, scene_name, f'entity_{obj_index}', f'@e[tag={target_tag}]')} at @s"))
     return commands
 
-def generate_model_files(context, props, model_base_path, model_name, all_objects):
-    model_dir = os.path.join(model_base_path, model_name)
-    os.makedirs(model_dir, exist_ok=True)
+def generate_model_files(props, writer, model_base_path, model_name, all_objects, animation_cache, frame, static_boxes=()):
+    model_dir = f"{model_base_path}/{model_name}"
     
     ref_tag = f"{model_name}_ref"
     all_passengers = []
     
-    original_frame = context.scene.frame_current
-    context.scene.frame_set(props.model_export_frame)
-    
-    block_objects = [obj for obj in all_objects if obj.mc_props.object_type == 'BLOCK' and props.export_blocks]
-    if block_objects:
+    block_objects = [obj for obj in all_objects if obj.object_type == 'BLOCK' and props.export_blocks]
+    if block_objects or static_boxes:
         block_display_passengers = []
+        final_matrices = transforms.minecraft_matrices(animation_cache.transforms[animation_cache.row(frame), [animation_cache.column(obj.name) for obj in block_objects]], props.invert_normals_on_export)
+        matrix_strings = nbt.MatrixFormatter().format_many(final_matrices)
         for i, obj in enumerate(block_objects):
-            mc_props = obj.mc_props; world_matrix = obj.matrix_world.copy()
-            final_matrix = utils.get_final_minecraft_matrix(world_matrix, props)
-            matrix_str = utils.format_matrix(final_matrix)
-            block_id = mc_props.block_id.strip(); tags = [f"{model_name}_block_{i}", "mca_model"]
+            _, _, block_light, sky_light = animation_cache.state(obj.name, frame)
+            matrix_str = matrix_strings[i]
+            block_id = obj.block_id.strip(); tags = [f"{model_name}_block_{i}", "mca_model"]
             tags_nbt = ",".join([f'"{tag}"' for tag in tags])
-            brightness_nbt = f',brightness:{{sky:{mc_props.sky_light_level},block:{mc_props.block_light_level}}}'
+            brightness_nbt = nbt.brightness(sky_light, block_light)
             block_display_passengers.append(f'{{id:"minecraft:block_display",block_state:{{Name:"{block_id}"}},transformation:[{matrix_str}],Tags:[{tags_nbt}]{brightness_nbt}}}')
+        block_display_passengers += static_block_passengers(static_boxes, f'"{model_name}_static","mca_model"')
         parent_tag = f"{model_name}_blocks"
         passengers_str = ",".join(block_display_passengers)
         all_passengers.append(f'{{id:"minecraft:block_display",Tags:["{parent_tag}","mca_model"],Passengers:[{passengers_str}]}}')
 
-    entity_objects = [obj for obj in all_objects if obj.mc_props.object_type == 'ENTITY' and props.export_entities]
+    entity_objects = [obj for obj in all_objects if obj.object_type == 'ENTITY' and props.export_entities]
     for i, obj in enumerate(entity_objects):
-        mc_props = obj.mc_props; world_matrix = obj.matrix_world.copy()
-        loc, _, _ = world_matrix.decompose()
-        rel_x = loc.x; rel_y = loc.y; rel_z = loc.z
-        mc_x = -rel_x; mc_y = rel_z; mc_z = rel_y
+        world_matrix = animation_cache.matrix(obj.name, frame)
+        mc_x = -float(world_matrix[0][3]); mc_y = float(world_matrix[2][3]); mc_z = float(world_matrix[1][3])
         tags = [f"{model_name}_entity_{i}", "mca_model"]
-        if mc_props.is_tracking_target: tags.append("target")
+        if obj.is_tracking_target: tags.append("target")
         tags_nbt = ",".join([f'"{tag}"' for tag in tags])
-        custom_nbt = f",{mc_props.custom_nbt.strip()}" if mc_props.custom_nbt else ""
-        all_passengers.append(f'{{id:"{mc_props.entity_id}",Pos:[{mc_x:.3f}d,{mc_y:.3f}d,{mc_z:.3f}d],Tags:[{tags_nbt}]{custom_nbt}}}')
+        custom_nbt = f",{obj.custom_nbt.strip()}" if obj.custom_nbt else ""
+        all_passengers.append(f'{{id:"{obj.entity_id}",Pos:[{mc_x:.3f}d,{mc_y:.3f}d,{mc_z:.3f}d],Tags:[{tags_nbt}]{custom_nbt}}}')
         
-    passengers_nbt_str = f"Passengers:[{','.join(all_passengers)}]" if all_passengers else ""
+    passengers_nbt_str = f"Passengers:[{','.join(all_passengers)}]" if all_passengers and not is_instanced(props) else ""
     
     custom_name_nbt = f"CustomName:'{{\"text\":\"{model_name}\"}}',CustomNameVisible:false"
     create_cmds = [f'summon block_display ~ ~ ~ {{block_state:{{Name:"minecraft:air"}},Tags:["{ref_tag}","mca_model"],{custom_name_nbt},{passengers_nbt_str}}}']
     
-    context.scene.frame_set(original_frame)
-    
-    with open(os.path.join(model_dir, "create.mcfunction"), 'w', encoding='utf-8') as f:
-        f.write(utils.watermark + "\n".join(create_cmds))
+    writer.write(f"{model_dir}/create.mcfunction", watermark + "\n".join(create_cmds))
         
     remove_cmds = [f"kill @e[tag={ref_tag}]"]
-    if block_objects:
+    if static_boxes: remove_cmds.append(f"kill @e[type=block_display,tag={model_name}_static]")
+    if block_objects or static_boxes:
         remove_cmds.append(f"kill @e[tag={model_name}_blocks]")
         for i in range(len(block_objects)): remove_cmds.append(f"kill @e[tag={model_name}_block_{i}]")
     for i in range(len(entity_objects)): remove_cmds.append(f"kill @e[tag={model_name}_entity_{i}]")
-    with open(os.path.join(model_dir, "remove.mcfunction"), 'w', encoding='utf-8') as f:
-        f.write(utils.watermark + "\n".join(remove_cmds))
+    writer.write(f"{model_dir}/remove.mcfunction", watermark + "\n".join(remove_cmds))
         
     move_cmd = f"tp @e[type=block_display,tag={ref_tag},sort=nearest,limit=1] @s"
-    with open(os.path.join(model_dir, "move.mcfunction"), 'w', encoding='utf-8') as f:
-        f.write(utils.watermark + move_cmd)
\ No newline at end of file
+    writer.write(f"{model_dir}/move.mcfunction", watermark + move_cmd)
+
+
+def merge_static_blocks(props, all_objects, animation_cache, frame, static_only=False):
+    """Replaces boxes of grid-aligned blocks that share their block, light and rotation with one scaled block_display.
+
+    Only blocks matching merge_block_pattern take part, since a scaled display stretches its texture instead of
+    tiling it; with static_only, also only blocks that never change over the cache's range. Returns the objects left
+    to export one by one, the merged boxes as [(block id, transformation, block light, sky light)] and how many
+    display entities the merge saves."""
+    if not (props.export_blocks and props.merge_static_blocks): return all_objects, [], 0
+    patterns = [pattern.strip() for pattern in props.merge_block_pattern.split(",") if pattern.strip()]
+    block_objects = [obj for obj in all_objects if obj.object_type == 'BLOCK']
+    columns = [animation_cache.column(obj.name) for obj in block_objects]; row = animation_cache.row(frame)
+    eligible = np.array([any(fnmatch.fnmatchcase(obj.block_id.strip(), pattern) for pattern in patterns) for obj in block_objects], dtype=np.bool_)
+    if static_only and len(columns):
+        eligible &= ~animation_cache.frame_changes(columns)[1:].any(axis=0) & ~animation_cache.solidify[row, columns]
+    candidates = np.flatnonzero(eligible).tolist()
+    if len(candidates) < 2: return all_objects, [], 0
+    matrices = transforms.minecraft_matrices(animation_cache.transforms[row, [columns[i] for i in candidates]], props.invert_normals_on_export)
+    groups = {}
+    for k, i in enumerate(candidates):
+        linear = matrices[k, :3, :3]
+        if abs(np.linalg.det(linear)) < 1e-6: continue
+        light = (int(animation_cache.block_light[row, columns[i]]), int(animation_cache.sky_light[row, columns[i]]))
+        groups.setdefault((block_objects[i].block_id.strip(), light, tuple(np.round(linear, 4).ravel().tolist())), []).append(k)
+    boxes = []; merged = set()
+    for (block_id, light, _), members in groups.items():
+        if len(members) < 2: continue
+        linear = matrices[members[0], :3, :3]
+        local = matrices[members, :3, 3] @ np.linalg.inv(linear).T
+        offsets = np.round(local - np.round(local), 3); cells = {}
+        for k, offset, cell in zip(members, map(tuple, offsets.tolist()), np.round(local - offsets).astype(np.int64).tolist()):
+            cells.setdefault(offset, {}).setdefault(tuple(cell), k)
+        for offset, grid in cells.items():
+            for low, high in fill_boxes(grid):
+                if low == high: continue
+                size = np.array(high) - np.array(low) + 1; matrix = np.eye(4)
+                matrix[:3, :3] = linear * size; matrix[:3, 3] = linear @ (np.array(low) + np.array(offset))
+                boxes.append((block_id, matrix, *light))
+                merged.update(block_objects[candidates[grid[(x, y, z)]]] for x in range(low[0], high[0] + 1) for y in range(low[1], high[1] + 1) for z in range(low[2], high[2] + 1))
+    return [obj for obj in all_objects if obj not in merged], boxes, len(merged) - len(boxes)
+
+def find_rigid_groups(props, all_objects, animation_cache, min_size=2, tolerance=1e-4):
+    """Clusters moving blocks whose rotation, scale, light and solidify never change and whose translations follow
+    the same path within tolerance, so one vehicle teleport can replace their merges. Returns the objects left and
+    the groups.
+
+    Passengers are moved with their vehicle but not turned by it, which is why only translating clusters qualify.
+    Before 1.20.2 a vehicle cannot interpolate its teleports, so interpolated scenes keep every block on its own."""
+    version_details = VERSION_MAP.get(props.minecraft_version, VERSION_MAP['1.21'])
+    if not (props.export_blocks and props.detect_rigid_groups): return all_objects, []
+    if props.use_interpolation and not version_details['teleport_duration']: return all_objects, []
+    block_objects = [obj for obj in all_objects if obj.object_type == 'BLOCK']
+    if len(block_objects) < min_size or animation_cache.frame_count < 2: return all_objects, []
+    columns = np.array([animation_cache.column(obj.name) for obj in block_objects], dtype=np.intp)
+    matrices = animation_cache.transforms[:, columns].reshape(animation_cache.frame_count, len(columns), 4, 4)
+    linear = matrices[:, :, :3, :3]
+    eligible = (np.abs(linear - linear[:1]).max(axis=(0, 2, 3)) < tolerance) & ~animation_cache.solidify[:, columns].any(axis=0)
+    for lights in (animation_cache.block_light, animation_cache.sky_light): eligible &= (lights[:, columns] == lights[:1, columns]).all(axis=0)
+    paths = (matrices[:, :, :3, 3] - matrices[:1, :, :3, 3]).astype(np.float64).transpose(1, 0, 2)
+    eligible &= np.abs(paths).max(axis=(1, 2)) >= tolerance
+    leaders = []; clusters = []
+    for i in np.flatnonzero(eligible).tolist():
+        close = np.flatnonzero(np.abs(paths[leaders] - paths[i]).max(axis=(1, 2)) < tolerance) if leaders else ()
+        if len(close): clusters[close[0]].append(i)
+        else: leaders.append(i); clusters.append([i])
+    groups = []; grouped = set()
+    for members in clusters:
+        if len(members) < min_size: continue
+        leader = block_objects[members[0]]
+        groups.append(RigidGroup(leader.name, [block_objects[i] for i in members], matrices[0, members[0], :3, 3].astype(np.float64)))
+        grouped.update(block_objects[i] for i in members)
+    return [obj for obj in all_objects if obj not in grouped], groups
+
+def static_block_passengers(boxes, tags_nbt):
+    matrix_strings = nbt.MatrixFormatter().format_many([matrix for _, matrix, _, _ in boxes])
+    return [f'{{id:"minecraft:block_display",block_state:{{Name:"{block_id}"}},transformation:[{matrix_str}],Tags:[{tags_nbt}]{nbt.brightness(sky_light, block_light)}}}'
+            for (block_id, _, block_light, sky_light), matrix_str in zip(boxes, matrix_strings)]
+
+def assign_sids(all_objects):
+    sid_map = {}; used_sids = set()
+    for obj in all_objects:
+        if obj.object_type == 'ENTITY' and obj.use_custom_commands and obj.sid:
+            base_sid = sanitize_name(obj.sid); final_sid = base_sid; count = 1
+            while final_sid in used_sids: final_sid = f"{base_sid}_{count}"; count += 1
+            used_sids.add(final_sid); sid_map[obj] = final_sid
+    return sid_map
+
+def animation_paths(props):
+    version_details = VERSION_MAP.get(props.minecraft_version, VERSION_MAP['1.21'])
+    base_path = function_root(version_details, sanitize_name(props.namespace)); scene_name = sanitize_name(props.scene_name)
+    return f"{base_path}/animations/scenes/{scene_name}", f"{base_path}/animations/_main/{scene_name}"
+
+def model_path(props):
+    version_details = VERSION_MAP.get(props.minecraft_version, VERSION_MAP['1.21'])
+    return f"{function_root(version_details, sanitize_name(props.namespace))}/models/{sanitize_name(props.scene_name)}"
+
+COMPILE_STAGES = ('analysis', 'keyframes', 'functions', 'chains', 'finishing')
+
+def compile_animation(props, all_objects, animation_cache, writer):
+    """Writes the whole animation datapack for the given ObjectSpecs and their sampled states into writer and returns export statistics."""
+    return run_steps(compile_animation_steps(props, all_objects, animation_cache, writer))
+
+def compile_animation_steps(props, all_objects, animation_cache, writer):
+    """compile_animation as a generator for callers that export in time slices or time its stages. After each piece of
+    work it yields (stage, progress from 0 to 1), stage being the COMPILE_STAGES entry the piece belonged to. The export
+    statistics are its return value."""
+    version_details = VERSION_MAP.get(props.minecraft_version, VERSION_MAP['1.21'])
+    if is_instanced(props) and not version_details['early_return']: raise ValueError("The Instanced Clock needs Minecraft 1.20.3 or newer")
+    ns = sanitize_name(props.namespace); scene_name = sanitize_name(props.scene_name)
+    scenes_path, main_path = animation_paths(props)
+    start_frame = animation_cache.start_frame; end_frame = animation_cache.end_frame
+    all_objects, static_boxes, merged_entities = merge_static_blocks(props, all_objects, animation_cache, start_frame, static_only=True)
+    all_objects, rigid_groups = find_rigid_groups(props, all_objects, animation_cache)
+    yield 'analysis', 0.05
+
+    block_kfs = {}; entity_kfs = {}; block_next_keys = None
+    if props.export_blocks and props.use_interpolation and props.use_decimation:
+        block_kfs, block_next_keys = get_decimated_keyframes(props, all_objects, 'BLOCK', animation_cache, start_frame, end_frame)
+    elif props.export_blocks:
+        block_kfs = get_optimized_keyframes(props, all_objects, 'BLOCK', animation_cache, start_frame, end_frame)
+    yield 'keyframes', 0.2
+    if props.export_entities:
+        entity_kfs = get_entity_keyframes(props, all_objects, animation_cache, start_frame, end_frame)
+    group_kfs = get_optimized_keyframes(props, rigid_groups, 'GROUP', animation_cache, start_frame, end_frame, position_only=True)
+    yield 'keyframes', 0.25
+
+    if not uses_clock(props):
+        generate_main_functions(props, writer, main_path, scene_name, ns, all_objects, start_frame, block_kfs, entity_kfs, group_kfs)
+    generate_create_commands(props, writer, main_path, scene_name, ns, all_objects, start_frame, animation_cache, static_boxes, rigid_groups)
+    sid_map = assign_sids(all_objects)
+    kf_base_path = f"{scenes_path}/keyframes"
+    generate_custom_command_files(props, writer, f"{kf_base_path}/entity/commands", scene_name, ns, all_objects, sid_map)
+    tick_counts = []; dispatch_lines = []; first_keyframes = []; pause_chains = []; optimizer_counts = []
+    chains = [('blocks', 'BLOCK', format_block_command, block_kfs, block_next_keys, props.export_blocks), ('groups', 'GROUP', format_group_command, group_kfs, None, props.export_blocks),
+              ('entity', 'ENTITY', format_entity_command, entity_kfs, None, props.export_entities)]
+    chains = [chain for chain in chains if chain[5] and chain[3]]
+    weights = [sum(len(changed) for changed in chain[3].values()) for chain in chains]; done = 0
+    yield 'functions', 0.3
+    results = {}
+    for index in sorted(range(len(chains)), key=lambda k: chains[k][1] == 'BLOCK'):
+        segment, obj_type, formatter, kfs, next_keys, _ = chains[index]
+        reserved = {}
+        for _, after, _, _ in results.values():
+            for frame, count in after.items(): reserved[frame] = reserved.get(frame, 0) + count
+        results[index] = generate_keyframes(props, writer, f"{kf_base_path}/{segment}", scene_name, ns, all_objects + rigid_groups, obj_type, formatter, kfs, start_frame, end_frame, animation_cache, sid_map, next_keys, reserved)
+        done += weights[index]; yield 'chains', 0.3 + 0.65 * done / max(sum(weights), 1)
+    for index, (segment, *_) in enumerate(chains):
+        before, after, ticks, optimizer = results[index]
+        tick_counts.append((before, after)); pause_chains.append((segment, ticks)); optimizer_counts.append(optimizer)
+        if uses_clock(props):
+            keyframe_function = f"{ns}:animations/scenes/{scene_name}/keyframes/{segment}"; first_keyframes.append(f"{keyframe_function}/0")
+            dispatch_lines.append(write_dispatch_tree(writer, f"{scenes_path}/dispatch/{segment}", f"{ns}:animations/scenes/{scene_name}/dispatch/{segment}", keyframe_function, [tick - start_frame for tick in ticks], clock_holder(props, scene_name)))
+    if uses_clock(props):
+        control_path = f"{scenes_path}/instance" if is_instanced(props) else main_path
+        generate_clock_functions(props, writer, main_path, control_path, f"{scenes_path}/clock", scene_name, ns, start_frame, end_frame, dispatch_lines, first_keyframes, version_details)
+        if is_instanced(props): generate_instance_wrappers(props, writer, main_path, scene_name, ns)
+    elif props.pause_support:
+        generate_pause_functions(props, writer, main_path, f"{scenes_path}/pause", scene_name, ns, pause_chains, end_frame, version_details)
+    write_pack_mcmeta(writer, version_details['pack_format'], f"Animation '{props.scene_name}' generated by MC Animaker")
+    yield 'finishing', 1.0
+    report = {'peak_commands_before': peak_commands_per_tick([before for before, _ in tick_counts]), 'peak_commands_after': peak_commands_per_tick([after for _, after in tick_counts]), 'merged_entities': merged_entities, 'rigid_groups': len(rigid_groups)}
+    for stage, index in (('before', 0), ('after', 1)):
+        report[f'commands_{stage}'] = sum(counts[index][0] for counts in optimizer_counts)
+        report[f'prefixed_{stage}'] = sum(counts[index][1] for counts in optimizer_counts)
+    return report
+
+def peak_commands_per_tick(count_maps):
+    """Largest number of commands any tick runs across the given {frame: count} maps, which play side by side."""
+    totals = {}
+    for counts in count_maps:
+        for frame, count in counts.items(): totals[frame] = totals.get(frame, 0) + count
+    return max(totals.values(), default=0)
+
+def compile_model(props, all_objects, animation_cache, frame, writer):
+    """Writes a static model datapack from the objects' states at frame and returns how many block displays merging saved."""
+    return run_steps(compile_model_steps(props, all_objects, animation_cache, frame, writer))
+
+def compile_model_steps(props, all_objects, animation_cache, frame, writer):
+    """compile_model as a generator yielding its progress, like compile_animation_steps."""
+    version_details = VERSION_MAP.get(props.minecraft_version, VERSION_MAP['1.21'])
+    model_dir = model_path(props); model_base_path, model_name = model_dir.rsplit('/', 1)
+    write_pack_mcmeta(writer, version_details['pack_format'], f"Model '{props.scene_name}' generated by MC Animaker")
+    all_objects, static_boxes, merged_entities = merge_static_blocks(props, all_objects, animation_cache, frame)
+    yield 'analysis', 0.5
+    generate_model_files(props, writer, model_base_path, model_name, all_objects, animation_cache, frame, static_boxes)
+    return {'merged_entities': merged_entities}
@@ -0,0 +1,35 @@
+import functools
+import numpy as np
+
+MATRIX_FORMAT = ",".join(["{:.5f}f"] * 16)
+
+@functools.lru_cache(maxsize=None)
+def brightness(sky_light, block_light):
+    return f',brightness:{{sky:{sky_light},block:{block_light}}}'
+
+@functools.lru_cache(maxsize=None)
+def interpolation(duration, start):
+    return f",interpolation_duration:{duration},start_interpolation:{start}"
+
+class MatrixFormatter:
+    """Formats transformation matrices as NBT float lists, once per distinct matrix.
+
+    Matrices are keyed by the exact bits of their values, so a block that keeps the same transform reuses one string
+    for the whole export and every string is the one format_matrix would print, signed zeros included."""
+
+    def __init__(self):
+        self.strings = {}
+
+    def format_many(self, matrices):
+        """NBT strings for an (N, 4, 4) stack, in order."""
+        matrices = np.asarray(matrices, dtype=np.float64).reshape(-1, 16)
+        if not len(matrices): return []
+        bits = np.ascontiguousarray(matrices).view(np.int64)
+        unique, first, inverse = np.unique(bits, axis=0, return_index=True, return_inverse=True)
+        distinct = []
+        for key_row, index in zip(unique, first):
+            key = key_row.tobytes(); text = self.strings.get(key)
+            if text is None: text = self.strings[key] = MATRIX_FORMAT.format(*matrices[index].tolist())
+            distinct.append(text)
+        return [distinct[i] for i in inverse.reshape(-1).tolist()]
+
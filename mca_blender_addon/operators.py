@@ -1,12 +1,15 @@
 import bpy
-import os
-import json
-import tempfile
+import time
 
 from bpy.types import Operator
 from bpy.props import StringProperty
 from . import utils
+from . import resource_pack
 from . import generator
+from . import sampling
+from . import output
+from .cache import AnimationCache
+from .scene import ObjectSpec, ExportSettings, sanitize_name
 
 class MC_OT_KeyframeProperty(Operator):
     bl_idname = "mc.keyframe_property"; bl_label = "Apply and Keyframe on Selected"
@@ -71,7 +74,7 @@ class MC_OT_AddEntity(Operator):
         full_entity_id = entity_id if ':' in entity_id else f"minecraft:{entity_id}"; short_id = full_entity_id.split(':')[-1]
         bpy.ops.object.empty_add(type='CUBE', align='WORLD', location=context.scene.cursor.location)
         obj = context.active_object; obj.name = f"MC_Entity_{short_id}"; obj.mc_props.object_type = 'ENTITY'; obj.mc_props.entity_id = full_entity_id
-        obj.mc_props.sid = utils.sanitize_name(obj.name)
+        obj.mc_props.sid = sanitize_name(obj.name)
         return {'FINISHED'}
 
 class MC_OT_ApplyTextures(Operator):
@@ -89,20 +92,21 @@ class MC_OT_ApplyTextures(Operator):
             self.report({'WARNING'}, "No valid blocks selected.")
             return {'CANCELLED'}
 
+        utils.reset_cube_uv_maps(selected_blocks)
         for obj in selected_blocks:
             self.apply_textures_to_object(context, obj)
             
+        resource_pack.save()
         self.report({'INFO'}, f"Textures applied to {len(selected_blocks)} object(s).")
         return {'FINISHED'}
 
     def apply_textures_to_object(self, context, obj):
         props = context.scene.mc_scene_props
-        rp_path = props.resource_pack_path
+        rp_path = bpy.path.abspath(props.resource_pack_path)
         if not rp_path:
             self.report({'WARNING'}, "No Resource Pack selected.")
             return
         
-        utils.reset_cube_uv_map(obj)
         helper = utils.ResourcePackHelper()
         block_id = obj.mc_props.block_id
         texture_map, message = helper.find_textures_for_block(rp_path, block_id)
@@ -113,13 +117,11 @@ class MC_OT_ApplyTextures(Operator):
             texture_map = {'all': f'minecraft:block/{block_name.split("[")[0]}'}
             
         try:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                self.create_and_apply_materials(context, obj, texture_map, rp_path, temp_dir)
+            self.create_and_apply_materials(context, obj, texture_map, rp_path)
         except Exception as e:
             self.report({'ERROR'}, f"Failed to apply texture to '{obj.name}': {e}")
 
-    def create_and_apply_materials(self, context, obj, texture_map, rp_path, temp_dir):
-        helper = utils.ResourcePackHelper()
+    def create_and_apply_materials(self, context, obj, texture_map, rp_path):
         obj.data.materials.clear()
 
         if 'end' in texture_map and 'top' not in texture_map:
@@ -138,171 +140,166 @@ class MC_OT_ApplyTextures(Operator):
         }
         tex_paths['side'] = texture_map.get('side', fallback_tex)
         
-        unique_texture_paths = {p for p in tex_paths.values() if p}
-        created_materials = {}
-
-        for path_key in unique_texture_paths:
-            full_path = path_key if ':' in path_key else f"minecraft:{path_key}"
-            namespace, path = full_path.split(':', 1)
-            image_path_in_rp = f"assets/{namespace}/textures/{path}.png"
-            image_filepath = helper.get_image_from_rp(rp_path, image_path_in_rp, temp_dir)
-            if not image_filepath: continue
-            
-            img = bpy.data.images.load(image_filepath, check_existing=True); img.pack()
-            mat_name = os.path.basename(path); mat = bpy.data.materials.new(name=mat_name); mat.use_nodes = True
-            bsdf = mat.node_tree.nodes.get('Principled BSDF')
-            
-            if bsdf:
-                base_pos_x, base_pos_y = bsdf.location
-            else:
-                base_pos_x, base_pos_y = 0, 0
+        material_indices = {}
+        for path_key in sorted({p for p in tex_paths.values() if p}):
+            mat = utils.get_texture_material(rp_path, path_key)
+            if mat is None: continue
+            obj.data.materials.append(mat); material_indices[path_key] = len(obj.data.materials) - 1
 
-            tex_image_node = mat.node_tree.nodes.new('ShaderNodeTexImage')
-            tex_image_node.location = (base_pos_x - 300, base_pos_y)
-            
-            mapping_node = mat.node_tree.nodes.new('ShaderNodeMapping')
-            mapping_node.location = (base_pos_x - 550, base_pos_y)
+        if not material_indices: raise Exception(f"No PNG textures found for definitions in {texture_map}")
 
-            tex_coord_node = mat.node_tree.nodes.new('ShaderNodeTexCoord')
-            tex_coord_node.location = (base_pos_x - 800, base_pos_y)
-            
-            tex_image_node.image = img
-            tex_image_node.interpolation = 'Closest'
-
-            img_width = img.size[0]
-            img_height = img.size[1]
-
-            if img_height > 0:
-                scale_y = img_width / img_height
-                mapping_node.inputs['Scale'].default_value[1] = scale_y
-                mapping_node.inputs['Location'].default_value[1] = 1.0 - scale_y
-            
-            mat.node_tree.links.new(mapping_node.inputs['Vector'], tex_coord_node.outputs['UV'])
-            mat.node_tree.links.new(tex_image_node.inputs['Vector'], mapping_node.outputs['Vector'])
-            
-            mat.node_tree.links.new(bsdf.inputs['Base Color'], tex_image_node.outputs['Color'])
-            mat.node_tree.links.new(bsdf.inputs['Alpha'], tex_image_node.outputs['Alpha'])
-            mat.blend_method = 'CLIP'
-            obj.data.materials.append(mat)
-            created_materials[path_key] = mat
-
-        if not created_materials: raise Exception(f"No PNG textures found for definitions in {texture_map}")
-
-        for face in obj.data.polygons:
-            center = face.center; key = ''
-            if abs(center.z) > 0.49: key = 'top' if center.z > 0 else 'bottom'
-            elif abs(center.y) > 0.49: key = 'front' if center.y < 0 else 'back'
-            elif abs(center.x) > 0.49: key = 'east' if center.x > 0 else 'west'
-            if key:
-                texture_name = tex_paths.get(key)
-                material = created_materials.get(texture_name)
-                if material:
-                    mat_index = obj.data.materials.find(material.name)
-                    if mat_index != -1: face.material_index = mat_index
+        utils.assign_cube_face_materials(obj.data, {side: material_indices[path] for side, path in tex_paths.items() if path in material_indices})
 
 class MC_OT_GenerateDatapack(Operator):
+    """Exports from a timer in short slices, so Blender stays responsive and shows the progress of every stage.
+    Esc cancels until writing starts; a cancelled export leaves the previous datapack untouched."""
     bl_idname = "mc.generate_datapack"; bl_label = "Generate Datapack"; bl_options = {'REGISTER', 'UNDO'}
-    
+    slice_seconds = 0.1
+    passthrough_events = {'MOUSEMOVE', 'INBETWEEN_MOUSEMOVE', 'MIDDLEMOUSE', 'WHEELUPMOUSE', 'WHEELDOWNMOUSE', 'TRACKPADPAN', 'TRACKPADZOOM'}
+
     def execute(self, context):
-        props = context.scene.mc_scene_props
-        if props.export_type == 'ANIMATION':
-            self.execute_animation(context)
-        elif props.export_type == 'MODEL':
-            self.execute_model(context)
+        job = self.create_job(context)
+        if job is None: return {'CANCELLED'}
+        for _ in job: pass
         return {'FINISHED'}
 
-    def execute_animation(self, context):
-        props = context.scene.mc_scene_props; scene = context.scene; wm = context.window_manager
+    def invoke(self, context, event):
+        if context.window is None: return self.execute(context)
+        self.job = self.create_job(context)
+        if self.job is None: return {'CANCELLED'}
+        wm = context.window_manager
+        self.cancellable = True; self.stage = None; self.stage_start = time.perf_counter(); self.stage_from = 0.0
+        self.timer = wm.event_timer_add(0.05, window=context.window); wm.modal_handler_add(self)
+        context.window.cursor_set('WAIT'); wm.mca_progress = 0.0; wm.mca_progress_text = "Preparing export..."
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        cancelled = event.type == 'ESC' and event.value == 'PRESS' and self.cancellable
+        if event.type != 'TIMER' and not cancelled:
+            return {'PASS_THROUGH'} if event.type in self.passthrough_events else {'RUNNING_MODAL'}
+
+        done = True
+        try:
+            if cancelled:
+                self.job.close(); self.report({'WARNING'}, "Datapack export cancelled."); return {'CANCELLED'}
+            deadline = time.perf_counter() + self.slice_seconds
+            while True:
+                try: stage, fraction = next(self.job)
+                except StopIteration: return {'FINISHED'}
+                if stage != self.stage: self.stage = stage; self.stage_start = time.perf_counter(); self.stage_from = fraction
+                if time.perf_counter() >= deadline: break
+            self.show_progress(context, stage, fraction); done = False
+            return {'RUNNING_MODAL'}
+        finally:
+            if done: self.finish(context)
+
+    def show_progress(self, context, stage, fraction):
+        wm = context.window_manager; elapsed = time.perf_counter() - self.stage_start; progress = fraction - self.stage_from
+        text = f"{stage}..."
+        if progress > 0.02 and elapsed > 0.5: text += f" about {elapsed * (1.0 - fraction) / progress:.0f}s left"
+        if self.cancellable: text += " (Esc to cancel)"
+        wm.mca_progress = fraction * 100.0; wm.mca_progress_text = text
+        self.redraw_status_bars(wm)
+
+    def finish(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer); self.timer = None
+        wm.mca_progress = 0.0; wm.mca_progress_text = ""; context.window.cursor_set('DEFAULT')
+        self.redraw_status_bars(wm)
+
+    @staticmethod
+    def redraw_status_bars(wm):
+        for window in wm.windows:
+            for area in window.screen.areas:
+                if area.type == 'STATUSBAR': area.tag_redraw()
+
+    def create_job(self, context):
+        """Validates the export settings and returns a generator yielding (stage, fraction) until the export is done,
+        or None after reporting why there is nothing to export."""
+        props = context.scene.mc_scene_props
+        name_label = "Scene Name" if props.export_type == 'ANIMATION' else "Model Name"
         if not props.datapack_output_path or not props.folder_name or not props.scene_name:
-            self.report({'ERROR'}, "Please set the Output Path, Folder Name, and Scene Name."); return
-        
-        version_details = generator.VERSION_MAP.get(props.minecraft_version, generator.VERSION_MAP['1.21'])
-        pack_format = version_details['pack_format']; function_folder_name = version_details['function_folder']
-        ns = utils.sanitize_name(props.namespace); scene_name = utils.sanitize_name(props.scene_name)
-        datapack_root = os.path.join(props.datapack_output_path, props.folder_name)
-        base_path = os.path.join(datapack_root, "data", ns, function_folder_name)
-        scenes_path = os.path.join(base_path, "animations", "scenes", scene_name)
-        for path in [scenes_path, os.path.join(scenes_path, "keyframes", "blocks"), os.path.join(scenes_path, "keyframes", "entity", "commands"), os.path.join(base_path, "animations", "_main", scene_name)]:
-            os.makedirs(path, exist_ok=True)
-        
-        pack_mcmeta = {"pack": {"pack_format": pack_format, "description": f"Animation '{props.scene_name}' generated by MC Animaker"}}
-        with open(os.path.join(datapack_root, "pack.mcmeta"), 'w', encoding='utf-8') as f: json.dump(pack_mcmeta, f, indent=4)
-        
+            self.report({'ERROR'}, f"Please set the Output Path, Folder Name, and {name_label}."); return None
+        if props.export_type == 'ANIMATION' and props.playback_engine == 'INSTANCED' and not generator.VERSION_MAP[props.minecraft_version]['early_return']:
+            self.report({'ERROR'}, "The Instanced Clock needs Minecraft 1.20.3 or newer."); return None
+
         all_objects = [obj for obj in bpy.data.objects if hasattr(obj, 'mc_props') and obj.mc_props.object_type != 'NONE']
-        if not all_objects: self.report({'WARNING'}, "No MC Animaker objects found to animate."); return
-        
+        if not all_objects:
+            action = "animate" if props.export_type == 'ANIMATION' else "export"
+            self.report({'WARNING'}, f"No MC Animaker objects found to {action}."); return None
+        self.cancellable = True
+        return self.animation_job(context, all_objects) if props.export_type == 'ANIMATION' else self.model_job(context, all_objects)
+
+    def build(self, writer, steps):
+        """Runs the generator's steps as the Generating stage and the writer's close as the Writing stage, returning
+        (report, stats). Until writing starts the writer is discarded when the job fails or is closed; writing itself
+        is not cancellable, so a folder datapack is never left half written."""
+        try:
+            while True:
+                try: _, fraction = next(steps)
+                except StopIteration as done: report = done.value; break
+                yield "Generating", fraction
+        except BaseException:
+            writer.discard(); raise
+        self.cancellable = False
+        steps = writer.close_steps()
+        while True:
+            try: fraction = next(steps)
+            except StopIteration as done: return report, done.value
+            yield "Writing", fraction
+
+    def animation_job(self, context, all_objects):
+        props = context.scene.mc_scene_props; scene = context.scene
         start_frame = scene.frame_start if not props.use_custom_frame_range else props.start_frame
         end_frame = scene.frame_end if not props.use_custom_frame_range else props.end_frame
-        
-        context.window.cursor_set('WAIT'); wm.mca_progress = 0.0; wm.mca_progress_text = "Caching Animation Data..."
-        animation_cache = {obj.name: {} for obj in all_objects}
+
+        animation_cache = AnimationCache([obj.name for obj in all_objects], start_frame, end_frame)
         original_frame = scene.frame_current; total_frames = end_frame - start_frame + 1
-        
+
+        columns = []; sampled = 0
+        for column, obj in enumerate(all_objects):
+            if props.fast_sampling and sampling.can_sample_directly(obj):
+                sampling.sample_into_cache(animation_cache, column, obj); sampled += 1
+                yield "Sampling", sampled / len(all_objects)
+            else: columns.append((column, obj))
+
         try:
-            for i, frame in enumerate(range(start_frame, end_frame + 1)):
+            for i, frame in enumerate(range(start_frame, end_frame + 1) if columns else ()):
                 scene.frame_set(frame)
-                for obj in all_objects:
-                    state_tuple = (obj.matrix_world.copy(), obj.mc_props.solidify, obj.mc_props.block_light_level, obj.mc_props.sky_light_level)
-                    animation_cache[obj.name][frame] = state_tuple
-                wm.mca_progress = (i + 1) / total_frames * 100.0
+                for column, obj in columns:
+                    animation_cache.store(frame, column, obj.matrix_world, obj.mc_props.solidify, obj.mc_props.block_light_level, obj.mc_props.sky_light_level)
+                yield "Sampling", (sampled + len(columns) * (i + 1) / total_frames) / len(all_objects)
         finally:
-            scene.frame_set(original_frame); wm.mca_progress = 0.0; wm.mca_progress_text = ""; context.window.cursor_set('DEFAULT')
+            scene.frame_set(original_frame)
 
         self.report({'INFO'}, "Cache created. Generating files...")
-        
-        main_path = os.path.join(base_path, "animations", "_main", scene_name)
-        
-        block_kfs = {}; entity_kfs = {}
-        if props.export_blocks:
-            block_kfs = generator.get_optimized_keyframes(props, all_objects, 'BLOCK', animation_cache, utils.are_states_equal, start_frame, end_frame)
-        if props.export_entities:
-            entity_objects = [obj for obj in all_objects if obj.mc_props.object_type == 'ENTITY']
-            if entity_objects:
-                entity_kfs = {f: {} for f in range(start_frame, end_frame + 1)}
-                for frame in entity_kfs.keys():
-                    frame_data = {}
-                    for local_index, obj in enumerate(entity_objects):
-                         frame_data[local_index] = (obj, animation_cache[obj.name][frame])
-                    entity_kfs[frame] = frame_data
-        
-        generator.generate_main_functions(props, main_path, scene_name, ns, all_objects, start_frame, block_kfs, entity_kfs)
-        generator.generate_create_commands(props, main_path, scene_name, all_objects, start_frame, animation_cache)
-
-        sid_map = {}; used_sids = set()
-        for obj in all_objects:
-            if obj.mc_props.object_type == 'ENTITY' and obj.mc_props.use_custom_commands and obj.mc_props.sid:
-                base_sid = utils.sanitize_name(obj.mc_props.sid); final_sid = base_sid; count = 1
-                while final_sid in used_sids: final_sid = f"{base_sid}_{count}"; count += 1
-                used_sids.add(final_sid); sid_map[obj] = final_sid
-        
-        kf_base_path = os.path.join(scenes_path, "keyframes")
-        generator.generate_custom_command_files(props, os.path.join(kf_base_path, "entity", "commands"), scene_name, ns, all_objects, sid_map)
-        if props.export_blocks and block_kfs:
-            generator.generate_keyframes(props, os.path.join(kf_base_path, "blocks"), scene_name, ns, all_objects, 'BLOCK', generator.format_block_command, block_kfs, start_frame, end_frame, animation_cache, sid_map)
-        if props.export_entities and entity_kfs:
-            generator.generate_keyframes(props, os.path.join(kf_base_path, "entity"), scene_name, ns, all_objects, 'ENTITY', generator.format_entity_command, entity_kfs, start_frame, end_frame, animation_cache, sid_map)
-            
-        self.report({'INFO'}, f"Datapack '{props.folder_name}' generated successfully!")
 
-    def execute_model(self, context):
-        props = context.scene.mc_scene_props
-        if not props.datapack_output_path or not props.folder_name or not props.scene_name:
-            self.report({'ERROR'}, "Please set the Output Path, Folder Name, and Model Name."); return
+        settings = ExportSettings.from_props(props); specs = [ObjectSpec.from_object(obj) for obj in all_objects]
+        writer = output.create_writer(settings, owned_prefixes=tuple(f"{path}/" for path in generator.animation_paths(settings)))
+        report, stats = yield from self.build(writer, generator.compile_animation_steps(settings, specs, animation_cache, writer))
+        self.report({'INFO'}, f"Datapack '{props.folder_name}' generated successfully! ({output.format_stats(stats)})")
+        peak_text = f"{report['peak_commands_before']} -> {report['peak_commands_after']}" if settings.max_commands_per_tick > 0 else str(report['peak_commands_after'])
+        self.report({'INFO'}, f"Peak commands per tick: {peak_text}")
+        self.report({'INFO'}, f"Keyframe commands: {report['commands_before']} -> {report['commands_after']} ({report['prefixed_before']} -> {report['prefixed_after']} with an execute prefix)")
+        if settings.merge_static_blocks: self.report({'INFO'}, f"Merged static blocks: {report['merged_entities']} fewer block displays")
+        if settings.detect_rigid_groups: self.report({'INFO'}, f"Rigid groups: {report['rigid_groups']}")
 
-        version_details = generator.VERSION_MAP.get(props.minecraft_version, generator.VERSION_MAP['1.21'])
-        pack_format = version_details['pack_format']; function_folder_name = version_details['function_folder']
-        ns = utils.sanitize_name(props.namespace); model_name = utils.sanitize_name(props.scene_name)
-        datapack_root = os.path.join(props.datapack_output_path, props.folder_name)
-        model_base_path = os.path.join(datapack_root, "data", ns, function_folder_name, "models")
-        os.makedirs(model_base_path, exist_ok=True)
+    def model_job(self, context, all_objects):
+        props = context.scene.mc_scene_props; scene = context.scene
 
-        pack_mcmeta = {"pack": {"pack_format": pack_format, "description": f"Model '{props.scene_name}' generated by MC Animaker"}}
-        with open(os.path.join(datapack_root, "pack.mcmeta"), 'w', encoding='utf-8') as f: json.dump(pack_mcmeta, f, indent=4)
-        
-        all_objects = [obj for obj in bpy.data.objects if hasattr(obj, 'mc_props') and obj.mc_props.object_type != 'NONE']
-        if not all_objects:
-            self.report({'WARNING'}, "No MC Animaker objects found to export."); return
-            
-        generator.generate_model_files(context, props, model_base_path, model_name, all_objects)
-        
-        self.report({'INFO'}, f"Model '{model_name}' generated successfully!")
\ No newline at end of file
+        frame = props.model_export_frame; original_frame = scene.frame_current
+        model_cache = AnimationCache([obj.name for obj in all_objects], frame, frame)
+        scene.frame_set(frame)
+        try:
+            for column, obj in enumerate(all_objects):
+                model_cache.store(frame, column, obj.matrix_world, obj.mc_props.solidify, obj.mc_props.block_light_level, obj.mc_props.sky_light_level)
+        finally:
+            scene.frame_set(original_frame)
+        yield "Sampling", 1.0
+
+        settings = ExportSettings.from_props(props); specs = [ObjectSpec.from_object(obj) for obj in all_objects]
+        writer = output.create_writer(settings, owned_prefixes=(f"{generator.model_path(settings)}/",))
+        report, stats = yield from self.build(writer, generator.compile_model_steps(settings, specs, model_cache, frame, writer))
+
+        self.report({'INFO'}, f"Model '{sanitize_name(props.scene_name)}' generated successfully! ({output.format_stats(stats)})")
+        if settings.merge_static_blocks: self.report({'INFO'}, f"Merged static blocks: {report['merged_entities']} fewer block displays")
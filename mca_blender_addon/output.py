@@ -0,0 +1,147 @@
+import os
+import json
+import hashlib
+import zipfile
+
+MANIFEST_NAME = ".mca_manifest.json"
+
+def content_hash(content):
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+def merge_tag(previous_content, values):
+    """Function tag JSON holding the previous entries plus values. Entries are optional so a scene removed later cannot break loading."""
+    entries = []
+    try: entries = json.loads(previous_content).get('values', []) if previous_content else []
+    except (ValueError, AttributeError): pass
+    ids = {entry['id'] if isinstance(entry, dict) else entry for entry in entries}
+    entries += [{"id": value, "required": False} for value in values if value not in ids]
+    return json.dumps({"values": entries}, indent=4)
+
+def run_steps(steps):
+    """Drives a generator that yields progress to its end and returns the generator's return value."""
+    while True:
+        try: next(steps)
+        except StopIteration as done: return done.value
+
+class DirectoryWriter:
+    """Collects generated files in memory and writes them into the datapack folder in one pass on close().
+
+    A manifest of content hashes lets unchanged files be skipped, and files under the owned prefixes that
+    were not produced again are removed."""
+
+    def __init__(self, root, owned_prefixes=()):
+        self.root = root; self.files = {}; self.tags = {}; self.owned_prefixes = tuple(owned_prefixes)
+        self.manifest_path = os.path.join(root, MANIFEST_NAME)
+
+    def write(self, rel_path, content):
+        if rel_path in self.files: raise ValueError(f"{rel_path} was already written")
+        self.files[rel_path] = content
+
+    def add_to_tag(self, rel_path, *values):
+        self.tags.setdefault(rel_path, []).extend(values)
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f: manifest = json.load(f)
+            return manifest if isinstance(manifest, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def full_path(self, rel_path):
+        return os.path.join(self.root, *rel_path.split('/'))
+
+    def stale_paths(self, manifest):
+        stale = {path for path in manifest if path.startswith(self.owned_prefixes)}
+        for prefix in self.owned_prefixes:
+            folder = self.full_path(prefix.rstrip('/'))
+            for dirpath, _, filenames in os.walk(folder):
+                rel_dir = os.path.relpath(dirpath, self.root).replace(os.sep, '/')
+                stale.update(f"{rel_dir}/{name}" for name in filenames if name.endswith('.mcfunction'))
+        return stale - self.files.keys()
+
+    def close(self):
+        return run_steps(self.close_steps())
+
+    def close_steps(self):
+        """close() as a generator yielding progress from 0 to 1 while files are written; returns the stats."""
+        for rel_path, values in self.tags.items():
+            previous = None
+            if os.path.isfile(self.full_path(rel_path)):
+                with open(self.full_path(rel_path), 'r', encoding='utf-8') as f: previous = f.read()
+            self.write(rel_path, merge_tag(previous, values))
+        manifest = self.load_manifest(); created_dirs = set()
+        stats = {'written': 0, 'skipped': 0, 'deleted': 0}
+        for rel_path in self.stale_paths(manifest):
+            path = self.full_path(rel_path); manifest.pop(rel_path, None)
+            if os.path.isfile(path):
+                os.remove(path); stats['deleted'] += 1
+                try: os.rmdir(os.path.dirname(path))
+                except OSError: pass
+        for i, (rel_path, content) in enumerate(self.files.items()):
+            if i % 64 == 0: yield i / len(self.files)
+            path = self.full_path(rel_path); digest = content_hash(content)
+            if manifest.get(rel_path) == digest and os.path.isfile(path):
+                stats['skipped'] += 1; continue
+            folder = os.path.dirname(path)
+            if folder not in created_dirs:
+                os.makedirs(folder, exist_ok=True); created_dirs.add(folder)
+            with open(path, 'w', encoding='utf-8') as f: f.write(content)
+            manifest[rel_path] = digest; stats['written'] += 1
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.manifest_path, 'w', encoding='utf-8') as f: json.dump(manifest, f, indent=1, sort_keys=True)
+        self.files = {}; self.tags = {}
+        return stats
+
+    def discard(self):
+        self.files = {}; self.tags = {}
+
+class ZipWriter:
+    """Streams generated files into a datapack archive, swapped in place of the previous one on close()."""
+
+    def __init__(self, zip_path, owned_prefixes=()):
+        self.zip_path = zip_path; self.temp_path = zip_path + ".tmp"
+        self.owned_prefixes = tuple(owned_prefixes); self.written = set(); self.tags = {}
+        os.makedirs(os.path.dirname(os.path.abspath(zip_path)), exist_ok=True)
+        self.archive = zipfile.ZipFile(self.temp_path, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    def write(self, rel_path, content):
+        if rel_path in self.written: raise ValueError(f"{rel_path} was already written")
+        self.archive.writestr(rel_path, content.encode('utf-8')); self.written.add(rel_path)
+
+    def add_to_tag(self, rel_path, *values):
+        self.tags.setdefault(rel_path, []).extend(values)
+
+    def close(self):
+        return run_steps(self.close_steps())
+
+    def close_steps(self):
+        """close() as a generator yielding progress from 0 to 1 while the previous archive's entries are carried over."""
+        previous = zipfile.ZipFile(self.zip_path, 'r') if os.path.exists(self.zip_path) and zipfile.is_zipfile(self.zip_path) else None
+        for rel_path, values in self.tags.items():
+            content = None
+            if previous is not None and rel_path in previous.namelist(): content = previous.read(rel_path).decode('utf-8')
+            self.write(rel_path, merge_tag(content, values))
+        stats = {'written': len(self.written), 'skipped': 0, 'deleted': 0}
+        if previous is not None:
+            with previous:
+                entries = previous.infolist()
+                for i, info in enumerate(entries):
+                    if i % 64 == 0: yield i / len(entries)
+                    if info.is_dir() or info.filename in self.written: continue
+                    if info.filename.startswith(self.owned_prefixes): stats['deleted'] += 1; continue
+                    self.archive.writestr(info, previous.read(info.filename))
+        self.archive.close()
+        os.replace(self.temp_path, self.zip_path)
+        return stats
+
+    def discard(self):
+        self.archive.close()
+        if os.path.exists(self.temp_path): os.remove(self.temp_path)
+
+def create_writer(props, owned_prefixes=()):
+    if props.output_format == 'ZIP':
+        return ZipWriter(os.path.join(props.datapack_output_path, f"{props.folder_name}.zip"), owned_prefixes)
+    return DirectoryWriter(os.path.join(props.datapack_output_path, props.folder_name), owned_prefixes)
+
+def format_stats(stats):
+    return f"{stats['written']} written, {stats['skipped']} unchanged, {stats['deleted']} removed"
@@ -1,9 +1,10 @@
 import bpy
 from bpy.props import (
-    StringProperty, PointerProperty, EnumProperty, BoolProperty, IntProperty, FloatVectorProperty,
+    StringProperty, PointerProperty, EnumProperty, BoolProperty, IntProperty, FloatProperty, FloatVectorProperty,
     CollectionProperty
 )
 from bpy.types import PropertyGroup
+from . import resource_pack
 
 def update_multi_object_value(self, context):
     if context.active_object and hasattr(context.active_object, 'mc_props'):
@@ -15,6 +16,13 @@ def update_multi_object_value(self, context):
                 if getattr(obj.mc_props, prop_name) != active_value:
                     setattr(obj.mc_props, prop_name, active_value)
 
+def scene_block_ids(scene):
+    return sorted({obj.mc_props.block_id.strip() for obj in scene.objects if hasattr(obj, 'mc_props') and obj.mc_props.object_type == 'BLOCK' and obj.mc_props.block_id.strip()})
+
+def update_resource_pack_path(self, context):
+    resource_pack.release()
+    if self.resource_pack_path: resource_pack.warm_up(bpy.path.abspath(self.resource_pack_path), scene_block_ids(context.scene))
+
 def update_solidify(self, context):
     is_solid = self.solidify
     if hasattr(self, 'id_data') and self.id_data:
@@ -82,18 +90,43 @@ class MC_SceneProperties(PropertyGroup):
     
     add_block_id: StringProperty(name="", default="minecraft:oak_log")
     add_entity_id: StringProperty(name="", default="minecraft:allay")
-    resource_pack_path: StringProperty(name="Resource Pack Path", subtype='FILE_PATH')
+    resource_pack_path: StringProperty(name="Resource Pack Path", subtype='FILE_PATH', update=update_resource_pack_path)
     datapack_output_path: StringProperty(name="Output Path", subtype='DIR_PATH')
+    output_format: EnumProperty(
+        name="Output",
+        items=[('FOLDER', "Folder", "Write the datapack as a folder of function files"),
+               ('ZIP', "Zip Archive", "Write the datapack as a single .zip archive, ready to deploy")],
+        default='FOLDER'
+    )
     folder_name: StringProperty(name="Folder Name", default="MC Animaker Datapack")
     scene_name: StringProperty(name="Scene Name", default="Scene_Name")
     namespace: StringProperty(name="Namespace", default="mca")
     export_blocks: BoolProperty(name="Export Blocks", default=True)
     export_entities: BoolProperty(name="Export Entities", default=True)
     pause_support: BoolProperty(name="Pause/Resume Support", default=True)
+    playback_engine: EnumProperty(
+        name="Playback",
+        items=[('SCHEDULE', "Schedule Chain", "Each keyframe schedules the next one"),
+               ('CLOCK', "Scoreboard Clock", "A tick function advances a frame score and dispatches keyframes through a search tree. Adds seek, goto_frame and set_speed"),
+               ('INSTANCED', "Instanced Clock", "Scoreboard Clock kept on each created copy of the scene, so any number of copies play independently. Scene functions act on the copy running them or the nearest one. Needs 1.20.3+")],
+        default='SCHEDULE'
+    )
+    use_uuid_addressing: BoolProperty(name="Address by UUID", default=False, description="Give every generated entity a fixed UUID so commands target it directly instead of scanning entity tags. Only one copy of the scene can exist at a time")
+    fast_sampling: BoolProperty(name="Fast Sampling", default=True, description="Evaluate F-curves directly for objects without parents, constraints or drivers instead of stepping the whole scene frame by frame")
     use_interpolation: BoolProperty(name="Use Interpolation", default=True)
     interpolation_duration: IntProperty(name="Duration (ticks)", default=2, min=0)
     start_interpolation: IntProperty(name="Start (ticks)", default=0, min=0)
+    use_decimation: BoolProperty(name="Keyframe Decimation", default=False, description="Keep only the keyframes needed to stay within the error below and interpolate each block until its next keyframe")
+    decimation_error: FloatProperty(name="Max Error", default=0.02, min=0.0, precision=3, unit='LENGTH', description="Largest distance, in blocks, a block corner may drift from the sampled animation")
+    max_commands_per_tick: IntProperty(name="Max Commands per Tick", default=0, min=0, description="Spread block updates of ticks running more commands than this, entity and group moves included, over the ticks before them, delaying their interpolation so the timing stays the same. 0 disables the cap")
     invert_normals_on_export: BoolProperty(name="Invert Normals on Export", default=False)
+    merge_static_blocks: BoolProperty(name="Merge Static Blocks", default=False, description="Replace boxes of touching, identical blocks that never move with one stretched block display. In animations only blocks that stay the same for the whole range are merged")
+    detect_rigid_groups: BoolProperty(name="Rigid Groups", default=False, description="Blocks that only move together by the same translation ride one vehicle display, so each keyframe teleports the vehicle instead of updating every block. Interpolated scenes need Minecraft 1.20.2 or newer")
+    merge_block_pattern: StringProperty(name="Mergeable Blocks", default="*_concrete", description="Comma-separated block ID patterns whose texture still looks right when stretched over several blocks. Only near-uniform textures like concrete do; patterned ones like wool or terracotta visibly stretch")
+    optimize_drop_noop_merges: BoolProperty(name="Drop No-op Merges", default=True, description="Skip block updates that repeat the block's previous update")
+    optimize_fill_regions: BoolProperty(name="Fill Regions", default=True, description="Merge the blocks a keyframe solidifies or clears into as few fill commands as possible")
+    optimize_group_contexts: BoolProperty(name="Group Contexts", default=True, description="Move runs of commands sharing an execute context into one function call")
+    optimize_hoist_guards: BoolProperty(name="Hoist Guards", default=True, description="Check a keyframe's shared condition once with an early return. Needs Minecraft 1.20.3 or newer")
     dynamic_tracking: BoolProperty(name="Dynamic Tracking", default=False)
     tracking_mode: EnumProperty(name="Mode", items=[('OFF', "Off", ""), ('CENTER', "Center", ""), ('PLAYER', "Player", ""), ('TARGET', "Target", "")], default='OFF')
     global_tracking_anchor: EnumProperty(name="Anchor", items=[('EYES', "Eyes", ""), ('FEET', "Feet", ""), ('INDIVIDUAL', "Individual", "")], default='EYES')
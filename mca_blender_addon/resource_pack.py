@@ -0,0 +1,187 @@
+import os
+import json
+import hashlib
+import time
+import zipfile
+import functools
+import threading
+
+cache_dir = None  # Where resolved block textures persist between sessions; set on register, None keeps them in memory.
+
+def folder_entries(path):
+    """(name -> file path, stamp) for a folder pack. The stamp is the file count, total size and newest mtime over its
+    files, since the folder's own size and mtime miss edits below its top level."""
+    entries = {}; size = 0; newest = 0.0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            full_path = os.path.join(dirpath, name); stat = os.stat(full_path)
+            entries[os.path.relpath(full_path, path).replace(os.sep, '/')] = full_path
+            size += stat.st_size; newest = max(newest, stat.st_mtime)
+    return entries, [len(entries), size, newest]
+
+def pack_stamp(path):
+    """Changes whenever the pack at path does: see folder_entries for folders, size and mtime for a zip."""
+    if os.path.isdir(path): return folder_entries(path)[1]
+    return [os.path.getsize(path), os.path.getmtime(path)]
+
+class ResourcePackIndex:
+    """Read access to one resource pack, folder or zip, opened once.
+
+    The archive (or folder tree) is listed a single time into a name -> entry index; parsed JSON and resolved model
+    textures are kept in LRU caches, so a selection of blocks sharing parents like block/cube_all reads them once.
+    Resolved block textures also persist in cache_dir, keyed by the pack's path and valid while its stamp (see
+    pack_stamp) stays the same. The index may be used from a warm-up thread, so reads go through its lock. A folder pack is walked
+    again at most every recheck_seconds to tell whether it changed."""
+    recheck_seconds = 2.0
+
+    def __init__(self, path, cache_size=1024):
+        self.path = os.path.abspath(path); self.archive = None
+        self.lock = threading.RLock(); self.dirty = False; self.closed = False
+        if os.path.isdir(self.path):
+            self.entries, self.stamp = folder_entries(self.path)
+        else:
+            self.stamp = pack_stamp(self.path); self.archive = zipfile.ZipFile(self.path, 'r')
+            self.entries = {info.filename: info for info in self.archive.infolist() if not info.is_dir()}
+        self.checked = time.monotonic(); self.resolving = set(); self.resolved = self.load_resolved()
+        self.json = functools.lru_cache(maxsize=cache_size)(self._json)
+        self.model_textures = functools.lru_cache(maxsize=cache_size)(self._model_textures)
+
+    def is_stale(self):
+        if self.archive is None and time.monotonic() - self.checked < self.recheck_seconds: return False
+        try: stale = pack_stamp(self.path) != self.stamp
+        except OSError: return True
+        self.checked = time.monotonic(); return stale
+
+    def close(self):
+        with self.lock:
+            self.save_resolved()
+            if self.archive is not None: self.archive.close()
+            self.archive = None; self.entries = {}; self.closed = True
+            self.json.cache_clear(); self.model_textures.cache_clear()
+
+    def resolved_path(self):
+        if not cache_dir: return None
+        return os.path.join(cache_dir, "textures", hashlib.sha1(self.path.encode('utf-8')).hexdigest() + ".json")
+
+    def load_resolved(self):
+        path = self.resolved_path()
+        if not path or not os.path.exists(path): return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f: stored = json.load(f)
+        except (OSError, ValueError): return {}
+        if stored.get('stamp') != self.stamp: return {}
+        return {block_id: tuple(result) for block_id, result in stored.get('blocks', {}).items()}
+
+    def save_resolved(self):
+        path = self.resolved_path()
+        if not path or not self.dirty: return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", 'w', encoding='utf-8') as f: json.dump({'stamp': self.stamp, 'blocks': self.resolved}, f)
+            os.replace(path + ".tmp", path); self.dirty = False
+        except OSError: pass
+
+    def read_bytes(self, name):
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None: return None
+            if self.archive is not None: return self.archive.read(entry)
+        with open(entry, 'rb') as f: return f.read()
+
+    def read_text(self, name):
+        data = self.read_bytes(name)
+        return data.decode('utf-8') if data is not None else None
+
+    def _json(self, name):
+        data = self.read_bytes(name)
+        if data is None: return None
+        try: return json.loads(data.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError): return None
+
+    def _model_textures(self, model_id):
+        """Texture variables of a model merged down its parent chain. The dict is cached, so callers must not change it."""
+        if ':' not in model_id: model_id = f"minecraft:{model_id}"
+        namespace, model_name = model_id.split(':', 1)
+        model_json = self.json(f"assets/{namespace}/models/{model_name}.json")
+        if not isinstance(model_json, dict) or model_id in self.resolving: return {}
+        textures = {}
+        if 'parent' in model_json:
+            self.resolving.add(model_id)
+            try: textures.update(self.model_textures(model_json['parent']))
+            finally: self.resolving.discard(model_id)
+        if 'textures' in model_json: textures.update(model_json['textures'])
+        return textures
+
+    def block_textures(self, block_id):
+        """(texture variables with references resolved, message) for a block's first blockstate variant."""
+        if ':' not in block_id: block_id = f"minecraft:{block_id}"
+        with self.lock:
+            if self.closed: return None, "Resource pack was closed. Using fallback."
+            result = self.resolved.get(block_id)
+            if result is None:
+                result = self.resolved[block_id] = self.resolve_block(block_id); self.dirty = True
+        return (dict(result[0]) if result[0] is not None else None), result[1]
+
+    def resolve_block(self, block_id):
+        namespace, block_name = block_id.split(':', 1)
+        base_block_name = block_name.split('[')[0]
+        bs_json = self.json(f"assets/{namespace}/blockstates/{base_block_name}.json")
+        if bs_json is None:
+            if f"assets/{namespace}/blockstates/{base_block_name}.json" in self.entries: return None, f"Invalid blockstate for {base_block_name}. Using fallback."
+            return None, f"Blockstate not found for {base_block_name}. Using fallback."
+        model_id = None
+        if 'variants' in bs_json:
+            variants = bs_json['variants']
+            first_key = next(iter(variants)); model_info = variants[first_key]
+            if isinstance(model_info, list): model_info = model_info[0]
+            model_id = model_info.get('model')
+        if not model_id: return None, "Could not determine model. Using fallback."
+        resolved_textures = self.model_textures(model_id)
+        final_textures = {}
+        for key, value in resolved_textures.items():
+            for _ in range(len(resolved_textures)):
+                if not value.startswith('#'): break
+                value = resolved_textures.get(value[1:], value)
+            final_textures[key] = value
+        return final_textures, "Success"
+
+_index = None; _index_lock = threading.Lock()
+
+def open_index(path):
+    """The ResourcePackIndex for path, reused until the path changes or the pack does (see pack_stamp). None if path is unusable."""
+    global _index
+    with _index_lock:
+        if not path or not os.path.exists(path): _release(); return None
+        path = os.path.abspath(path)
+        if _index is not None and (_index.path != path or _index.is_stale()): _release()
+        if _index is None:
+            try: _index = ResourcePackIndex(path)
+            except (OSError, zipfile.BadZipFile): return None
+        return _index
+
+def release():
+    with _index_lock: _release()
+
+def _release():
+    global _index
+    if _index is not None: _index.close(); _index = None
+
+def save():
+    """Persists what the current index resolved so far."""
+    with _index_lock: index = _index
+    if index is not None:
+        with index.lock: index.save_resolved()
+
+def warm_up(path, block_ids):
+    """Resolves block_ids for the pack at path on a daemon thread and persists the results, so the texture operators
+    find them ready. The thread gives up as soon as the pack's index is released."""
+    def work():
+        index = open_index(path)
+        if index is None: return
+        for block_id in block_ids:
+            if _index is not index: return
+            index.block_textures(block_id)
+        with index.lock: index.save_resolved()
+    thread = threading.Thread(target=work, name="mca-resource-pack-warm-up", daemon=True)
+    thread.start()
+    return thread
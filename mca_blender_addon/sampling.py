@@ -0,0 +1,103 @@
+import numpy as np
+
+TRANSFORM_PATHS = ('location', 'rotation_euler', 'rotation_quaternion', 'rotation_axis_angle', 'scale')
+STATE_PATHS = ('mc_props.solidify', 'mc_props.block_light_level', 'mc_props.sky_light_level')
+
+def get_action_fcurves(obj):
+    anim = obj.animation_data
+    if not anim or not anim.action: return []
+    action = anim.action
+    if getattr(action, 'is_action_layered', False):
+        slot = getattr(anim, 'action_slot', None)
+        if slot is None: return []
+        for layer in action.layers:
+            for strip in layer.strips:
+                channelbag = strip.channelbag(slot)
+                if channelbag: return list(channelbag.fcurves)
+        return []
+    return list(action.fcurves)
+
+def can_sample_directly(obj):
+    """True when the object's matrix_world depends only on its own action."""
+    if obj.parent is not None or len(obj.constraints) > 0 or obj.rigid_body is not None: return False
+    if tuple(obj.delta_location) != (0.0, 0.0, 0.0) or tuple(obj.delta_scale) != (1.0, 1.0, 1.0): return False
+    if tuple(obj.delta_rotation_euler) != (0.0, 0.0, 0.0) or tuple(obj.delta_rotation_quaternion) != (1.0, 0.0, 0.0, 0.0): return False
+    anim = obj.animation_data
+    if anim:
+        if len(anim.drivers) > 0 or len(anim.nla_tracks) > 0: return False
+        if anim.action and (anim.action_influence != 1.0 or anim.action_blend_type != 'REPLACE'): return False
+        for fcurve in get_action_fcurves(obj):
+            if fcurve.data_path.startswith('delta_') or fcurve.data_path.startswith('matrix'): return False
+    return True
+
+def evaluate_channels(obj, data_path, static_values, frames):
+    values = np.empty((len(frames), len(static_values)), dtype=np.float64)
+    values[:] = static_values
+    for fcurve in get_action_fcurves(obj):
+        if fcurve.data_path != data_path or fcurve.mute or fcurve.array_index >= len(static_values): continue
+        values[:, fcurve.array_index] = [fcurve.evaluate(frame) for frame in frames]
+    return values
+
+def euler_to_matrices(angles, order):
+    cos = np.cos(angles); sin = np.sin(angles)
+    count = angles.shape[0]; axis_matrices = {}
+    for axis, i in zip('XYZ', range(3)):
+        m = np.zeros((count, 3, 3)); c = cos[:, i]; s = sin[:, i]
+        a, b = [j for j in range(3) if j != i]
+        m[:, i, i] = 1.0
+        m[:, a, a] = c; m[:, b, b] = c
+        m[:, a, b] = -s if axis != 'Y' else s
+        m[:, b, a] = s if axis != 'Y' else -s
+        axis_matrices[axis] = m
+    first, second, third = order
+    return axis_matrices[third] @ axis_matrices[second] @ axis_matrices[first]
+
+def quaternion_to_matrices(quats):
+    lengths = np.linalg.norm(quats, axis=1)
+    quats = np.where(lengths[:, None] > 0.0, quats / np.where(lengths > 0.0, lengths, 1.0)[:, None], np.array([1.0, 0.0, 0.0, 0.0]))
+    w, x, y, z = quats.T
+    m = np.empty((quats.shape[0], 3, 3))
+    m[:, 0, 0] = 1.0 - 2.0 * (y * y + z * z); m[:, 0, 1] = 2.0 * (x * y - w * z); m[:, 0, 2] = 2.0 * (x * z + w * y)
+    m[:, 1, 0] = 2.0 * (x * y + w * z); m[:, 1, 1] = 1.0 - 2.0 * (x * x + z * z); m[:, 1, 2] = 2.0 * (y * z - w * x)
+    m[:, 2, 0] = 2.0 * (x * z - w * y); m[:, 2, 1] = 2.0 * (y * z + w * x); m[:, 2, 2] = 1.0 - 2.0 * (x * x + y * y)
+    return m
+
+def axis_angle_to_matrices(axis_angles):
+    angles = axis_angles[:, 0]; axes = axis_angles[:, 1:]
+    lengths = np.linalg.norm(axes, axis=1); valid = lengths > 0.0
+    axes = axes / np.where(valid, lengths, 1.0)[:, None]
+    half = np.where(valid, angles, 0.0) * 0.5
+    quats = np.concatenate([np.cos(half)[:, None], axes * np.sin(half)[:, None]], axis=1)
+    return quaternion_to_matrices(quats)
+
+def compose_matrices(location, rotation, scale):
+    """World matrices from per-frame location (F, 3), rotation (F, 3, 3) and scale (F, 3)."""
+    matrices = np.zeros((location.shape[0], 4, 4))
+    matrices[:, :3, :3] = rotation * scale[:, None, :]
+    matrices[:, :3, 3] = location; matrices[:, 3, 3] = 1.0
+    return matrices
+
+def sample_object_fcurves(obj, start_frame, end_frame):
+    """Evaluates the object's F-curves for the whole range without touching the depsgraph."""
+    frames = list(range(start_frame, end_frame + 1))
+    location = evaluate_channels(obj, 'location', tuple(obj.location), frames)
+    scale = evaluate_channels(obj, 'scale', tuple(obj.scale), frames)
+    if obj.rotation_mode == 'QUATERNION':
+        rotation = quaternion_to_matrices(evaluate_channels(obj, 'rotation_quaternion', tuple(obj.rotation_quaternion), frames))
+    elif obj.rotation_mode == 'AXIS_ANGLE':
+        rotation = axis_angle_to_matrices(evaluate_channels(obj, 'rotation_axis_angle', tuple(obj.rotation_axis_angle), frames))
+    else:
+        rotation = euler_to_matrices(evaluate_channels(obj, 'rotation_euler', tuple(obj.rotation_euler), frames), obj.rotation_mode)
+    matrices = compose_matrices(location, rotation, scale)
+    mc_props = obj.mc_props
+    solidify = evaluate_channels(obj, 'mc_props.solidify', (float(mc_props.solidify),), frames)[:, 0] > 0.5
+    block_light = np.clip(evaluate_channels(obj, 'mc_props.block_light_level', (mc_props.block_light_level,), frames)[:, 0].astype(np.int64), 0, 15)
+    sky_light = np.clip(evaluate_channels(obj, 'mc_props.sky_light_level', (mc_props.sky_light_level,), frames)[:, 0].astype(np.int64), 0, 15)
+    return matrices, solidify, block_light, sky_light
+
+def sample_into_cache(cache, column, obj):
+    matrices, solidify, block_light, sky_light = sample_object_fcurves(obj, cache.start_frame, cache.end_frame)
+    cache.transforms[:, column] = matrices.reshape(-1, 16)
+    cache.solidify[:, column] = solidify
+    cache.block_light[:, column] = block_light
+    cache.sky_light[:, column] = sky_light
@@ -0,0 +1,90 @@
+import re
+import uuid
+import functools
+from dataclasses import dataclass, field, fields
+
+watermark = "# Created using MC Animaker by Priqnot\n\n"
+
+def sanitize_name(name_str):
+    if not name_str: return "unnamed"
+    sanitized = name_str.lower()
+    sanitized = re.sub(r'[^a-z0-9_.-]', '_', sanitized)
+    return sanitized
+
+@functools.lru_cache(maxsize=None)
+def entity_uuid(*parts):
+    """Deterministic UUID of a generated entity as (NBT int array, hyphenated string)."""
+    value = uuid.uuid5(uuid.NAMESPACE_URL, "mc-animaker:" + "/".join(parts))
+    ints = [int.from_bytes(value.bytes[i:i + 4], 'big', signed=True) for i in range(0, 16, 4)]
+    return f"[I;{','.join(str(v) for v in ints)}]", str(value)
+
+@dataclass(eq=False)
+class ObjectSpec:
+    """Static description of one exported object. Its per-frame state lives in an AnimationCache column of the same name."""
+    name: str
+    object_type: str
+    block_id: str = "minecraft:oak_log"
+    entity_id: str = "minecraft:allay"
+    solidify_as: str = "minecraft:stone"
+    is_tracking_target: bool = False
+    tracking_anchor: str = 'eyes'
+    use_custom_commands: bool = False
+    sid: str = ""
+    custom_commands: list = field(default_factory=list)
+    custom_nbt: str = ""
+
+    @classmethod
+    def from_object(cls, obj):
+        mc_props = obj.mc_props
+        return cls(
+            name=obj.name, object_type=mc_props.object_type, block_id=mc_props.block_id, entity_id=mc_props.entity_id,
+            solidify_as=mc_props.solidify_as, is_tracking_target=mc_props.is_tracking_target, tracking_anchor=mc_props.tracking_anchor,
+            use_custom_commands=mc_props.use_custom_commands, sid=mc_props.sid,
+            custom_commands=[item.command for item in mc_props.custom_commands], custom_nbt=mc_props.custom_nbt
+        )
+
+@dataclass(eq=False)
+class RigidGroup:
+    """Blocks that only ever move together by the same translation, exported as passengers of one vehicle display.
+
+    name is the cache column of the first member, whose movement from origin the vehicle follows."""
+    name: str
+    members: list
+    origin: tuple
+    object_type: str = 'GROUP'
+
+@dataclass
+class ExportSettings:
+    """Scene-level export options, mirroring MC_SceneProperties so the generator never touches Blender data."""
+    minecraft_version: str = '1.21'
+    datapack_output_path: str = ""
+    output_format: str = 'FOLDER'
+    folder_name: str = "MC Animaker Datapack"
+    scene_name: str = "Scene_Name"
+    namespace: str = "mca"
+    export_blocks: bool = True
+    export_entities: bool = True
+    pause_support: bool = True
+    playback_engine: str = 'SCHEDULE'
+    use_uuid_addressing: bool = False
+    use_interpolation: bool = True
+    interpolation_duration: int = 2
+    start_interpolation: int = 0
+    use_decimation: bool = False
+    decimation_error: float = 0.02
+    max_commands_per_tick: int = 0
+    optimize_drop_noop_merges: bool = True
+    optimize_fill_regions: bool = True
+    optimize_group_contexts: bool = True
+    optimize_hoist_guards: bool = True
+    invert_normals_on_export: bool = False
+    merge_static_blocks: bool = False
+    merge_block_pattern: str = "*_concrete"
+    detect_rigid_groups: bool = False
+    dynamic_tracking: bool = False
+    tracking_mode: str = 'OFF'
+    global_tracking_anchor: str = 'EYES'
+
+    @classmethod
+    def from_props(cls, props):
+        return cls(**{f.name: getattr(props, f.name) for f in fields(cls)})
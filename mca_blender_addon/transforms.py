@@ -0,0 +1,115 @@
+import numpy as np
+
+# Rotation(180, Z) @ Rotation(90, X): turns a Blender cube into a block_display's orientation.
+BASE_CORRECTION = np.array([[-1.0, 0.0, 0.0], [0.0, 0.0, 1.0], [0.0, 1.0, 0.0]])
+MIRROR_X = np.array([-1.0, 1.0, 1.0])
+PIVOT = np.array([0.5, 0.5, 0.5])
+MORPH_SCALE = 0.001
+
+def decompose(matrices):
+    """Splits (N, 4, 4) matrices into translation, rotation and signed scale the way mathutils' decompose() does."""
+    basis = matrices[:, :3, :3]
+    scale = np.linalg.norm(basis, axis=1)
+    scale[np.linalg.det(basis) < 0.0] *= -1.0
+    rotation = basis / np.where(scale == 0.0, 1.0, scale)[:, None, :]
+    return matrices[:, :3, 3].copy(), rotation, scale
+
+def rotation_quaternions(rotations):
+    """(N, 3, 3) proper rotation matrices to (N, 4) unit quaternions (w, x, y, z), by Shepperd's method."""
+    r = np.asarray(rotations, dtype=np.float64).reshape(-1, 3, 3)
+    trace = np.trace(r, axis1=1, axis2=2); diagonal = np.diagonal(r, axis1=1, axis2=2)
+    candidates = np.stack([1.0 + trace, 1.0 + 2.0 * diagonal[:, 0] - trace, 1.0 + 2.0 * diagonal[:, 1] - trace, 1.0 + 2.0 * diagonal[:, 2] - trace], axis=1)
+    pick = np.argmax(candidates, axis=1); root = np.sqrt(np.maximum(candidates[np.arange(len(r)), pick], 0.0))
+    w = r[:, 2, 1] - r[:, 1, 2], r[:, 0, 2] - r[:, 2, 0], r[:, 1, 0] - r[:, 0, 1]
+    pairs = r[:, 0, 1] + r[:, 1, 0], r[:, 0, 2] + r[:, 2, 0], r[:, 1, 2] + r[:, 2, 1]
+    q = np.empty((len(r), 4))
+    rows = [[root * root, w[0], w[1], w[2]], [w[0], root * root, pairs[0], pairs[1]], [w[1], pairs[0], root * root, pairs[2]], [w[2], pairs[1], pairs[2], root * root]]
+    for i in range(4):
+        chosen = pick == i
+        q[chosen] = np.stack([row[chosen] for row in rows[i]], axis=1) / (2.0 * root[chosen, None])
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+def quaternion_rotations(quaternions):
+    w, x, y, z = np.asarray(quaternions, dtype=np.float64).reshape(-1, 4).T
+    return np.stack([
+        np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)], axis=1),
+        np.stack([2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)], axis=1),
+        np.stack([2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)], axis=1)], axis=1)
+
+def slerp(q0, q1, t):
+    """Spherical blend of two unit quaternions along the shorter arc at each factor of t, as (len(t), 4)."""
+    q0 = np.asarray(q0, dtype=np.float64); q1 = np.asarray(q1, dtype=np.float64); t = np.asarray(t, dtype=np.float64)[:, None]
+    dot = float(np.dot(q0, q1))
+    if dot < 0.0: q1 = -q1; dot = -dot
+    if dot > 0.9995:
+        blended = q0 + (q1 - q0) * t
+        return blended / np.linalg.norm(blended, axis=1, keepdims=True)
+    angle = np.arccos(dot)
+    return (np.sin((1.0 - t) * angle) * q0 + np.sin(t * angle) * q1) / np.sin(angle)
+
+def interpolate_transformations(start, end, t):
+    """The transformations the client shows between two block_display transformations at factors t: translation and
+    scale are blended linearly, rotation is slerped."""
+    pair = np.stack([start, end]).astype(np.float64)
+    loc, rotation, scale = decompose(pair); t = np.asarray(t, dtype=np.float64)
+    q0, q1 = rotation_quaternions(rotation)
+    result = np.zeros((len(t), 4, 4))
+    result[:, :3, :3] = quaternion_rotations(slerp(q0, q1, t)) * (scale[0] + (scale[1] - scale[0]) * t[:, None])[:, None, :]
+    result[:, :3, 3] = loc[0] + (loc[1] - loc[0]) * t[:, None]; result[:, 3, 3] = 1.0
+    return result
+
+def minecraft_matrices(world_matrices, invert_normals=False, morph=None):
+    """Blender world matrices to block_display transformations, for a whole batch at once.
+
+    Entries flagged in morph keep their location and rotation but get MORPH_SCALE as scale, for solidified blocks."""
+    world_matrices = np.asarray(world_matrices, dtype=np.float64).reshape(-1, 4, 4)
+    loc, rotation, scale = decompose(world_matrices)
+    if morph is not None: scale[np.asarray(morph, dtype=np.bool_)] = MORPH_SCALE
+    loc[:, 0] *= -1.0
+    rotation = rotation * MIRROR_X[:, None] * MIRROR_X[None, :]
+    if not invert_normals: scale[:, 0] *= -1.0
+    linear = (rotation @ BASE_CORRECTION) * scale[:, [0, 2, 1]][:, None, :]
+    result = np.zeros_like(world_matrices)
+    result[:, :3, :3] = linear
+    result[:, :3, 3] = loc + PIVOT - linear @ PIVOT
+    result[:, 3, 3] = 1.0
+    return result[:, [0, 2, 1, 3], :] + 0.0  # folds -0.0 into 0.0
+
+def format_matrix(matrix):
+    return ",".join([f"{val:.5f}f" for val in np.ravel(matrix).tolist()])
+
+def are_matrices_close(m1, m2, tolerance=0.0001):
+    if m1 is None or m2 is None: return False
+    return bool(np.all(np.abs(np.asarray(m1, dtype=np.float64) - np.asarray(m2, dtype=np.float64)) <= tolerance))
+
+def are_states_equal(s1, s2, tolerance=0.0001):
+    m1, solidify1, block_light1, sky_light1 = s1
+    m2, solidify2, block_light2, sky_light2 = s2
+
+    if solidify1 != solidify2 or block_light1 != block_light2 or sky_light1 != sky_light2:
+        return False
+
+    return are_matrices_close(m1, m2, tolerance)
+
+CUBE_FACES = ('top', 'bottom', 'front', 'back', 'east', 'west')
+
+def cube_project_uvs(coords, normals):
+    """Blender's Cube Projection with Scale to Bounds for (L, 3) loop coordinates and their faces' (L, 3) normals:
+    each face is projected onto the plane of its dominant axis, then the whole map is stretched to fill 0..1."""
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3); normals = np.abs(np.asarray(normals, dtype=np.float64).reshape(-1, 3))
+    if not len(coords): return np.zeros((0, 2))
+    x_dominant = (normals[:, 0] > normals[:, 1]) & (normals[:, 0] > normals[:, 2])
+    y_dominant = (normals[:, 0] <= normals[:, 1]) & (normals[:, 1] > normals[:, 2])
+    rows = np.arange(len(coords))
+    uvs = np.stack([coords[rows, np.where(x_dominant, 1, 0)], coords[rows, np.where(x_dominant | y_dominant, 2, 1)]], axis=1)
+    low = uvs.min(axis=0); span = uvs.max(axis=0) - low
+    return (uvs - low) / np.where(span > 0.0, span, 1.0)
+
+def cube_face_sides(centers):
+    """Index into CUBE_FACES of each (N, 3) face center of a unit block mesh, or -1 for faces inside the cube."""
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3); x, y, z = centers.T
+    sides = np.full(len(centers), -1, dtype=np.intp)
+    on_x = np.abs(x) > 0.49; sides[on_x] = np.where(x[on_x] > 0, 4, 5)
+    on_y = np.abs(y) > 0.49; sides[on_y] = np.where(y[on_y] < 0, 2, 3)
+    on_z = np.abs(z) > 0.49; sides[on_z] = np.where(z[on_z] > 0, 0, 1)
+    return sides
@@ -83,6 +83,7 @@ class MC_PT_Panel(Panel):
             col.label(text="Datapack Settings:")
             col.prop(props, "datapack_output_path", text="Output Path")
             split = col.split(factor=0.4); split.label(text="Folder Name"); split.prop(props, "folder_name", text="")
+            split = col.split(factor=0.4); split.label(text="Output As"); split.prop(props, "output_format", text="")
             split = col.split(factor=0.4); split.label(text="Namespace"); split.prop(props, "namespace", text="")
             split = col.split(factor=0.4); split.label(text="MC Version"); split.prop(props, "minecraft_version", text="")
             col.separator()
@@ -111,6 +112,9 @@ class MC_PT_Panel(Panel):
                 row = col.row(align=True)
                 row.prop(props, "export_blocks"); row.prop(props, "export_entities")
                 col.prop(props, "pause_support")
+                col.prop(props, "playback_engine")
+                col.prop(props, "fast_sampling")
+                col.prop(props, "use_uuid_addressing")
                 col.separator()
                 col.label(text="Frame Range:")
                 col.prop(props, "use_custom_frame_range")
@@ -125,9 +129,24 @@ class MC_PT_Panel(Panel):
                 block_box.prop(props, "use_interpolation")
                 if props.use_interpolation:
                     interp_box = block_box.box()
-                    split = interp_box.split(factor=0.5); split.label(text="Duration"); split.prop(props, "interpolation_duration", text="")
+                    duration_row = interp_box.row(); duration_row.enabled = not props.use_decimation
+                    split = duration_row.split(factor=0.5); split.label(text="Duration"); split.prop(props, "interpolation_duration", text="")
                     split = interp_box.split(factor=0.5); split.label(text="Start"); split.prop(props, "start_interpolation", text="")
+                    interp_box.prop(props, "use_decimation")
+                    if props.use_decimation:
+                        split = interp_box.split(factor=0.5); split.label(text="Max Error"); split.prop(props, "decimation_error", text="")
+                    split = interp_box.split(factor=0.5); split.label(text="Max Cmds/Tick"); split.prop(props, "max_commands_per_tick", text="")
                 block_box.prop(props, "invert_normals_on_export")
+                block_box.prop(props, "merge_static_blocks")
+                if props.merge_static_blocks: block_box.prop(props, "merge_block_pattern", text="")
+                block_box.prop(props, "detect_rigid_groups")
+                col.separator()
+                col.label(text="Optimizer:")
+                opt_box = col.box()
+                opt_box.prop(props, "optimize_drop_noop_merges")
+                opt_box.prop(props, "optimize_fill_regions")
+                opt_box.prop(props, "optimize_group_contexts")
+                opt_box.prop(props, "optimize_hoist_guards")
                 col.separator()
                 col.label(text="Tracking Options:")
                 entity_box = col.box()
@@ -143,6 +162,8 @@ class MC_PT_Panel(Panel):
                 col.separator()
                 col.prop(props, "model_export_frame")
                 col.prop(props, "invert_normals_on_export")
+                col.prop(props, "merge_static_blocks")
+                if props.merge_static_blocks: col.prop(props, "merge_block_pattern", text="")
         
         layout.separator()
         row = layout.row(); row.scale_y = 2.0; row.operator("mc.generate_datapack", icon='PLAY')
\ No newline at end of file
@@ -1,169 +1,102 @@
 import bpy
 import os
-import json
-import mathutils
-import zipfile
-import tempfile
-import shutil
-import re
-import math
-
-watermark = "# Created using MC Animaker by Priqnot\n\n"
-
-def sanitize_name(name_str):
-    if not name_str: return "unnamed"
-    sanitized = name_str.lower()
-    sanitized = re.sub(r'[^a-z0-9_.-]', '_', sanitized)
-    return sanitized
-
-def get_obj_state_at_frame(context, obj, frame, props):
-    original_frame = context.scene.frame_current
-    context.scene.frame_set(int(frame))
-    state_tuple = (
-        obj.matrix_world.copy(),
-        obj.mc_props.solidify,
-        obj.mc_props.block_light_level,
-        obj.mc_props.sky_light_level
-    )
-    context.scene.frame_set(original_frame)
-    return state_tuple
-
-def get_morphed_matrix(matrix, new_scale_vector):
-    loc, rot, original_scale = matrix.decompose()
-    new_scale_matrix = mathutils.Matrix.Scale(new_scale_vector.x, 4, (1,0,0)) @ \
-                        mathutils.Matrix.Scale(new_scale_vector.y, 4, (0,1,0)) @ \
-                        mathutils.Matrix.Scale(new_scale_vector.z, 4, (0,0,1))
-    return mathutils.Matrix.Translation(loc) @ rot.to_matrix().to_4x4() @ new_scale_matrix
-
-def get_final_minecraft_matrix(world_matrix, props):
-    loc, rot_quat, scale = world_matrix.decompose()
-    loc.x *= -1.0
-    eul = rot_quat.to_euler('XYZ')
-    eul.y *= -1.0
-    eul.z *= -1.0
-    rot_quat = eul.to_quaternion()
-    
-    if not props.invert_normals_on_export:
-        scale.x *= -1.0
-
-    T = mathutils.Matrix.Translation(loc)
-    R = rot_quat.to_matrix().to_4x4()
-    
-    S = mathutils.Matrix.Diagonal((scale.x, scale.z, scale.y, 1.0))
-
-    pitch_fix = mathutils.Matrix.Rotation(math.radians(90.0), 4, 'X')
-    yaw_fix = mathutils.Matrix.Rotation(math.radians(180.0), 4, 'Z')
-    base_correction_rotation = yaw_fix @ pitch_fix
-    R = R @ base_correction_rotation
-
-    offset = mathutils.Vector((0.5, 0.5, 0.5))
-    T_offset_pos = mathutils.Matrix.Translation(offset)
-    T_offset_neg = mathutils.Matrix.Translation(-offset)
-    pivot_transform = T @ T_offset_pos @ R @ S @ T_offset_neg
-
-    coord_conversion_matrix = mathutils.Matrix(((1, 0, 0, 0),
-                                                (0, 0, 1, 0),
-                                                (0, 1, 0, 0),
-                                                (0, 0, 0, 1)))
-    
-    final_matrix = coord_conversion_matrix @ pivot_transform
-    return final_matrix
-
-def format_matrix(matrix):
-    return ",".join([f"{val:.5f}f" for row in matrix for val in row])
-
-def are_matrices_close(m1, m2, tolerance=0.0001):
-    if not m1 or not m2: return False
-    for i in range(4):
-        for j in range(4):
-            if abs(m1[i][j] - m2[i][j]) > tolerance:
-                return False
-    return True
-
-def are_states_equal(s1, s2, tolerance=0.0001):
-    m1, solidify1, block_light1, sky_light1 = s1
-    m2, solidify2, block_light2, sky_light2 = s2
-    
-    if solidify1 != solidify2 or block_light1 != block_light2 or sky_light1 != sky_light2:
-        return False
-        
-    return are_matrices_close(m1, m2, tolerance)
+import numpy as np
+
+from . import resource_pack
+from . import transforms
+
+def reset_cube_uv_maps(objects):
+    """Writes a cube-projected UV map into every mesh of objects through array access, without operators or mode
+    switches. Objects in edit mode are skipped, their mesh data would be overwritten when they leave it."""
+    for mesh in {obj.data for obj in objects if obj and obj.type == 'MESH' and obj.mode != 'EDIT'}:
+        loop_count = len(mesh.loops); face_count = len(mesh.polygons)
+        if not loop_count: continue
+        coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32); mesh.vertices.foreach_get('co', coords)
+        vertex_indices = np.empty(loop_count, dtype=np.int32); mesh.loops.foreach_get('vertex_index', vertex_indices)
+        normals = np.empty(face_count * 3, dtype=np.float32); mesh.polygons.foreach_get('normal', normals)
+        loop_totals = np.empty(face_count, dtype=np.int32); mesh.polygons.foreach_get('loop_total', loop_totals)
+        loop_starts = np.empty(face_count, dtype=np.int32); mesh.polygons.foreach_get('loop_start', loop_starts)
+        order = np.argsort(loop_starts, kind='stable'); loop_faces = np.repeat(order, loop_totals[order])
+        uvs = transforms.cube_project_uvs(coords.reshape(-1, 3)[vertex_indices], normals.reshape(-1, 3)[loop_faces])
+        uv_layer = mesh.uv_layers.active or mesh.uv_layers.new()
+        uv_layer.data.foreach_set('uv', uvs.astype(np.float32).ravel())
+        mesh.update()
 
 def reset_cube_uv_map(obj):
-    if not obj or obj.type != 'MESH': return
-    original_mode = obj.mode
-    bpy.context.view_layer.objects.active = obj
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.uv.cube_project(scale_to_bounds=True)
-    bpy.ops.object.mode_set(mode=original_mode)
+    reset_cube_uv_maps([obj])
+
+def assign_cube_face_materials(mesh, side_slots):
+    """Sets the material index of every outer face of a block mesh from {CUBE_FACES side: slot} in one array write."""
+    face_count = len(mesh.polygons)
+    if not face_count: return
+    centers = np.empty(face_count * 3, dtype=np.float32); mesh.polygons.foreach_get('center', centers)
+    indices = np.empty(face_count, dtype=np.int32); mesh.polygons.foreach_get('material_index', indices)
+    lookup = np.array([side_slots.get(side, -1) for side in transforms.CUBE_FACES] + [-1], dtype=np.int32)
+    slots = lookup[transforms.cube_face_sides(centers)]
+    indices[slots >= 0] = slots[slots >= 0]
+    mesh.polygons.foreach_set('material_index', indices); mesh.update()
 
 class ResourcePackHelper:
-    @staticmethod
-    def get_file_content(rp_path, file_path_in_rp):
-        if not rp_path or not os.path.exists(rp_path): return None
-        try:
-            if zipfile.is_zipfile(rp_path):
-                with zipfile.ZipFile(rp_path, 'r') as z:
-                    with z.open(file_path_in_rp) as f: return f.read().decode('utf-8')
-            else:
-                full_path = os.path.join(rp_path, file_path_in_rp)
-                if os.path.exists(full_path):
-                    with open(full_path, 'r', encoding='utf-8') as f: return f.read()
-        except (KeyError, FileNotFoundError): return None
-
-    @staticmethod
-    def get_image_from_rp(rp_path, texture_path_in_rp, temp_dir):
-        if not rp_path or not os.path.exists(rp_path): return None
-        try:
-            image_filename = os.path.basename(texture_path_in_rp)
-            temp_image_path = os.path.join(temp_dir, image_filename)
-            if zipfile.is_zipfile(rp_path):
-                with zipfile.ZipFile(rp_path, 'r') as z:
-                    with z.open(texture_path_in_rp) as source, open(temp_image_path, 'wb') as target:
-                        shutil.copyfileobj(source, target)
-                    return temp_image_path
-            else:
-                full_path = os.path.join(rp_path, texture_path_in_rp)
-                if os.path.exists(full_path):
-                    shutil.copy(full_path, temp_image_path)
-                    return temp_image_path
-        except (KeyError, FileNotFoundError): return None
-
-    def resolve_model_textures(self, rp_path, model_id):
-        if ':' not in model_id: model_id = f"minecraft:{model_id}"
-        namespace, model_name = model_id.split(':', 1)
-        model_path = f"assets/{namespace}/models/{model_name}.json"
-        model_content = self.get_file_content(rp_path, model_path)
-        if not model_content: return {}
-        try: model_json = json.loads(model_content)
-        except json.JSONDecodeError: return {}
-        textures = {}
-        if 'parent' in model_json:
-            textures.update(self.resolve_model_textures(rp_path, model_json['parent']))
-        if 'textures' in model_json:
-            textures.update(model_json['textures'])
-        return textures
+    """Resource pack lookups for the texture operators, served from the shared ResourcePackIndex of rp_path."""
 
     def find_textures_for_block(self, rp_path, block_id):
-        if ':' not in block_id: block_id = f"minecraft:{block_id}"
-        namespace, block_name = block_id.split(':', 1)
-        base_block_name = block_name.split('[')[0]
-        blockstate_path = f"assets/{namespace}/blockstates/{base_block_name}.json"
-        bs_content = self.get_file_content(rp_path, blockstate_path)
-        if not bs_content: return None, f"Blockstate not found for {base_block_name}. Using fallback."
-        try: bs_json = json.loads(bs_content)
-        except json.JSONDecodeError: return None, f"Invalid blockstate for {base_block_name}. Using fallback."
-        model_id = None
-        if 'variants' in bs_json:
-            variants = bs_json['variants']
-            first_key = next(iter(variants)); model_info = variants[first_key]
-            if isinstance(model_info, list): model_info = model_info[0]
-            model_id = model_info.get('model')
-        if not model_id: return None, "Could not determine model. Using fallback."
-        resolved_textures = self.resolve_model_textures(rp_path, model_id)
-        final_textures = {}
-        for key, value in resolved_textures.items():
-            while value.startswith('#'): value = resolved_textures.get(value[1:], value)
-            final_textures[key] = value
-        return final_textures, "Success"
\ No newline at end of file
+        index = resource_pack.open_index(rp_path)
+        if not index: return None, f"Resource pack not found at {rp_path}. Using fallback."
+        return index.block_textures(block_id)
+
+_texture_images = {}; _texture_materials = {}
+
+def _cached_datablock(cache, collection, key):
+    """Looks key up in cache, then in the datablocks tagged with it, so reopened .blend files keep sharing them."""
+    block = collection.get(cache.get(key, ""))
+    if block is not None and block.get("mca_texture") == key: return block
+    block = next((candidate for candidate in collection if candidate.get("mca_texture") == key), None)
+    if block is not None: cache[key] = block.name
+    return block
+
+def get_texture_image(rp_path, texture_id):
+    """The packed image of a texture id like minecraft:block/oak_log, loaded once per pack from the pack's bytes."""
+    full_path = texture_id if ':' in texture_id else f"minecraft:{texture_id}"
+    namespace, path = full_path.split(':', 1)
+    key = f"{os.path.abspath(rp_path)}|{full_path}"
+    img = _cached_datablock(_texture_images, bpy.data.images, key)
+    if img is not None: return img
+    index = resource_pack.open_index(rp_path)
+    data = index.read_bytes(f"assets/{namespace}/textures/{path}.png") if index else None
+    if data is None: return None
+    img = bpy.data.images.new(os.path.basename(path), 16, 16)
+    img.pack(data=data, data_len=len(data)); img.source = 'FILE'
+    img["mca_texture"] = key; _texture_images[key] = img.name
+    return img
+
+def get_texture_material(rp_path, texture_id, blend_method='CLIP'):
+    """One shared material per (resource pack, texture, alpha mode), showing the texture's first animation frame."""
+    full_path = texture_id if ':' in texture_id else f"minecraft:{texture_id}"
+    key = f"{os.path.abspath(rp_path)}|{full_path}|{blend_method}"
+    mat = _cached_datablock(_texture_materials, bpy.data.materials, key)
+    if mat is not None: return mat
+    img = get_texture_image(rp_path, full_path)
+    if img is None: return None
+
+    mat = bpy.data.materials.new(name=os.path.basename(full_path.split(':', 1)[1])); mat.use_nodes = True
+    bsdf = mat.node_tree.nodes.get('Principled BSDF')
+    base_pos_x, base_pos_y = bsdf.location if bsdf else (0, 0)
+    tex_image_node = mat.node_tree.nodes.new('ShaderNodeTexImage'); tex_image_node.location = (base_pos_x - 300, base_pos_y)
+    mapping_node = mat.node_tree.nodes.new('ShaderNodeMapping'); mapping_node.location = (base_pos_x - 550, base_pos_y)
+    tex_coord_node = mat.node_tree.nodes.new('ShaderNodeTexCoord'); tex_coord_node.location = (base_pos_x - 800, base_pos_y)
+    tex_image_node.image = img; tex_image_node.interpolation = 'Closest'
+
+    img_width, img_height = img.size
+    if img_height > 0:
+        scale_y = img_width / img_height
+        mapping_node.inputs['Scale'].default_value[1] = scale_y
+        mapping_node.inputs['Location'].default_value[1] = 1.0 - scale_y
+
+    mat.node_tree.links.new(mapping_node.inputs['Vector'], tex_coord_node.outputs['UV'])
+    mat.node_tree.links.new(tex_image_node.inputs['Vector'], mapping_node.outputs['Vector'])
+    if bsdf:
+        mat.node_tree.links.new(bsdf.inputs['Base Color'], tex_image_node.outputs['Color'])
+        mat.node_tree.links.new(bsdf.inputs['Alpha'], tex_image_node.outputs['Alpha'])
+    mat.blend_method = blend_method
+    mat["mca_texture"] = key; _texture_materials[key] = mat.name
+    return mat
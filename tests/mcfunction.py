@@ -0,0 +1,130 @@
+"""A small interpreter for the subset of mcfunction the generated trees use, so tests can play them."""
+import re
+
+def function_file(function_id):
+    namespace, path = function_id.split(':', 1)
+    return f"data/{namespace}/function/{path}.mcfunction"
+
+OPERATIONS = {'=': lambda a, b: b, '+=': int.__add__, '-=': int.__sub__, '*=': int.__mul__, '/=': int.__floordiv__, '%=': int.__mod__}
+
+def java_uuid(text):
+    """The ints of the UUID Minecraft's lenient UUID.fromString reads from text."""
+    parts = [int(part, 16) for part in text.split('-')]
+    most = parts[0] << 32 | parts[1] << 16 | parts[2]; least = parts[3] << 48 | parts[4]
+    return (most >> 32, most & 0xffffffff, least >> 32, least & 0xffffffff)
+
+def path_steps(path):
+    return [int(step) if step.lstrip('-').isdigit() else step for step in re.findall(r"[^.\[\]]+", path)]
+
+def in_range(value, spec):
+    if '..' not in spec: return value == int(spec)
+    low, high = spec.split('..')
+    return (low == '' or value >= int(low)) and (high == '' or value <= int(high))
+
+class Interpreter:
+    """Runs functions from {relative path: content}. Calls to functions that are not in files are recorded in calls,
+    commands it does not model in log, with macro lines filled in. Entity conditions are true unless listed in absent_entities.
+    Summoned entities are kept by UUID with their tags; selections counts how often an @e selector was evaluated."""
+
+    def __init__(self, files, absent_entities=(), gametime=0):
+        self.files = files; self.scores = {}; self.calls = []; self.log = []; self.absent_entities = set(absent_entities)
+        self.gametime = gametime; self.storage = {}; self.entities = {}; self.executor = "@s"; self.scheduled = []; self.selections = 0
+
+    def holder(self, name):
+        return self.executor if name == '@s' else name
+
+    def score(self, holder, objective):
+        return self.scores.get((self.holder(holder), objective))
+
+    def tick(self):
+        """Advances the game time by one tick and runs the functions scheduled for it, each on its own."""
+        self.gametime += 1; due = [function for time, function in self.scheduled if time <= self.gametime]
+        self.scheduled = [(time, function) for time, function in self.scheduled if time > self.gametime]
+        for function in due: self.executor = "@s"; self.run(function)
+
+    def select(self, target):
+        if not target.startswith('@e['): return [target] if target == '@s' or target in self.entities else []
+        self.selections += 1; tags = re.findall(r"tag=([\w.-]+)", target)
+        scores = dict(pair.split('=') for pair in re.findall(r"scores=\{([^}]*)\}", target)[0].split(',')) if 'scores=' in target else {}
+        return [entity for entity, entity_tags in self.entities.items() if all(tag in entity_tags for tag in tags)
+                and all(self.score(entity, objective) is not None and in_range(self.score(entity, objective), spec) for objective, spec in scores.items())]
+
+    def storage_get(self, storage, path):
+        value = self.storage.get(storage)
+        for step in path_steps(path): value = value[step]
+        return value
+
+    def storage_set(self, storage, path, value):
+        *parents, last = path_steps(path); compound = self.storage.setdefault(storage, {})
+        for step in parents: compound = compound[step]
+        compound[last] = value
+
+    def run(self, function_id, arguments=None):
+        content = self.files.get(function_file(function_id))
+        if content is None: self.calls.append(function_id); return
+        for line in content.splitlines():
+            line = line.strip()
+            if line.startswith('$'): line = re.sub(r"\$\((\w+)\)", lambda match: str(arguments[match.group(1)]), line[1:])
+            if line and not line.startswith('#'): self.execute(line)
+
+    def execute(self, line):
+        words = line.split(' ')
+        if words[0] == 'execute': return self.execute_subcommands(words[1:])
+        if words[0] == 'function':
+            if words[2:4] != ['with', 'storage']: return self.run(words[1])
+            try: arguments = self.storage_get(words[4], words[5]) if len(words) > 5 else self.storage.get(words[4])
+            except (IndexError, KeyError): return
+            return self.run(words[1], arguments)
+        if words[:2] == ['scoreboard', 'players']: return self.scoreboard(words[2:])
+        if words[0] == 'schedule' and words[1] == 'function':
+            if len(words) < 5: self.scheduled = [entry for entry in self.scheduled if entry[1] != words[2]]
+            self.scheduled.append((self.gametime + int(words[3][:-1]), words[2])); return
+        if words[:3] == ['data', 'modify', 'storage'] and words[5:] == ['append', 'value', '{}']:
+            return self.storage_get(words[3], words[4]).append({}) if words[4] in self.storage.get(words[3], {}) else self.storage_set(words[3], words[4], [{}])
+        if words[:3] == ['data', 'remove', 'storage']:
+            *parents, last = path_steps(words[4])
+            try: container = self.storage_get(words[3], '.'.join(map(str, parents))); del container[last]
+            except (IndexError, KeyError): pass
+            return
+        if words[0] == 'summon' and 'UUID:[I;' in line:
+            uuid = tuple(int(value) & 0xffffffff for value in re.search(r"UUID:\[I;([-\d,]+)\]", line).group(1).split(','))
+            tags = re.search(r"Tags:\[([^\]]*)\]", line).group(1)
+            self.entities['-'.join(f"{part:08x}" for part in uuid)] = set(re.findall(r'"([^"]+)"', tags))
+        self.log.append(line)
+
+    def execute_subcommands(self, words):
+        while words[0] != 'run':
+            kind, condition = words[0], words[1]
+            if kind == 'store' and words[-3:] == ['time', 'query', 'gametime']:
+                self.scores[(self.holder(words[3]), words[4])] = self.gametime; return
+            if kind == 'store' and words[2] == 'storage' and words[-4:-2] == ['players', 'get']:
+                self.storage_set(words[3], words[4], self.score(words[-2], words[-1])); return
+            if kind == 'at': words = words[2:]; continue
+            if kind == 'as':
+                executor = self.executor
+                for entity in self.select(condition if condition.startswith('@') else self.entity_named(condition)):
+                    self.executor = entity if entity != '@s' else executor; self.execute_subcommands(words[2:])
+                self.executor = executor; return
+            if condition == 'score' and words[4] == 'matches':
+                value = self.score(words[2], words[3]); passed = value is not None and in_range(value, words[5]); words = words[6:]
+            elif condition == 'score':
+                left = self.score(words[2], words[3]); operator = words[4]; right = self.score(words[5], words[6]); words = words[7:]
+                passed = left is not None and right is not None and {'<': left < right, '<=': left <= right, '=': left == right, '>=': left >= right, '>': left > right}[operator]
+            elif condition == 'entity':
+                passed = words[2] not in self.absent_entities; words = words[3:]
+            else: raise ValueError(f"Unsupported execute condition: {' '.join(words)}")
+            if passed != (kind == 'if'): return
+        self.execute(' '.join(words[1:]))
+
+    def scoreboard(self, words):
+        action, holder, objective = words[0], words[1], words[2]
+        if action == 'operation':
+            operator, source = words[3], self.score(words[4], words[5]) or 0; value = self.score(holder, objective) or 0
+            value = OPERATIONS[operator](value, source)
+        else:
+            amount = int(words[3]); value = self.score(holder, objective) or 0
+            value = {'set': amount, 'add': value + amount, 'remove': value - amount}[action]
+        self.scores[(self.holder(holder), objective)] = value
+
+    def entity_named(self, text):
+        return '-'.join(f"{part:08x}" for part in java_uuid(text))
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from mca_blender_addon import transforms
+from mca_blender_addon.cache import TRANSLATION_CELLS, AnimationCache, interpolation_error
+
+from synthetic import build_scene, sample_scene
+
+def test_store_and_state_round_trip():
+    cache = AnimationCache(["a", "b"], 5, 9); matrix = np.arange(16, dtype=np.float64).reshape(4, 4) / 7
+    cache.store(7, cache.column("b"), matrix, True, 4, 11)
+    state = cache.state("b", 7)
+    assert np.array_equal(state[0], matrix.astype(np.float32)) and state[1:] == (True, 4, 11)
+    assert np.array_equal(cache.matrix("b", 7), state[0]) and cache.state("a", 7)[1:] == (False, 0, 0)
+    assert cache.frame_count == 5 and cache.row(9) == 4 and AnimationCache(["a"], 3, 1).frame_count == 0
+
+@pytest.fixture
+def changing_cache():
+    rng = np.random.default_rng(3); cache = AnimationCache([f"o{i}" for i in range(6)], 1, 40)
+    cache.transforms[:] = np.eye(4, dtype=np.float32).reshape(16); cache.sky_light[:] = 15
+    steps = rng.random(cache.transforms.shape[:2]) < 0.3
+    cache.transforms[..., 3] += np.cumsum(steps * rng.choice([5e-5, 2e-4], steps.shape), axis=0)
+    cache.transforms[..., 1] += np.cumsum(rng.random(steps.shape) < 0.1, axis=0) * 0.01
+    cache.solidify[:] = np.cumsum(rng.random(steps.shape) < 0.05, axis=0) % 2 == 1
+    cache.block_light[:] = np.cumsum(rng.random(steps.shape) < 0.05, axis=0) % 16
+    return cache
+
+def test_frame_changes_match_per_frame_state_comparison(changing_cache):
+    cache = changing_cache; columns = [4, 0, 2]
+    expected = np.array([[row == 0 or not transforms.are_states_equal(cache.state(cache.names[column], cache.start_frame + row), cache.state(cache.names[column], cache.start_frame + row - 1))
+                          for column in columns] for row in range(cache.frame_count)])
+    assert np.array_equal(cache.frame_changes(columns, chunk_size=7), expected)
+    moved = np.abs(np.diff(cache.transforms[:, columns][..., TRANSLATION_CELLS].astype(np.float64), axis=0)).max(axis=2) > 0.0001
+    assert np.array_equal(cache.frame_changes(columns, chunk_size=7, position_only=True)[1:], moved)
+
+def test_keyframe_changes_compare_each_row_with_the_previous_keyframe(changing_cache):
+    cache = changing_cache; columns = list(range(6)); rows = [0, 3, 4, 10, 25, 39]
+    changed = cache.keyframe_changes(columns, rows, chunk_size=2)
+    assert changed[0].all()
+    for k in range(1, len(rows)):
+        for j, column in enumerate(columns):
+            name = cache.names[column]
+            assert changed[k, j] == (not transforms.are_states_equal(cache.state(name, cache.start_frame + rows[k]), cache.state(name, cache.start_frame + rows[k - 1])))
+
+@pytest.mark.parametrize("motion", ['linear', 'noisy', 'periodic'])
+def test_decimated_rows_keep_the_client_within_max_error(motion):
+    specs, locations, rotations = build_scene(4, 0, 60, motion, seed=8)
+    cache = sample_scene(specs, locations, rotations); cache.solidify[30:, 1] = True
+    for column in range(len(specs)):
+        matrices = transforms.minecraft_matrices(cache.transforms[:, column].reshape(-1, 4, 4).astype(np.float64))
+        kept = {}
+        for max_error in (0.01, 0.1):
+            rows = kept[max_error] = cache.decimated_rows(column, max_error)
+            assert rows[0] == 0 and rows[-1] == cache.frame_count - 1 and rows == sorted(set(rows))
+            assert all(interpolation_error(matrices, start, end).max() <= max_error for start, end in zip(rows, rows[1:]) if end - start > 1)
+        assert len(kept[0.1]) <= len(kept[0.01])
+        if motion == 'linear': assert len(kept[0.01]) < cache.frame_count // 4
+        if column == 1: assert {29, 30} <= set(kept[0.1])
+
+def test_decimated_rows_of_a_still_object():
+    cache = sample_scene(*build_scene(1, 0, 20, 'static'))
+    assert cache.decimated_rows(0, 0.01) == [0]
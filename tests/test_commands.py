@@ -0,0 +1,69 @@
+import itertools
+
+from mca_blender_addon.commands import Command, drop_noop_merges, fill_boxes, hoist_guard, merge_setblocks
+
+def covered(boxes):
+    return [(x, y, z) for (x1, y1, z1), (x2, y2, z2) in boxes for x in range(x1, x2 + 1) for y in range(y1, y2 + 1) for z in range(z1, z2 + 1)]
+
+def test_fill_boxes_cover_positions_exactly_once():
+    positions = {(x, y, z) for x, y, z in itertools.product(range(6), range(4), range(3)) if (x + y * z) % 5}
+    positions |= {(10, 0, 0), (11, 0, 0), (-3, 7, 2)}
+    cells = covered(fill_boxes(positions))
+    assert sorted(cells) == sorted(positions)
+
+def test_fill_boxes_stay_within_fill_volume():
+    positions = set(itertools.product(range(40), range(40), range(30)))
+    boxes = fill_boxes(positions)
+    assert all((x2 - x1 + 1) * (y2 - y1 + 1) * (z2 - z1 + 1) <= 32768 for (x1, y1, z1), (x2, y2, z2) in boxes)
+    assert sorted(covered(boxes)) == sorted(positions)
+    assert len(boxes) < 10
+
+def test_fill_boxes_respect_a_small_cap():
+    boxes = fill_boxes(set(itertools.product(range(5), range(5), range(1))), max_volume=4)
+    assert all((x2 - x1 + 1) * (y2 - y1 + 1) <= 4 for (x1, y1, _), (x2, y2, _) in boxes)
+    assert len(covered(boxes)) == 25
+
+def setblock(x, y, z, block, **kwargs):
+    return Command(f"setblock ~{x} ~{y} ~{z} {block}", context="at @e[tag=ref]", free=True, **kwargs)
+
+def test_merge_setblocks_keeps_the_last_write():
+    function = [setblock(0, 0, 0, "minecraft:stone"), setblock(1, 0, 0, "minecraft:stone"), Command("say hi"), setblock(0, 0, 0, "minecraft:air")]
+    merged = merge_setblocks(function)
+    bodies = [command.body for command in merged]
+    assert "setblock ~0 ~0 ~0 minecraft:air" in bodies and "setblock ~1 ~0 ~0 minecraft:stone" in bodies
+    assert not any("~0 ~0 ~0 minecraft:stone" in body or "fill ~0 ~0 ~0 ~1" in body for body in bodies)
+    assert bodies[-1] == "say hi"
+
+def test_merge_setblocks_fills_large_regions_in_capped_boxes():
+    function = [setblock(x, y, z, "minecraft:stone") for x, y, z in itertools.product(range(40), range(40), range(25))]
+    merged = merge_setblocks(function)
+    fills = [command.body.split(" ") for command in merged]
+    assert all(parts[0] == "fill" for parts in fills) and len(fills) <= 3
+    volume = 0
+    for parts in fills:
+        low, high = [int(value[1:]) for value in parts[1:4]], [int(value[1:]) for value in parts[4:7]]
+        size = (high[0] - low[0] + 1) * (high[1] - low[1] + 1) * (high[2] - low[2] + 1)
+        assert size <= 32768; volume += size
+    assert volume == 40 * 40 * 25
+    assert all(command.context == "at @e[tag=ref]" and command.free for command in merged)
+
+def test_merge_setblocks_leaves_mixed_contexts_alone():
+    function = [setblock(0, 0, 0, "minecraft:stone"), Command("setblock ~1 ~0 ~0 minecraft:stone", context="at @s")]
+    assert merge_setblocks(function) == function
+
+def test_hoist_guard_keeps_free_commands_ahead_of_the_return():
+    guard = "if entity @e[tag=x_playing]"
+    function = [Command("tp @s ~ ~ ~", guard, target="a"), Command("setblock ~ ~ ~ stone", free=True), Command("data merge entity b {}", guard, target="b")]
+    hoisted = hoist_guard(function)
+    assert [command.render() for command in hoisted] == [
+        "setblock ~ ~ ~ stone", "execute unless entity @e[tag=x_playing] run return 0", "tp @s ~ ~ ~", "data merge entity b {}"]
+
+def test_hoist_guard_gives_up_when_an_unguarded_command_depends_on_order():
+    guard = "if entity @e[tag=x_playing]"
+    function = [Command("a", guard), Command("b"), Command("c", guard)]
+    assert hoist_guard(function) == function
+
+def test_drop_noop_merges_only_drops_repeats_of_the_last_write():
+    merge_a = Command("data merge entity a {x:1}", target="a"); merge_a2 = Command("data merge entity a {x:2}", target="a")
+    functions = drop_noop_merges([[merge_a], [merge_a, Command("say")], [merge_a2], [merge_a]])
+    assert functions == [[merge_a], [Command("say")], [merge_a2], [merge_a]]
@@ -0,0 +1,174 @@
+import functools
+import re
+
+import numpy as np
+import pytest
+
+from mca_blender_addon import generator, output, transforms
+from mca_blender_addon.commands import Command
+from mca_blender_addon.scene import ExportSettings
+
+from mcfunction import Interpreter, function_file, java_uuid
+from synthetic import build_scene, sample_scene
+
+def merge(target, start):
+    return f"data merge entity {target} {{interpolation_duration:2,start_interpolation:{start}}}"
+
+def test_spread_commands_moves_merges_after_the_previous_interpolation():
+    frame_commands = {0: [Command("say start")], 10: [Command(merge(f"b{i}", 0), target=f"b{i}") for i in range(6)]}
+    movable = {10: [(i, 4 if i < 3 else 9, functools.partial(merge, f"b{i}")) for i in range(6)]}
+    spread = generator.spread_commands(frame_commands, movable, 2, 0)
+    assert len(spread[10]) == 2 and all(len(commands) <= 2 for commands in spread.values())
+    for tick, commands in spread.items():
+        for command in commands:
+            if not command.target: continue
+            i = int(command.target[1:]); start = int(command.body.split("start_interpolation:")[1][:-1])
+            assert tick + start == 10
+            assert tick >= (4 if i < 3 else 9)
+
+def test_spread_commands_keeps_merges_that_have_nowhere_to_go():
+    frame_commands = {10: [Command(merge(f"b{i}", 1), target=f"b{i}") for i in range(4)]}
+    movable = {10: [(i, 10, functools.partial(merge, f"b{i}")) for i in range(4)]}
+    assert generator.spread_commands(frame_commands, movable, 1, 1) == frame_commands
+
+def test_spread_commands_counts_other_chains_against_the_cap():
+    frame_commands = {10: [Command(merge(f"b{i}", 0), target=f"b{i}") for i in range(4)]}
+    movable = {10: [(i, 0, functools.partial(merge, f"b{i}")) for i in range(4)]}
+    reserved = {10: 1, 9: 3, 8: 1}
+    spread = generator.spread_commands(frame_commands, movable, 3, 0, reserved)
+    assert all(len(spread.get(tick, [])) + reserved.get(tick, 0) <= 3 for tick in range(11))
+    assert len(spread[10]) == 2 and len(spread[8]) == 2 and 9 not in spread
+
+@pytest.fixture(scope="module")
+def scene():
+    specs, locations, rotations = build_scene(24, 3, 40, 'periodic', seed=2)
+    cache = sample_scene(specs, locations, rotations)
+    cache.solidify[20:, :2] = True
+    cache.transforms.reshape(-1, len(specs), 4, 4)[:, 5:9, :3, 3] = cache.transforms.reshape(-1, len(specs), 4, 4)[:, 5:6, :3, 3]
+    return specs, cache
+
+OPTIONS = [
+    {},
+    {'playback_engine': 'CLOCK'},
+    {'playback_engine': 'INSTANCED'},
+    {'pause_support': False, 'use_uuid_addressing': True},
+    {'use_decimation': True, 'max_commands_per_tick': 5},
+    {'optimize_drop_noop_merges': False, 'optimize_fill_regions': False, 'optimize_group_contexts': False, 'optimize_hoist_guards': False},
+    {'merge_static_blocks': True, 'merge_block_pattern': '*', 'detect_rigid_groups': True},
+    {'minecraft_version': '1.20', 'output_format': 'ZIP'},
+]
+
+@pytest.mark.parametrize("options", OPTIONS)
+def test_compile_animation_runs_across_engines_and_options(scene, options):
+    specs, cache = scene
+    settings = ExportSettings(**options); writer = output.DirectoryWriter("/nonexistent")
+    report = generator.compile_animation(settings, specs, cache, writer)
+    folder = generator.VERSION_MAP[settings.minecraft_version]['function_folder']
+    assert "pack.mcmeta" in writer.files
+    assert any(path.startswith(f"data/mca/{folder}/animations/_main/scene_name/") for path in writer.files)
+    assert report['commands_after'] <= report['commands_before']
+    assert all("\n\n\n" not in content for content in writer.files.values())
+
+def test_compile_steps_report_progress_in_order(scene):
+    specs, cache = scene
+    steps = generator.compile_animation_steps(ExportSettings(), specs, cache, output.DirectoryWriter("/nonexistent"))
+    progress = []
+    while True:
+        try: stage, fraction = next(steps)
+        except StopIteration as done: report = done.value; break
+        assert stage in generator.COMPILE_STAGES; progress.append(fraction)
+    assert progress == sorted(progress) and progress[-1] == 1.0 and 'peak_commands_after' in report
+
+def test_compile_model_writes_one_summon(scene):
+    specs, cache = scene
+    writer = output.DirectoryWriter("/nonexistent")
+    generator.compile_model(ExportSettings(scene_name="Model"), specs, cache, cache.start_frame + 3, writer)
+    create = writer.files["data/mca/function/models/model/create.mcfunction"]
+    assert create.count("summon block_display") == 1 and "UUID" not in create
+
+def instanced_export(specs, cache, **options):
+    writer = output.DirectoryWriter("/nonexistent")
+    generator.compile_animation(ExportSettings(playback_engine='INSTANCED', **options), specs, cache, writer)
+    return writer.files
+
+@pytest.mark.parametrize("copy_id", [1, 9, 10, 37, 4096, 99999999])
+def test_instanced_copies_address_the_entities_they_spawned(scene, copy_id):
+    specs, cache = scene; files = instanced_export(specs, cache)
+    machine = Interpreter(files); machine.scores = {("#scene_name", "mca_id"): copy_id - 1, ("#10", "mca_const"): 10, ("#16", "mca_const"): 16}
+    machine.run("mca:animations/_main/scene_name/create")
+    spawned = [tuple(int(value) & 0xffffffff for value in ints.split(',')) for ints in re.findall(r"UUID:\[I;([-\d,]+)\]", "\n".join(machine.log))]
+    addressed = set(re.findall(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-0000-\$\(id\)", "\n".join(files.values())))
+    assert len(spawned) == len(specs) + 2 and len(addressed) == len(specs) + 2
+    assert [machine.score(ref, "mca_id") for ref in machine.select("@e[tag=scene_name_ref]")] == [copy_id]
+    assert all(java_uuid(text.replace("$(id)", str(copy_id))) in spawned for text in addressed)
+
+def commands_run(files, path):
+    lines = [line for line in files[path].splitlines() if line and not line.startswith('#')]
+    return len(lines) + sum(commands_run(files, function_file(line.split(' ')[1])) for line in lines if line.startswith('function ') and function_file(line.split(' ')[1]) in files)
+
+def test_instanced_keyframes_only_touch_what_changes():
+    specs, locations, rotations = build_scene(200, 2, 30, 'periodic', seed=4)
+    locations[:, 3:200] = locations[:1, 3:200]; rotations[:, 3:200] = rotations[:1, 3:200]
+    files = instanced_export(specs, sample_scene(specs, locations, rotations))
+    keyframes = "data/mca/function/animations/scenes/scene_name/keyframes"
+    for chain, changing in (("blocks", 3), ("entity", 2)):
+        ticks = [path for path in files if re.fullmatch(rf"{keyframes}/{chain}/[1-9]\d*\.mcfunction", path)]
+        assert ticks and all(commands_run(files, path) <= changing + 2 for path in ticks)
+    assert not any("@e[" in content or "on passengers" in content for path, content in files.items() if path.startswith(keyframes))
+
+@pytest.mark.parametrize("copies", [1, 4, 16])
+def test_instanced_clock_scans_for_playing_copies_once_per_tick(scene, copies):
+    specs, cache = scene; files = instanced_export(specs, cache)
+    machine = Interpreter(files, gametime=500); machine.scores = {("#10", "mca_const"): 10, ("#16", "mca_const"): 16, ("#100", "mca_const"): 100}
+    for _ in range(copies): machine.run("mca:animations/_main/scene_name/create")
+    refs = machine.select("@e[tag=scene_name_ref]"); machine.selections = 0
+    for ref in refs: machine.executor = ref; machine.run("mca:animations/scenes/scene_name/instance/play")
+    machine.executor = refs[0]; machine.run("mca:animations/scenes/scene_name/instance/play")
+    for _ in range(10): machine.tick()
+    assert machine.selections == 10 and [machine.score(ref, "mca_frame") for ref in refs] == [10] * copies
+    assert sum(function.endswith("/step") for _, function in machine.scheduled) == copies
+
+def test_instanced_engine_needs_macros_and_early_return(scene):
+    specs, cache = scene
+    with pytest.raises(ValueError): instanced_export(specs, cache, minecraft_version='1.20.2')
+
+def rigid_scene():
+    specs, locations, rotations = build_scene(10, 1, 20, 'static')
+    t = np.arange(1, 20, dtype=np.float64)
+    locations[1:, 0:4, 0] += (t * 0.01 + 4e-5)[:, None]; locations[1:, 1, 0] += 2e-5; locations[1:, 3, 0] += 5e-5
+    locations[1:, 4:7, 0] += (t * 0.01 + 4e-5)[:, None]; locations[1:, 6, 0] += 5e-4; rotations[:, 4:6, 2] = np.arange(20)[:, None] * 0.01
+    locations[1:, 7:10, 1] += np.sin(t)[:, None]
+    cache = sample_scene(specs, locations, rotations); cache.sky_light[10:, 9] = 7
+    return specs, cache
+
+def test_find_rigid_groups_clusters_paths_within_tolerance():
+    specs, cache = rigid_scene()
+    rest, groups = generator.find_rigid_groups(ExportSettings(detect_rigid_groups=True), specs, cache)
+    assert [[obj.name for obj in group.members] for group in groups] == [[f"block_{i}" for i in range(4)], ["block_7", "block_8"]]
+    assert [group.name for group in groups] == ["block_0", "block_7"] and np.allclose(groups[1].origin, cache.transforms[0].reshape(-1, 4, 4)[7, :3, 3])
+    assert [obj.name for obj in rest] == ["block_4", "block_5", "block_6", "block_9", "entity_0"]
+
+@pytest.mark.parametrize("version, interpolation, grouped", [('1.20.2', True, 2), ('1.20', True, 0), ('1.20', False, 2)])
+def test_find_rigid_groups_needs_teleport_duration_to_interpolate(version, interpolation, grouped):
+    specs, cache = rigid_scene()
+    settings = ExportSettings(detect_rigid_groups=True, minecraft_version=version, use_interpolation=interpolation)
+    assert len(generator.find_rigid_groups(settings, specs, cache)[1]) == grouped
+
+def unit_box_bounds(matrices):
+    corners = np.array([[x, y, z, 1.0] for x in (0, 1) for y in (0, 1) for z in (0, 1)])
+    points = np.einsum('nij,cj->nci', np.asarray(matrices), corners)[..., :3].reshape(-1, 3)
+    return np.round(points.min(axis=0), 6).tolist(), np.round(points.max(axis=0), 6).tolist()
+
+@pytest.mark.parametrize("static_only", [False, True])
+def test_merge_static_blocks_covers_exactly_the_merged_cells(static_only):
+    specs, locations, rotations = build_scene(11, 0, 10, 'static')
+    for i, block_id in enumerate(["white_concrete"] * 6 + ["white_wool"] * 2 + ["red_concrete"] * 2 + ["white_concrete"]): specs[i].block_id = f"minecraft:{block_id}"
+    locations[:, 3, 1] += np.arange(10) * 0.1
+    cache = sample_scene(specs, locations, rotations); frame = cache.start_frame
+    rest, boxes, saved = generator.merge_static_blocks(ExportSettings(merge_static_blocks=True), specs, cache, frame, static_only)
+    runs = [[0, 1, 2], [4, 5], [8, 9]] if static_only else [[0, 1, 2, 3, 4, 5], [8, 9]]
+    assert [obj.name for obj in rest] == [f"block_{i}" for i in range(11) if not any(i in run for run in runs)]
+    assert saved == sum(len(run) for run in runs) - len(boxes)
+    singles = transforms.minecraft_matrices(cache.transforms[cache.row(frame)], False)
+    assert sorted(unit_box_bounds([matrix]) for _, matrix, _, _ in boxes) == sorted(unit_box_bounds(singles[run]) for run in runs)
+    assert sorted(block_id for block_id, _, _, _ in boxes) == sorted(specs[run[0]].block_id for run in runs)
@@ -0,0 +1,16 @@
+import numpy as np
+
+from mca_blender_addon import nbt, transforms
+
+def test_matrix_formatter_prints_what_format_matrix_prints():
+    rng = np.random.default_rng(12)
+    matrices = rng.uniform(-3, 3, (20, 4, 4)); matrices[3] = matrices[7]; matrices[5, 0, 1] = -0.0; matrices[6] = matrices[5]; matrices[6, 0, 1] = 0.0
+    strings = nbt.MatrixFormatter().format_many(matrices)
+    assert strings == [transforms.format_matrix(matrix) for matrix in matrices]
+    assert "-0.00000f" in strings[5] and strings[5] != strings[6]
+
+def test_matrix_formatter_reuses_strings_across_calls():
+    formatter = nbt.MatrixFormatter(); matrix = np.eye(4) * 0.5
+    first = formatter.format_many([matrix, np.eye(4)]); second = formatter.format_many([np.eye(4), matrix, matrix])
+    assert second[1] is first[0] and second[2] is first[0] and second[0] is first[1]
+    assert len(formatter.strings) == 2 and formatter.format_many([]) == []
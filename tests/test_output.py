@@ -0,0 +1,75 @@
+import os
+import json
+import zipfile
+
+import pytest
+
+from mca_blender_addon import output
+
+OWNED = ("data/t/function/scene/",)
+
+def test_merge_tag_keeps_previous_entries_once():
+    previous = json.dumps({"values": ["a:load", {"id": "b:load", "required": False}]})
+    merged = json.loads(output.merge_tag(previous, ["b:load", "c:load"]))
+    assert merged["values"] == ["a:load", {"id": "b:load", "required": False}, {"id": "c:load", "required": False}]
+    assert json.loads(output.merge_tag("not json", ["a:load"]))["values"] == [{"id": "a:load", "required": False}]
+
+def write_folder(root, files, tags=()):
+    writer = output.DirectoryWriter(root, OWNED)
+    for path, content in files.items(): writer.write(path, content)
+    for path, value in tags: writer.add_to_tag(path, value)
+    return writer.close()
+
+def test_directory_writer_skips_unchanged_files_and_prunes_stale_ones(tmp_path):
+    root = str(tmp_path / "pack")
+    files = {"data/t/function/scene/a.mcfunction": "say a", "data/t/function/scene/b.mcfunction": "say b", "pack.mcmeta": "{}"}
+    assert write_folder(root, files) == {'written': 3, 'skipped': 0, 'deleted': 0}
+    with open(os.path.join(root, output.MANIFEST_NAME)) as f: assert set(json.load(f)) == set(files)
+
+    os.makedirs(os.path.join(root, "data", "t", "function", "other"))
+    with open(os.path.join(root, "data", "t", "function", "other", "keep.mcfunction"), "w") as f: f.write("say keep")
+    with open(os.path.join(root, "data", "t", "function", "scene", "orphan.mcfunction"), "w") as f: f.write("say orphan")
+    files = {"data/t/function/scene/a.mcfunction": "say a", "pack.mcmeta": "{\"changed\": 1}"}
+    assert write_folder(root, files) == {'written': 1, 'skipped': 1, 'deleted': 2}
+    assert not os.path.exists(os.path.join(root, "data", "t", "function", "scene", "b.mcfunction"))
+    assert not os.path.exists(os.path.join(root, "data", "t", "function", "scene", "orphan.mcfunction"))
+    assert os.path.exists(os.path.join(root, "data", "t", "function", "other", "keep.mcfunction"))
+
+def test_directory_writer_merges_function_tags(tmp_path):
+    root = str(tmp_path / "pack"); tag = "data/minecraft/tags/function/load.json"
+    write_folder(root, {}, [(tag, "t:one")]); write_folder(root, {}, [(tag, "t:two")])
+    with open(os.path.join(root, *tag.split('/'))) as f: values = [entry["id"] for entry in json.load(f)["values"]]
+    assert values == ["t:one", "t:two"]
+
+def test_directory_writer_discard_writes_nothing(tmp_path):
+    writer = output.DirectoryWriter(str(tmp_path / "pack"), OWNED); writer.write("pack.mcmeta", "{}"); writer.discard()
+    assert not (tmp_path / "pack").exists()
+
+def write_zip(path, files, tags=()):
+    writer = output.ZipWriter(path, OWNED)
+    for name, content in files.items(): writer.write(name, content)
+    for name, value in tags: writer.add_to_tag(name, value)
+    return writer.close()
+
+def test_zip_writer_carries_over_entries_it_does_not_own(tmp_path):
+    path = str(tmp_path / "pack.zip"); tag = "data/minecraft/tags/function/load.json"
+    write_zip(path, {"data/t/function/scene/a.mcfunction": "say a", "data/t/function/other/keep.mcfunction": "say keep"}, [(tag, "t:one")])
+    stats = write_zip(path, {"data/t/function/scene/b.mcfunction": "say b"}, [(tag, "t:two")])
+    assert stats['deleted'] == 1
+    with zipfile.ZipFile(path) as archive:
+        assert sorted(archive.namelist()) == sorted(["data/t/function/scene/b.mcfunction", "data/t/function/other/keep.mcfunction", tag])
+        assert [entry["id"] for entry in json.loads(archive.read(tag))["values"]] == ["t:one", "t:two"]
+    assert not os.path.exists(path + ".tmp")
+
+def test_zip_writer_discard_keeps_the_previous_archive(tmp_path):
+    path = str(tmp_path / "pack.zip")
+    write_zip(path, {"pack.mcmeta": "{}"})
+    writer = output.ZipWriter(path, OWNED); writer.write("data/t/function/scene/a.mcfunction", "say a"); writer.discard()
+    with zipfile.ZipFile(path) as archive: assert archive.namelist() == ["pack.mcmeta"]
+    assert not os.path.exists(path + ".tmp")
+
+def test_writers_refuse_a_path_written_twice(tmp_path):
+    for writer in (output.DirectoryWriter(str(tmp_path / "pack"), OWNED), output.ZipWriter(str(tmp_path / "pack.zip"), OWNED)):
+        writer.write("data/t/function/scene/a.mcfunction", "say a")
+        with pytest.raises(ValueError): writer.write("data/t/function/scene/a.mcfunction", "say b")
+        writer.discard()
@@ -0,0 +1,74 @@
+import json
+import os
+import zipfile
+
+import pytest
+
+from mca_blender_addon import resource_pack
+
+PACK = {
+    "assets/minecraft/blockstates/stone.json": {"variants": {"": {"model": "minecraft:block/stone"}}},
+    "assets/minecraft/blockstates/oak_log.json": {"variants": {"axis=y": [{"model": "block/oak_log"}], "axis=x": {"model": "block/oak_log_horizontal"}}},
+    "assets/minecraft/models/block/stone.json": {"parent": "block/cube_all", "textures": {"all": "minecraft:block/stone"}},
+    "assets/minecraft/models/block/oak_log.json": {"parent": "minecraft:block/cube_column", "textures": {"end": "block/oak_log_top", "side": "block/oak_log"}},
+    "assets/minecraft/models/block/cube_all.json": {"parent": "block/cube", "textures": {"particle": "#all", "down": "#all", "up": "#all"}},
+    "assets/minecraft/models/block/cube_column.json": {"parent": "block/cube", "textures": {"particle": "#side", "down": "#end", "north": "#side"}},
+    "assets/minecraft/models/block/cube.json": {"elements": []},
+}
+
+def write_pack(root, kind):
+    if kind == 'folder':
+        for name, content in PACK.items():
+            os.makedirs(os.path.dirname(root / name), exist_ok=True)
+            (root / name).write_text(json.dumps(content))
+        return str(root)
+    with zipfile.ZipFile(root.with_suffix(".zip"), 'w') as archive:
+        for name, content in PACK.items(): archive.writestr(name, json.dumps(content))
+    return str(root.with_suffix(".zip"))
+
+@pytest.fixture(params=['folder', 'zip'])
+def pack(tmp_path, request):
+    yield write_pack(tmp_path / "pack", request.param)
+    resource_pack.release()
+
+def test_block_textures_follow_the_parent_chain(pack):
+    index = resource_pack.ResourcePackIndex(pack)
+    assert index.block_textures("stone") == ({"all": "minecraft:block/stone", "particle": "minecraft:block/stone", "down": "minecraft:block/stone", "up": "minecraft:block/stone"}, "Success")
+    assert index.block_textures("minecraft:oak_log[axis=y]")[0] == {"end": "block/oak_log_top", "side": "block/oak_log", "particle": "block/oak_log", "down": "block/oak_log_top", "north": "block/oak_log"}
+    assert index.block_textures("dirt") == (None, "Blockstate not found for dirt. Using fallback.")
+    assert index.json.cache_info().misses == len(PACK) + 1  # every file once, cube.json included, plus the missing dirt blockstate
+    index.block_textures("stone")[0]["all"] = "changed"
+    assert index.block_textures("stone")[0]["all"] == "minecraft:block/stone"
+    index.close()
+    assert index.block_textures("stone") == (None, "Resource pack was closed. Using fallback.")
+
+def test_open_index_is_shared_until_a_nested_file_changes(pack):
+    index = resource_pack.open_index(pack)
+    assert resource_pack.open_index(pack) is index and not index.is_stale()
+    if pack.endswith(".zip"):
+        with zipfile.ZipFile(pack, 'a') as archive: archive.writestr("assets/minecraft/textures/block/stone.png", b"png")
+    else:
+        with open(os.path.join(pack, "assets/minecraft/models/block/stone.json"), 'a') as f: f.write(" ")
+    index.checked -= index.recheck_seconds
+    reopened = resource_pack.open_index(pack)
+    assert reopened is not index and index.closed and reopened.block_textures("stone")[1] == "Success"
+    assert resource_pack.open_index(os.path.join(pack, "missing")) is None and reopened.closed
+
+def test_resolved_textures_persist_until_a_nested_file_changes(pack, tmp_path, monkeypatch):
+    monkeypatch.setattr(resource_pack, "cache_dir", str(tmp_path / "cache"))
+    index = resource_pack.ResourcePackIndex(pack); expected = index.block_textures("stone"); index.close()
+    reopened = resource_pack.ResourcePackIndex(pack)
+    assert list(reopened.resolved) == ["minecraft:stone"] and reopened.block_textures("stone") == expected
+    assert reopened.json.cache_info().misses == 0
+    reopened.close()
+    if pack.endswith(".zip"):
+        with zipfile.ZipFile(pack, 'a') as archive: archive.writestr("assets/minecraft/textures/block/stone.png", b"png")
+    else:
+        with open(os.path.join(pack, "assets/minecraft/models/block/cube_all.json"), 'a') as f: f.write(" ")
+    assert resource_pack.ResourcePackIndex(pack).resolved == {}
+
+def test_warm_up_persists_what_it_resolved(pack, tmp_path, monkeypatch):
+    monkeypatch.setattr(resource_pack, "cache_dir", str(tmp_path / "cache"))
+    resource_pack.warm_up(pack, ["stone", "oak_log", "dirt"]).join()
+    resource_pack.release()
+    assert set(resource_pack.ResourcePackIndex(pack).resolved) == {"minecraft:stone", "minecraft:oak_log", "minecraft:dirt"}
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from mca_blender_addon import sampling
+
+def rodrigues(axis, angle):
+    axis = np.asarray(axis, dtype=np.float64) / np.linalg.norm(axis)
+    cross = np.array([[0, -axis[2], axis[1]], [axis[2], 0, -axis[0]], [-axis[1], axis[0], 0]])
+    return np.eye(3) * np.cos(angle) + np.sin(angle) * cross + (1 - np.cos(angle)) * np.outer(axis, axis)
+
+@pytest.mark.parametrize("order", ['XYZ', 'XZY', 'YXZ', 'YZX', 'ZXY', 'ZYX'])
+def test_euler_matrices_apply_axes_in_order(order):
+    angles = np.random.default_rng(5).uniform(-np.pi, np.pi, (16, 3))
+    expected = []
+    for frame in angles:
+        first, second, third = (rodrigues(np.eye(3)['XYZ'.index(axis)], frame['XYZ'.index(axis)]) for axis in order)
+        expected.append(third @ second @ first)
+    assert np.allclose(sampling.euler_to_matrices(angles, order), expected)
+
+def test_quaternion_and_axis_angle_matrices_rotate_about_their_axis():
+    rng = np.random.default_rng(6); axes = rng.normal(size=(16, 3)); angles = rng.uniform(-np.pi, np.pi, 16)
+    expected = [rodrigues(axis, angle) for axis, angle in zip(axes, angles)]
+    units = axes / np.linalg.norm(axes, axis=1)[:, None]
+    quats = np.concatenate([np.cos(angles / 2)[:, None], units * np.sin(angles / 2)[:, None]], axis=1) * rng.uniform(0.5, 2.0, (16, 1))
+    assert np.allclose(sampling.quaternion_to_matrices(quats), expected)
+    assert np.allclose(sampling.axis_angle_to_matrices(np.concatenate([angles[:, None], axes], axis=1)), expected)
+    assert np.allclose(sampling.quaternion_to_matrices(np.zeros((1, 4))), np.eye(3))
+    assert np.allclose(sampling.axis_angle_to_matrices(np.array([[1.0, 0.0, 0.0, 0.0]])), np.eye(3))
+
+def test_compose_matrices_scales_before_rotating():
+    rotation = rodrigues([0, 0, 1], np.pi / 2)[None]; matrices = sampling.compose_matrices(np.array([[1.0, 2.0, 3.0]]), rotation, np.array([[2.0, 1.0, 1.0]]))
+    assert np.allclose(matrices[0] @ [1, 0, 0, 1], [1, 4, 3, 1]) and np.allclose(matrices[0, 3], [0, 0, 0, 1])
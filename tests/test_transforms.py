@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from mca_blender_addon import transforms
+
+def axis_rotation(axis, angle):
+    c, s = np.cos(angle), np.sin(angle); i, j = (axis + 1) % 3, (axis + 2) % 3
+    r = np.eye(4); r[i, i] = c; r[j, j] = c; r[j, i] = s; r[i, j] = -s
+    return r
+
+def translation(vector):
+    t = np.eye(4); t[:3, 3] = vector
+    return t
+
+def legacy_minecraft_matrix(world_matrix, invert_normals):
+    """The pre-port get_final_minecraft_matrix step by step, with numpy standing in for mathutils."""
+    basis = world_matrix[:3, :3]; scale = np.linalg.norm(basis, axis=0)
+    if np.linalg.det(basis) < 0: scale = -scale
+    loc = world_matrix[:3, 3].copy(); rotation = basis / scale
+    x, y, z = np.arctan2(rotation[2, 1], rotation[2, 2]), np.arcsin(-rotation[2, 0]), np.arctan2(rotation[1, 0], rotation[0, 0])
+    loc[0] *= -1.0
+    r = axis_rotation(2, -z) @ axis_rotation(1, -y) @ axis_rotation(0, x)
+    if not invert_normals: scale[0] *= -1.0
+    s = np.diag([scale[0], scale[2], scale[1], 1.0])
+    r = r @ axis_rotation(2, np.pi) @ axis_rotation(0, np.pi / 2)
+    pivot = translation(loc) @ translation([0.5] * 3) @ r @ s @ translation([-0.5] * 3)
+    return np.array([[1, 0, 0, 0], [0, 0, 1, 0], [0, 1, 0, 0], [0, 0, 0, 1]]) @ pivot
+
+@pytest.mark.parametrize("invert_normals", [False, True])
+def test_minecraft_matrices_match_the_old_per_object_conversion(invert_normals):
+    rng = np.random.default_rng(11); worlds = []
+    for k in range(64):
+        x, y, z = rng.uniform(-np.pi, np.pi), rng.uniform(-1.4, 1.4), rng.uniform(-np.pi, np.pi)
+        scale = rng.uniform(0.2, 3.0, 3) * (-1.0 if k % 5 == 0 else 1.0)
+        worlds.append(translation(rng.uniform(-20, 20, 3)) @ axis_rotation(2, z) @ axis_rotation(1, y) @ axis_rotation(0, x) @ np.diag(list(scale) + [1.0]))
+    batch = transforms.minecraft_matrices(np.array(worlds), invert_normals)
+    expected = np.array([legacy_minecraft_matrix(world, invert_normals) for world in worlds])
+    assert np.allclose(batch, expected, atol=1e-9)
+
+def test_interpolate_transformations_slerps_rotation_and_blends_the_rest():
+    start = translation([0, 1, 0]) @ np.diag([1.0, 1.0, 0.5, 1.0]); end = translation([2, 1, 4]) @ axis_rotation(2, np.pi / 2) @ np.diag([3.0, 1.0, 0.5, 1.0])
+    blended = transforms.interpolate_transformations(start, end, [0.0, 0.5, 1.0])
+    assert np.allclose(blended[0], start) and np.allclose(blended[2], end)
+    assert np.allclose(blended[1], translation([1, 1, 2]) @ axis_rotation(2, np.pi / 4) @ np.diag([2.0, 1.0, 0.5, 1.0]))
+
+def reference_cube_uv(coord, normal):
+    x, y, z = np.abs(normal)
+    axis = (0 if x > z else 2) if x > y else (1 if y > z else 2)
+    return [(coord[1], coord[2]), (coord[0], coord[2]), (coord[0], coord[1])][axis]
+
+def test_cube_project_uvs_projects_on_the_dominant_axis_and_scales_to_bounds():
+    rng = np.random.default_rng(9); coords = rng.uniform(-2, 3, (40, 3)); normals = rng.normal(size=(40, 3))
+    normals[:6] = [[1, 1, 0], [0, 1, 1], [1, 0, 1], [1, 1, 1], [-1, 1, 0], [0, 0, -1]]
+    uvs = np.array([reference_cube_uv(coord, normal) for coord, normal in zip(coords, normals)])
+    expected = (uvs - uvs.min(axis=0)) / (uvs.max(axis=0) - uvs.min(axis=0))
+    assert np.allclose(transforms.cube_project_uvs(coords, normals), expected)
+    flat = transforms.cube_project_uvs([[0, 0, 0], [1, 0, 0]], [[0, 0, 1]] * 2)
+    assert np.allclose(flat, [[0, 0], [1, 0]]) and transforms.cube_project_uvs(np.zeros((0, 3)), np.zeros((0, 3))).shape == (0, 2)
+
+def test_cube_face_sides_name_the_faces_of_a_unit_block():
+    centers = [[0, 0, 0.5], [0, 0, -0.5], [0, -0.5, 0], [0, 0.5, 0], [0.5, 0, 0], [-0.5, 0, 0], [0.2, 0.1, 0]]
+    assert [transforms.CUBE_FACES[side] if side >= 0 else None for side in transforms.cube_face_sides(centers)] == ['top', 'bottom', 'front', 'back', 'east', 'west', None]
@@ -0,0 +1,51 @@
+import random
+
+import pytest
+
+from mca_blender_addon import generator, output
+from mca_blender_addon.scene import ExportSettings
+
+from mcfunction import Interpreter
+
+KEYFRAMES = "t:keyframes"
+
+@pytest.mark.parametrize("offsets", [[0], [0, 1], [0, 3, 4, 9, 10, 11, 30], list(range(0, 200, 3))])
+def test_dispatch_tree_runs_each_keyframe_in_its_window(offsets):
+    writer = output.DirectoryWriter("/nonexistent")
+    root = generator.write_dispatch_tree(writer, "data/t/function/tree", "t:tree", KEYFRAMES, offsets, "#s")
+    writer.write("data/t/function/dispatch.mcfunction", root)
+    length = offsets[-1] + 5
+
+    def dispatch(start, end):
+        machine = Interpreter(writer.files); machine.scores = {("#s", "mca_from"): start, ("#s", "mca_to"): end}
+        machine.run("t:dispatch")
+        return [int(call.rsplit('/', 1)[1]) for call in machine.calls]
+
+    played = [index for frame in range(length) for index in dispatch(frame - 1, frame)]
+    assert played == list(range(len(offsets)))
+    rng = random.Random(len(offsets))
+    for _ in range(50):
+        start = rng.randrange(-1, length); end = rng.randrange(start, length)
+        assert dispatch(start, end) == [i for i, offset in enumerate(offsets) if start < offset <= end]
+
+@pytest.mark.parametrize("ticks", [[1], [1, 2, 5], [3, 4, 10, 11, 12, 40], list(range(1, 120, 7))])
+def test_pause_tree_finds_the_pending_keyframe_for_every_played_tick(ticks):
+    settings = ExportSettings(namespace="t", scene_name="s"); end_frame = ticks[-1] + 3
+    scenes_path, main_path = generator.animation_paths(settings)
+    writer = output.DirectoryWriter("/nonexistent")
+    generator.generate_pause_functions(settings, writer, main_path, f"{scenes_path}/pause", "s", "t", [("blocks", ticks)], end_frame, generator.VERSION_MAP['1.21'])
+    holder = generator.pause_holder("s", "blocks"); offsets = [tick - ticks[0] for tick in ticks]
+    for played in range(end_frame - ticks[0] + 1):
+        machine = Interpreter(writer.files, gametime=1000 + played)
+        machine.scores = {(holder, "mca_start"): 1000, (holder, "mca_wait"): 0}
+        machine.run("t:animations/scenes/s/pause/pause")
+        pending = next((i for i, offset in enumerate(offsets) if offset > played), len(ticks))
+        end_offset = end_frame - ticks[0] + 1
+        assert machine.score(holder, "mca_next") == pending
+        assert machine.score(holder, "mca_wait") == (offsets + [end_offset])[pending] - played
+        assert f"schedule clear t:animations/scenes/s/keyframes/blocks/{pending if pending < len(ticks) else 0}" in machine.log
+
+        machine.calls = []
+        machine.scores[(holder, "mca_wait")] = 1
+        machine.run("t:animations/scenes/s/pause/blocks/wait")
+        assert machine.calls == [f"t:animations/scenes/s/keyframes/blocks/{pending if pending < len(ticks) else 0}"]